@@ -0,0 +1,167 @@
+"""
+Single-file dataset bundles
+
+A bundle holds the data, sample metadata, chemical annotation and ID column
+names of a dataset in one self-describing file:
+
+    - 8 magic bytes (BUNDLE_MAGIC)
+    - the length of the JSON header, as a little-endian uint64
+    - the JSON header, describing the layout of the file
+    - the sample metadata and the chemical annotation, as Parquet
+    - padding up to a multiple of BUNDLE_ALIGNMENT bytes
+    - the abundance matrix, as a raw C-ordered block
+
+The abundance matrix can thus be memory-mapped without parsing, so opening a
+bundle only costs reading the metadata, whatever the size of the data.
+
+The metadata tables are stored as Parquet, which requires pyarrow
+(`pip install metabotk[parquet]`).
+"""
+
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+from metabotk.utils import iter_blocks
+
+BUNDLE_MAGIC = b"MTBKBNDL"
+BUNDLE_VERSION = 1
+# alignment of the abundance matrix in the file, in bytes
+BUNDLE_ALIGNMENT = 64
+
+
+def _data_offset(header_length: int, header: dict) -> int:
+    end = (
+        len(BUNDLE_MAGIC)
+        + 8
+        + header_length
+        + header["sample_metadata_length"]
+        + header["chemical_annotation_length"]
+    )
+    return -(-end // BUNDLE_ALIGNMENT) * BUNDLE_ALIGNMENT
+
+
+def _to_parquet_bytes(data_frame: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    data_frame.to_parquet(buffer, index=True)
+    return buffer.getvalue()
+
+
+def write_bundle(
+    file_path: str | os.PathLike[str],
+    data: pd.DataFrame,
+    sample_metadata: pd.DataFrame,
+    chemical_annotation: pd.DataFrame,
+    sample_id_column: str,
+    metabolite_id_column: str,
+) -> None:
+    """
+    Write a dataset to a bundle file.
+
+    The data is written in blocks of samples, so it is never copied whole.
+
+    Args:
+        file_path: path of the bundle file
+        data: data with samples as rows and metabolites as columns, aligned to the metadata
+        sample_metadata: sample metadata indexed by sample id
+        chemical_annotation: chemical annotation indexed by metabolite id
+        sample_id_column: name of the sample id column
+        metabolite_id_column: name of the metabolite id column
+    """
+    dtypes = set(data.dtypes)
+    dtype = dtypes.pop() if len(dtypes) == 1 else np.dtype(np.float64)
+    if not np.issubdtype(dtype, np.floating):
+        dtype = np.dtype(np.float64)
+    sample_metadata_bytes = _to_parquet_bytes(sample_metadata)
+    chemical_annotation_bytes = _to_parquet_bytes(chemical_annotation)
+    header = {
+        "version": BUNDLE_VERSION,
+        "sample_id_column": sample_id_column,
+        "metabolite_id_column": metabolite_id_column,
+        "dtype": dtype.str,
+        "shape": list(data.shape),
+        "sample_metadata_length": len(sample_metadata_bytes),
+        "chemical_annotation_length": len(chemical_annotation_bytes),
+    }
+    header_bytes = json.dumps(header).encode()
+    data_offset = _data_offset(len(header_bytes), header)
+    with open(file_path, "wb") as handle:
+        handle.write(BUNDLE_MAGIC)
+        handle.write(np.uint64(len(header_bytes)).astype("<u8").tobytes())
+        handle.write(header_bytes)
+        handle.write(sample_metadata_bytes)
+        handle.write(chemical_annotation_bytes)
+        handle.write(b"\0" * (data_offset - handle.tell()))
+        for block, _ in iter_blocks(data.shape, axis=1):
+            values = data.iloc[block].to_numpy(dtype=dtype)
+            handle.write(np.ascontiguousarray(values).tobytes())
+
+
+def read_bundle_header(file_path: str | os.PathLike[str]) -> dict:
+    """
+    Read the header of a bundle file.
+
+    Args:
+        file_path: path of the bundle file
+
+    Returns:
+        Dict describing the bundle, including the "metadata_offset" of the metadata
+        tables and the "data_offset" of the abundance matrix
+
+    Raises:
+        ValueError: if the file is not a bundle or has an unsupported version
+    """
+    with open(file_path, "rb") as handle:
+        if handle.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+            raise ValueError(f"{file_path} is not a metabotk bundle")
+        header_length = int(np.frombuffer(handle.read(8), dtype="<u8")[0])
+        header = json.loads(handle.read(header_length))
+    if header["version"] > BUNDLE_VERSION:
+        raise ValueError(
+            f"Unsupported bundle version {header['version']}, "
+            f"the latest supported is {BUNDLE_VERSION}"
+        )
+    header["metadata_offset"] = len(BUNDLE_MAGIC) + 8 + header_length
+    header["data_offset"] = _data_offset(header_length, header)
+    return header
+
+
+def read_bundle(
+    file_path: str | os.PathLike[str], mmap_mode: str = "r"
+) -> dict[str, pd.DataFrame | np.ndarray | dict]:
+    """
+    Open a bundle file, reading its metadata and memory-mapping its data.
+
+    Args:
+        file_path: path of the bundle file
+        mmap_mode: "r" for read-only data (default), "r+" to write changes to the
+            data back to the file, "c" for copy-on-write
+
+    Returns:
+        Dict with the "sample_metadata" and "chemical_annotation" DataFrames, the
+        memory-mapped "data" array and the bundle "header"
+    """
+    header = read_bundle_header(file_path)
+    with open(file_path, "rb") as handle:
+        handle.seek(header["metadata_offset"])
+        sample_metadata = pd.read_parquet(
+            io.BytesIO(handle.read(header["sample_metadata_length"]))
+        )
+        chemical_annotation = pd.read_parquet(
+            io.BytesIO(handle.read(header["chemical_annotation_length"]))
+        )
+    data = np.memmap(
+        file_path,
+        dtype=np.dtype(header["dtype"]),
+        mode=mmap_mode,
+        offset=header["data_offset"],
+        shape=tuple(header["shape"]),
+    )
+    bundle_dict = {
+        "sample_metadata": sample_metadata,
+        "chemical_annotation": chemical_annotation,
+        "data": data,
+        "header": header,
+    }
+    return bundle_dict
@@ -0,0 +1,361 @@
+"""
+Caching of derived results
+
+Results can be kept in memory for the lifetime of a dataset (ResultCache), or on
+disk across processes (DiskCache), keyed by the content fingerprint of the dataset.
+Parsed input files can be kept on disk (ParseCache), keyed by their path, size and
+modification time.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable
+import hashlib
+import os
+import tempfile
+import dill
+import numpy as np
+import pandas as pd
+from metabotk.utils import create_directory
+
+# number of rows hashed at a time when fingerprinting large arrays
+HASH_BLOCK_ROWS = 4096
+# default maximum total size of a ParseCache directory, in bytes
+PARSE_CACHE_MAX_BYTES = 2**30
+# name of the cache directories created next to the parsed files
+SIDECAR_DIRECTORY = ".metabotk_cache"
+
+
+def _copy_result(result):
+    """
+    Copy the DataFrames, Series and arrays of a cached result, also within tuples.
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return result.copy()
+    if isinstance(result, tuple):
+        return tuple(_copy_result(item) for item in result)
+    return result
+
+
+class ResultCache:
+    """
+    Bounded in-memory cache of derived results, with least-recently-used eviction.
+
+    Results are keyed by operation name and parameters. DataFrames, Series and
+    arrays, alone or in tuples, are returned as copies, so that modifying a
+    result never changes the cache (with pandas copy-on-write, frames are only
+    copied when modified); other objects are returned as they are.
+
+    Attributes:
+        maxsize: maximum number of results kept in the cache
+    """
+
+    def __init__(self, maxsize: int = 16) -> None:
+        """
+        Initialize the class.
+
+        Parameters:
+            maxsize (int): maximum number of results kept in the cache
+        """
+        if maxsize < 0:
+            raise ValueError("Cache size must be a non-negative integer")
+        self.maxsize = maxsize
+        self._results: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def make_key(operation: str, params: dict) -> tuple:
+        return (operation, tuple(sorted(params.items())))
+
+    def get_or_compute(
+        self, operation: str, params: dict, compute: Callable[[], Any]
+    ) -> Any:
+        """
+        Return the cached result for an operation, computing and storing it if missing.
+
+        Parameters:
+            operation (str): name of the operation
+            params (dict): parameters of the operation; values must be hashable
+            compute (callable): function without arguments computing the result
+
+        Returns:
+            result of the operation
+        """
+        key = self.make_key(operation, params)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return _copy_result(self._results[key])
+        result = compute()
+        if self.maxsize > 0:
+            self._results[key] = result
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+            return _copy_result(result)
+        return result
+
+    def clear(self) -> None:
+        self._results.clear()
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._results
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+
+def _new_hasher():
+    return hashlib.blake2b(digest_size=16)
+
+
+def _hash_index(hasher, index: pd.Index) -> None:
+    hasher.update(repr(index.name).encode())
+    hasher.update(pd.util.hash_pandas_object(index, index=False).to_numpy().tobytes())
+
+
+def fingerprint_array(values: np.ndarray, index: pd.Index, columns: pd.Index) -> str:
+    """
+    Compute a content hash of a 2D array and its row and column labels.
+
+    The array is hashed incrementally in blocks of rows, so that no full-size
+    temporary is created for non-contiguous inputs.
+
+    Parameters:
+        values (np.ndarray): 2D array
+        index (pd.Index): row labels
+        columns (pd.Index): column labels
+
+    Returns:
+        str: hexadecimal digest, stable across processes
+    """
+    hasher = _new_hasher()
+    hasher.update(f"{values.dtype.str}{values.shape}".encode())
+    for start in range(0, values.shape[0], HASH_BLOCK_ROWS):
+        block = np.ascontiguousarray(values[start : start + HASH_BLOCK_ROWS])
+        hasher.update(memoryview(block).cast("B"))
+    _hash_index(hasher, index)
+    _hash_index(hasher, columns)
+    return hasher.hexdigest()
+
+
+def fingerprint_frame(data_frame: pd.DataFrame) -> str:
+    """
+    Compute a content hash of a DataFrame, including its index, column names and dtypes.
+
+    Parameters:
+        data_frame (pd.DataFrame): DataFrame to hash
+
+    Returns:
+        str: hexadecimal digest, stable across processes
+    """
+    hasher = _new_hasher()
+    hasher.update(
+        repr(list(zip(data_frame.columns, map(str, data_frame.dtypes)))).encode()
+    )
+    _hash_index(hasher, data_frame.index)
+    if len(data_frame.columns) > 0:
+        hashed_rows = pd.util.hash_pandas_object(data_frame, index=False)
+        hasher.update(hashed_rows.to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def combine_fingerprints(*parts: str) -> str:
+    hasher = _new_hasher()
+    for part in parts:
+        hasher.update(part.encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def is_integer_seed(random_state) -> bool:
+    """
+    Whether a random_state is an integer seed, making a randomized computation
+    reproducible and thus cacheable; None and RandomState instances are not.
+    """
+    return isinstance(random_state, (int, np.integer)) and not isinstance(
+        random_state, bool
+    )
+
+
+class DiskCache:
+    """
+    On-disk cache of expensive results, shared between processes.
+
+    Results are stored as pickle files in a directory, keyed by the operation
+    name, the fingerprint of the input dataset and the operation parameters.
+
+    Attributes:
+        directory: path of the cache directory
+    """
+
+    def __init__(self, directory: str | os.PathLike[str]) -> None:
+        self.directory = str(directory)
+
+    def path_for(self, operation: str, fingerprint: str, params: dict) -> str:
+        key = combine_fingerprints(operation, fingerprint, repr(sorted(params.items())))
+        return os.path.join(self.directory, f"{operation}-{key}.pickle")
+
+    def get_or_compute(
+        self,
+        operation: str,
+        fingerprint: str,
+        params: dict,
+        compute: Callable[[], Any],
+    ) -> Any:
+        """
+        Load the result of an operation from disk, computing and storing it if missing.
+
+        Parameters:
+            operation (str): name of the operation
+            fingerprint (str): content fingerprint of the input dataset
+            params (dict): parameters of the operation; their repr is part of the key
+            compute (callable): function without arguments computing the result
+
+        Returns:
+            result of the operation
+        """
+        path = self.path_for(operation, fingerprint, params)
+        if os.path.exists(path):
+            with open(path, "rb") as handle:
+                return dill.load(handle)
+        result = compute()
+        create_directory(self.directory)
+        # write to a temporary file first, so concurrent jobs never read partial files
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=self.directory, suffix=".tmp", delete=False
+        ) as handle:
+            dill.dump(result, handle)
+        os.replace(handle.name, path)
+        return result
+
+
+class ParseCache:
+    """
+    On-disk cache of parsed input files, shared between processes.
+
+    Parsed DataFrames are stored as pickle files, keyed by the absolute path,
+    size and modification time of the source file and by the reader options, so
+    that entries are invalidated as soon as the file changes. When the cache
+    directory grows over max_bytes, the least recently used entries are removed.
+
+    Attributes:
+        directory: path of the cache directory; if None, each file is cached in a
+            `.metabotk_cache` directory next to it
+        max_bytes: maximum total size of the entries of a cache directory
+    """
+
+    def __init__(
+        self,
+        directory: str | os.PathLike[str] | None = None,
+        max_bytes: int = PARSE_CACHE_MAX_BYTES,
+    ) -> None:
+        if max_bytes < 0:
+            raise ValueError("Cache size must be a non-negative integer")
+        self.directory = None if directory is None else str(directory)
+        self.max_bytes = max_bytes
+
+    def directory_for(self, file_path: str | os.PathLike[str]) -> str:
+        if self.directory is not None:
+            return self.directory
+        return os.path.join(
+            os.path.dirname(os.path.abspath(file_path)), SIDECAR_DIRECTORY
+        )
+
+    def path_for(self, file_path: str | os.PathLike[str], options: dict) -> str:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        key = combine_fingerprints(
+            file_path,
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+            repr(sorted(options.items())),
+            pd.__version__,
+        )
+        name = os.path.basename(file_path)
+        return os.path.join(self.directory_for(file_path), f"{name}-{key}.pickle")
+
+    def __contains__(self, item: tuple[str, dict]) -> bool:
+        file_path, options = item
+        return os.path.exists(self.path_for(file_path, options))
+
+    def get_or_parse(
+        self,
+        file_path: str | os.PathLike[str],
+        options: dict,
+        parse: Callable[[], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        Load a parsed file from the cache, parsing and storing it if missing or stale.
+
+        Parameters:
+            file_path (str): path of the source file
+            options (dict): reader options; their repr is part of the key
+            parse (callable): function without arguments parsing the file
+
+        Returns:
+            parsed DataFrame
+        """
+        path = self.path_for(file_path, options)
+        try:
+            with open(path, "rb") as handle:
+                result = dill.load(handle)
+            # mark the entry as recently used
+            os.utime(path)
+            return result
+        except FileNotFoundError:
+            pass
+        result = parse()
+        directory = os.path.dirname(path)
+        create_directory(directory)
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, suffix=".tmp", delete=False
+        ) as handle:
+            dill.dump(result, handle)
+        os.replace(handle.name, path)
+        self.evict(directory, keep=path)
+        return result
+
+    def evict(self, directory: str, keep: str | None = None) -> None:
+        """
+        Remove the least recently used entries of a cache directory until it fits in max_bytes.
+
+        Parameters:
+            directory (str): path of the cache directory
+            keep (str): path of an entry that is never removed
+        """
+        entries = []
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".pickle") and entry.path != keep:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if keep is not None and os.path.exists(keep):
+            total += os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def as_parse_cache(cache_dir) -> ParseCache | None:
+    """
+    Get the ParseCache of a cache_dir option.
+
+    Parameters:
+        cache_dir: None or False to disable caching, True to cache each file next
+            to it, a directory path, or a ParseCache instance, returned unchanged
+
+    Returns:
+        ParseCache instance, or None if caching is disabled
+    """
+    if cache_dir is None or cache_dir is False:
+        return None
+    if isinstance(cache_dir, ParseCache):
+        return cache_dir
+    if cache_dir is True:
+        return ParseCache()
+    return ParseCache(cache_dir)
@@ -0,0 +1,202 @@
+"""
+Export of datasets to embedded DuckDB database files, and SQL queries on them
+
+A database holds three tables:
+
+    - "samples": the sample metadata, keyed by the sample id column
+    - "metabolites": the chemical annotation, keyed by the metabolite id column
+    - "data": the abundances, either in long format (one row per sample,
+      metabolite and non-missing value, in a "value" column) or in wide format
+      (one row per sample and one column per metabolite)
+
+and a "metabotk" table with the ID column names and the layout of the data.
+Samples and metabolites can then be selected with SQL queries joining any of
+the tables, and only the selected data is read back.
+
+DuckDB is an optional dependency, imported when a database is used.
+"""
+
+import os
+from typing import Literal
+import numpy as np
+import pandas as pd
+from metabotk.parse_and_setup import coerce_ids
+from metabotk.utils import iter_blocks
+
+DATABASE_LAYOUTS = ("long", "wide")
+
+
+def _import_duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError(
+            "Databases require the duckdb package, install it with `pip install metabotk[db]`"
+        ) from None
+    return duckdb
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Quote a table or column name for SQL queries.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def write_database(
+    file_path: str | os.PathLike[str],
+    data: pd.DataFrame,
+    sample_metadata: pd.DataFrame,
+    chemical_annotation: pd.DataFrame,
+    sample_id_column: str,
+    metabolite_id_column: str,
+    layout: Literal["long", "wide"] = "long",
+) -> None:
+    """
+    Write a dataset to a DuckDB database file, replacing its dataset tables.
+
+    The data is inserted in blocks of samples; in long format, missing values
+    are not stored.
+
+    Args:
+        file_path: path of the database file
+        data: data with samples as rows and metabolites as columns, aligned to the metadata
+        sample_metadata: sample metadata indexed by sample id
+        chemical_annotation: chemical annotation indexed by metabolite id
+        sample_id_column: name of the sample id column
+        metabolite_id_column: name of the metabolite id column
+        layout: "long" (default) or "wide" format of the data table
+
+    Raises:
+        ValueError: if the layout is not recognized
+    """
+    if layout not in DATABASE_LAYOUTS:
+        raise ValueError(
+            f"Unknown layout '{layout}', choose one of {list(DATABASE_LAYOUTS)}"
+        )
+    duckdb = _import_duckdb()
+    samples = sample_metadata.rename_axis(sample_id_column).reset_index()
+    metabolites = chemical_annotation.rename_axis(metabolite_id_column).reset_index()
+    info = pd.DataFrame(
+        {
+            "key": ["sample_id_column", "metabolite_id_column", "layout"],
+            "value": [sample_id_column, metabolite_id_column, layout],
+        }
+    )
+    metabolite_ids = np.asarray(data.columns.astype(str), dtype=object)
+    with duckdb.connect(str(file_path)) as connection:
+        for name, table in [
+            ("metabotk", info),
+            ("samples", samples),
+            ("metabolites", metabolites),
+        ]:
+            connection.register("frame", table)
+            connection.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM frame")
+            connection.unregister("frame")
+        connection.execute("DROP TABLE IF EXISTS data")
+        for block, _ in iter_blocks(data.shape, axis=1):
+            values = data.iloc[block]
+            sample_ids = np.asarray(values.index.astype(str), dtype=object)
+            if layout == "long":
+                values = values.to_numpy(dtype=np.float64)
+                rows, cols = np.nonzero(~np.isnan(values))
+                table = pd.DataFrame(
+                    {
+                        sample_id_column: sample_ids[rows],
+                        metabolite_id_column: metabolite_ids[cols],
+                        "value": values[rows, cols],
+                    }
+                )
+            else:
+                table = values.set_axis(metabolite_ids, axis=1)
+                table.insert(0, sample_id_column, sample_ids)
+            connection.register("frame", table)
+            if block.start == 0:
+                connection.execute("CREATE TABLE data AS SELECT * FROM frame")
+            else:
+                connection.execute("INSERT INTO data SELECT * FROM frame")
+            connection.unregister("frame")
+
+
+def query_database(
+    file_path: str | os.PathLike[str],
+    samples: str | None = None,
+    metabolites: str | None = None,
+) -> dict:
+    """
+    Read the samples and metabolites selected by SQL queries from a database file.
+
+    Args:
+        file_path: path of the database file
+        samples: SQL query whose first column holds the ids of the samples to read,
+            e.g. "SELECT PARENT_SAMPLE_NAME FROM samples WHERE sex = 'F'"; all
+            samples if None
+        metabolites: SQL query whose first column holds the ids of the metabolites
+            to read, e.g. "SELECT CHEM_ID FROM metabolites WHERE SUPER_PATHWAY = 'Lipid'";
+            all metabolites if None
+
+    Returns:
+        Dict with the "data", "sample_metadata" and "chemical_annotation" of the
+        selection, indexed by their ids, and the "sample_id_column" and
+        "metabolite_id_column"
+    """
+    duckdb = _import_duckdb()
+    with duckdb.connect(str(file_path), read_only=True) as connection:
+        info = dict(connection.execute("SELECT key, value FROM metabotk").fetchall())
+        sample_id = quote_identifier(info["sample_id_column"])
+        metabolite_id = quote_identifier(info["metabolite_id_column"])
+        tables = {}
+        for name, id_column, query in [
+            ("samples", sample_id, samples),
+            ("metabolites", metabolite_id, metabolites),
+        ]:
+            selection = ""
+            if query is not None:
+                ids = connection.execute(query).df().iloc[:, 0].astype(str)
+                connection.register(f"selected_{name}", pd.DataFrame({"id": ids}))
+                selection = (
+                    f"WHERE CAST({id_column} AS VARCHAR) IN "
+                    f"(SELECT id FROM selected_{name})"
+                )
+            tables[name] = connection.execute(f"SELECT * FROM {name} {selection}").df()
+        sample_metadata = tables["samples"].set_index(info["sample_id_column"])
+        chemical_annotation = tables["metabolites"].set_index(
+            info["metabolite_id_column"]
+        )
+        sample_metadata.index = coerce_ids(sample_metadata.index)
+        chemical_annotation.index = coerce_ids(chemical_annotation.index)
+        sample_ids = sample_metadata.index
+        metabolite_ids = chemical_annotation.index.rename(None)
+        connection.register("data_samples", pd.DataFrame({"id": sample_ids}))
+        if info["layout"] == "long":
+            connection.register(
+                "data_metabolites", pd.DataFrame({"id": metabolite_ids})
+            )
+            long_data = connection.execute(
+                f"SELECT {sample_id}, {metabolite_id}, value FROM data "
+                f"WHERE {sample_id} IN (SELECT id FROM data_samples) "
+                f"AND {metabolite_id} IN (SELECT id FROM data_metabolites)"
+            ).df()
+            # pivot the long table into a preallocated block
+            values = np.full((len(sample_ids), len(metabolite_ids)), np.nan)
+            rows = sample_ids.get_indexer(long_data.iloc[:, 0])
+            cols = metabolite_ids.get_indexer(long_data.iloc[:, 1])
+            values[rows, cols] = long_data["value"].to_numpy()
+            data = pd.DataFrame(values, index=sample_ids, columns=metabolite_ids)
+        else:
+            columns = ", ".join(quote_identifier(i) for i in metabolite_ids)
+            data = connection.execute(
+                f"SELECT {sample_id}, {columns} FROM data "
+                f"WHERE {sample_id} IN (SELECT id FROM data_samples)"
+            ).df()
+            # samples without a row in the data table are missing, as in long format
+            data = data.set_index(info["sample_id_column"]).reindex(sample_ids)
+            data = data.set_axis(metabolite_ids, axis=1)
+    database_dict = {
+        "data": data.rename_axis(info["sample_id_column"]),
+        "sample_metadata": sample_metadata,
+        "chemical_annotation": chemical_annotation,
+        "sample_id_column": info["sample_id_column"],
+        "metabolite_id_column": info["metabolite_id_column"],
+    }
+    return database_dict
@@ -1,10 +1,27 @@
+import asyncio
+import numpy as np
 import pandas as pd
+import openpyxl
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal
 from metabotk.parse_and_setup import (
     read_excel,
-    read_prefix,
     dataset_from_prefix,
-    read_tables,
+    setup_tables,
+    Selection,
+    setup_data,
+    setup_sample_metadata,
+    setup_chemical_annotation,
+    coerce_ids,
+    split_prefix_format,
 )
+from metabotk.storage import StorageMode, FloatDtype, MemmapStorage
+from metabotk.utils import parse_input, iter_input, iter_blocks
+from metabotk.bundle import write_bundle, read_bundle
+from metabotk.store import append_to_store, read_store
+from metabotk.providers import MetabolonCDT
+from metabotk.database import write_database, query_database
 
 """
 Setup dataset from file(s)
@@ -23,17 +40,117 @@ class DatasetIO:
         data_sheet: str = "Data",
         sample_id_column: str = "sample",
         metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        samples: Selection | None = None,
+        metabolites: Selection | None = None,
+        cache_dir=None,
     ):
+        """
+        Load a dataset from an Excel workbook with one sheet per table.
+
+        Args:
+            file_path: path of the workbook
+            sample_metadata_sheet: name of the sample metadata sheet
+            chemical_annotation_sheet: name of the chemical annotation sheet
+            data_sheet: name of the data sheet
+            sample_id_column: name of the sample id column
+            metabolite_id_column: name of the metabolite id column
+            storage: storage mode of the data, "frame" (default) or "array"
+            dtype: "float32" to store the data in single precision, "float64" for double
+                precision, None (default) to keep the input dtypes
+            categorical: store low-cardinality string metadata columns as categoricals
+            samples: IDs of the samples to load, or function taking the sample metadata
+                and returning a boolean mask of the samples to load; all if None
+            metabolites: IDs of the metabolites to load, or function taking the chemical
+                annotation and returning a boolean mask of the metabolites to load; all
+                if None. Unlike text and Parquet files, the whole data sheet is parsed
+                before the selected rows and columns are kept
+            cache_dir: on-disk cache of the parsed sheets, as in `parse_input`; no caching if None
+
+        Returns:
+            MetabolomicDataset instance
+        """
         parsed = read_excel(
-            file_path, sample_metadata_sheet, chemical_annotation_sheet, data_sheet
+            file_path,
+            sample_metadata_sheet,
+            chemical_annotation_sheet,
+            data_sheet,
+            cache_dir=cache_dir,
         )
-        return self.dataset._setup(
-            data=parsed["data"],
-            sample_metadata=parsed["sample_metadata"],
-            chemical_annotation=parsed["chemical_annotation"],
-            sample_id_column=sample_id_column,
-            metabolite_id_column=metabolite_id_column,
+        tables = setup_tables(
+            parsed["sample_metadata"],
+            parsed["chemical_annotation"],
+            parsed["data"],
+            sample_id_column,
+            metabolite_id_column,
+            categorical=categorical,
+            max_workers=1,
+            samples=samples,
+            metabolites=metabolites,
+        )
+        return self.dataset._from_tables(
+            tables, sample_id_column, metabolite_id_column, storage, dtype
+        )
+
+    def from_metabolon_cdt(
+        self,
+        file_path: str,
+        data_layer: str | None = None,
+        sample_id_column: str = "PARENT_SAMPLE_NAME",
+        metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        cache_dir=None,
+    ):
+        """
+        Load a Metabolon Client Data Table (CDT) workbook, with all its data sheets as layers.
+
+        The sample metadata and chemical annotation are parsed once, together
+        with the data sheet of data_layer, which becomes the data of the dataset.
+        The other data sheets of the workbook are registered as lazy layers
+        ("peak_area", "batch_normalized", "batch_normalized_imputed",
+        "log_transformed"), which are only parsed on first access, e.g.
+        `dataset.layers["batch_normalized"]`.
+
+        Args:
+            file_path: path of the CDT workbook
+            data_layer: layer of the data sheet used as data; the first available of
+                "peak_area", "batch_normalized", "batch_normalized_imputed" and
+                "log_transformed" if None
+            sample_id_column: name of the sample id column
+            metabolite_id_column: name of the metabolite id column
+            storage: storage mode of the data and layers, "frame" (default) or "array"
+            dtype: dtype policy of the data and layers, as in `from_tables`
+            categorical: store low-cardinality string metadata columns as categoricals
+            cache_dir: on-disk cache of the parsed sheets, as in `parse_input`; no caching if None
+
+        Returns:
+            MetabolomicDataset instance
+        """
+        cdt = MetabolonCDT(file_path, cache_dir=cache_dir)
+        data_layer = cdt.layers[0] if data_layer is None else data_layer
+        parsed = cdt.read_tables(data_layer)
+        tables = setup_tables(
+            parsed["sample_metadata"],
+            parsed["chemical_annotation"],
+            parsed["data"],
+            sample_id_column,
+            metabolite_id_column,
+            categorical=categorical,
+            max_workers=1,
+        )
+        dataset = self.dataset._from_tables(
+            tables, sample_id_column, metabolite_id_column, storage, dtype
         )
+        for layer in cdt.layers:
+            if layer != data_layer:
+                dataset.layers[layer] = lambda layer=layer: cdt.read_layer(
+                    layer, sample_id_column
+                )
+        return dataset
 
     def from_tables(
         self,
@@ -42,14 +159,28 @@ class DatasetIO:
         data,
         sample_id_column: str = "sample",
         metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        max_workers: int = 3,
+        samples: Selection | None = None,
+        metabolites: Selection | None = None,
+        cache_dir=None,
     ):
-        parsed = read_tables(sample_metadata, chemical_annotation, data)
-        return self.dataset._setup(
-            data=parsed["data"],
-            sample_metadata=parsed["sample_metadata"],
-            chemical_annotation=parsed["chemical_annotation"],
-            sample_id_column=sample_id_column,
-            metabolite_id_column=metabolite_id_column,
+        tables = setup_tables(
+            sample_metadata,
+            chemical_annotation,
+            data,
+            sample_id_column,
+            metabolite_id_column,
+            categorical=categorical,
+            max_workers=max_workers,
+            samples=samples,
+            metabolites=metabolites,
+            cache_dir=cache_dir,
+        )
+        return self.dataset._from_tables(
+            tables, sample_id_column, metabolite_id_column, storage, dtype
         )
 
     def from_prefix(
@@ -57,46 +188,538 @@ class DatasetIO:
         prefix: str,
         sample_id_column: str = "sample",
         metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        format: Literal["tsv", "parquet"] | None = None,
+        max_workers: int = 3,
+        samples: Selection | None = None,
+        metabolites: Selection | None = None,
+        cache_dir=None,
     ):
         """
+        Load a dataset from the files sharing a prefix.
+
+        The three files are parsed concurrently, and the metadata tables are set up
+        while the data file is still being parsed.
 
         Args:
             prefix:
             sample_id_column:
             metabolite_id_column:
+            storage: storage mode of the data, "frame" (default) or "array"
+            dtype: "float32" to store the data in single precision, "float64" for double
+                precision, None (default) to keep the input dtypes
+            categorical: store low-cardinality string metadata columns as categoricals
+            format: "tsv" or "parquet"; if None, it is chosen from the extension of the
+                prefix (e.g. "dataset.parquet"), defaulting to "tsv"
+            max_workers: number of files processed at the same time; 1 processes them sequentially
+            samples: IDs of the samples to load, or function taking the sample metadata
+                and returning a boolean mask of the samples to load; all if None
+            metabolites: IDs of the metabolites to load, or function taking the chemical
+                annotation and returning a boolean mask of the metabolites to load (e.g.
+                `lambda annotation: annotation["SUPER_PATHWAY"] == "Lipid"`); all if None.
+                Only the selected columns and rows of the data file are kept while parsing
+            cache_dir: directory of an on-disk cache of the parsed files, reused until the
+                files change; True caches each file next to it. No caching if None
 
         Returns:
 
         """
-        parsed = read_prefix(prefix)
-        return self.dataset._setup(
-            data=parsed["data"],
-            sample_metadata=parsed["sample_metadata"],
-            chemical_annotation=parsed["chemical_annotation"],
+        prefix_dict = dataset_from_prefix(prefix, format)
+        return self.from_tables(
+            sample_metadata=prefix_dict["sample_metadata"],
+            chemical_annotation=prefix_dict["chemical_annotation"],
+            data=prefix_dict["data"],
             sample_id_column=sample_id_column,
             metabolite_id_column=metabolite_id_column,
+            storage=storage,
+            dtype=dtype,
+            categorical=categorical,
+            max_workers=max_workers,
+            samples=samples,
+            metabolites=metabolites,
+            cache_dir=cache_dir,
         )
 
-    """
-    Save dataset to file(s)
-    """
+    async def afrom_prefix(
+        self,
+        prefix: str,
+        sample_id_column: str = "sample",
+        metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        format: Literal["tsv", "parquet"] | None = None,
+        max_workers: int = 3,
+        samples: Selection | None = None,
+        metabolites: Selection | None = None,
+        cache_dir=None,
+    ):
+        """
+        Asynchronous version of `from_prefix`, loading the dataset in a worker thread
+        so that the event loop is not blocked; several datasets can be loaded at once
+        with `asyncio.gather`.
 
-    def save_prefix(self, prefix: str):
+        Args:
+            see `from_prefix`
+
+        Returns:
+            MetabolomicDataset instance
         """
+        return await asyncio.to_thread(
+            self.from_prefix,
+            prefix,
+            sample_id_column=sample_id_column,
+            metabolite_id_column=metabolite_id_column,
+            storage=storage,
+            dtype=dtype,
+            categorical=categorical,
+            format=format,
+            max_workers=max_workers,
+            samples=samples,
+            metabolites=metabolites,
+            cache_dir=cache_dir,
+        )
+
+    def iter_tables(
+        self,
+        sample_metadata,
+        chemical_annotation,
+        data,
+        chunk_size: int = 1000,
+        sample_id_column: str = "sample",
+        metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+    ):
+        """
+        Stream a dataset in chunks of samples, reading only one chunk of the data at a time.
+
+        The metadata tables are read and set up once; each chunk holds the sample
+        metadata of its samples and the whole chemical annotation. Chunks can be
+        passed to the chunk-wise functions, such as
+        `statistics_handler.accumulate_statistics`,
+        `missing_handler.count_missing_in_chunks`,
+        `outliers_handler.iter_outliers_matrices` and `scaling.iter_tsa`, to process
+        data larger than memory in one pass.
 
         Args:
-            prefix:
+            sample_metadata: sample metadata, as a DataFrame or a file path
+            chemical_annotation: chemical annotation, as a DataFrame or a file path
+            data: data, as a DataFrame or a file path
+            chunk_size: maximum number of samples per chunk
+            sample_id_column: name of the sample id column
+            metabolite_id_column: name of the metabolite id column
+            storage: storage mode of the data of each chunk, "frame" (default) or "array"
+            dtype: dtype policy of the data of each chunk, as in `from_tables`
+            categorical: store low-cardinality string metadata columns as categoricals
+
+        Yields:
+            MetabolomicDataset instances of at most chunk_size samples, in file order
+        """
+        categorical_report = {"sample_metadata": {}, "chemical_annotation": {}}
+        sample_metadata = setup_sample_metadata(
+            parse_input(sample_metadata, str_columns=[sample_id_column]),
+            sample_id_column,
+            categorical=categorical,
+            report=lambda saved: categorical_report.update(sample_metadata=saved),
+        )
+        chemical_annotation = setup_chemical_annotation(
+            parse_input(chemical_annotation, str_columns=[metabolite_id_column]),
+            metabolite_id_column,
+            categorical=categorical,
+            report=lambda saved: categorical_report.update(chemical_annotation=saved),
+        )
+        chemical_annotation.index = coerce_ids(chemical_annotation.index)
+        for chunk in iter_input(
+            data, sample_id_column, chunk_size, usecols=chemical_annotation.index
+        ):
+            tables = {
+                "data": setup_data(chunk, sample_id_column),
+                "sample_metadata": sample_metadata,
+                "chemical_annotation": chemical_annotation,
+                "categorical_report": categorical_report,
+            }
+            yield self.dataset._from_tables(
+                tables, sample_id_column, metabolite_id_column, storage, dtype
+            )
+
+    def iter_prefix(
+        self,
+        prefix: str,
+        chunk_size: int = 1000,
+        sample_id_column: str = "sample",
+        metabolite_id_column: str = "CHEM_ID",
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
+        format: Literal["tsv", "parquet"] | None = None,
+    ):
+        """
+        Stream the dataset files sharing a prefix in chunks of samples, as in `iter_tables`.
+
+        Args:
+            prefix: prefix valid for all three dataset files
+            chunk_size: maximum number of samples per chunk
+            sample_id_column: name of the sample id column
+            metabolite_id_column: name of the metabolite id column
+            storage: storage mode of the data of each chunk, "frame" (default) or "array"
+            dtype: dtype policy of the data of each chunk, as in `from_prefix`
+            categorical: store low-cardinality string metadata columns as categoricals
+            format: "tsv" or "parquet"; if None, it is chosen from the extension of the
+                prefix, defaulting to "tsv"
+
+        Yields:
+            MetabolomicDataset instances of at most chunk_size samples, in file order
+        """
+        prefix_dict = dataset_from_prefix(prefix, format)
+        yield from self.iter_tables(
+            sample_metadata=prefix_dict["sample_metadata"],
+            chemical_annotation=prefix_dict["chemical_annotation"],
+            data=prefix_dict["data"],
+            chunk_size=chunk_size,
+            sample_id_column=sample_id_column,
+            metabolite_id_column=metabolite_id_column,
+            storage=storage,
+            dtype=dtype,
+            categorical=categorical,
+        )
+
+    def from_memmap(
+        self,
+        prefix: str,
+        sample_id_column: str = "sample",
+        metabolite_id_column: str = "CHEM_ID",
+        mmap_mode: Literal["r", "r+", "c"] = "r",
+    ):
+        """
+        Open a dataset saved with `save_memmap`, memory-mapping its data.
+
+        The sample metadata and chemical annotation are read in memory, while
+        the abundance matrix stays on disk and is only read when accessed.
+        Statistics, missing value and outlier computations process it in blocks.
+
+        Args:
+            prefix: prefix of the dataset files
+            sample_id_column: name of the sample id column
+            metabolite_id_column: name of the metabolite id column
+            mmap_mode: "r" for read-only data (default), "r+" to write changes to
+                the data back to the file, "c" for copy-on-write
+
+        Returns:
+            dataset with "memmap" storage
+        """
+        prefix_dict = dataset_from_prefix(prefix)
+        sample_metadata = setup_sample_metadata(
+            parse_input(prefix_dict["sample_metadata"], str_columns=[sample_id_column]),
+            sample_id_column,
+        )
+        sample_metadata.index = coerce_ids(sample_metadata.index)
+        chemical_annotation = setup_chemical_annotation(
+            parse_input(
+                prefix_dict["chemical_annotation"], str_columns=[metabolite_id_column]
+            ),
+            metabolite_id_column,
+        )
+        chemical_annotation.index = coerce_ids(chemical_annotation.index)
+        storage = MemmapStorage.open(
+            f"{prefix}.npy",
+            index=sample_metadata.index,
+            columns=chemical_annotation.index.rename(None),
+            mmap_mode=mmap_mode,
+        )
+        return type(self.dataset)(
+            data=storage,
+            sample_metadata=sample_metadata,
+            chemical_annotation=chemical_annotation,
+            sample_id_column=sample_id_column,
+            metabolite_id_column=metabolite_id_column,
+            storage="memmap",
+        )
+
+    def from_bundle(
+        self,
+        file_path: str,
+        samples: list[str] | None = None,
+        metabolites: list[str] | None = None,
+        mmap_mode: Literal["r", "r+", "c"] = "r",
+    ):
+        """
+        Open a dataset saved with `save_bundle`.
+
+        Only the metadata is read; the data is memory-mapped from the bundle and
+        read when accessed. If samples or metabolites are given, the dataset is a
+        view over them, and the data of the other samples and metabolites is
+        never read.
+
+        Args:
+            file_path: path of the bundle file
+            samples: ids of the samples to open; all samples if None
+            metabolites: ids of the metabolites to open; all metabolites if None
+            mmap_mode: "r" for read-only data (default), "r+" to write changes to
+                the data back to the file, "c" for copy-on-write
+
+        Returns:
+            dataset with "memmap" storage
+        """
+        bundle = read_bundle(file_path, mmap_mode=mmap_mode)
+        sample_metadata = bundle["sample_metadata"]
+        chemical_annotation = bundle["chemical_annotation"]
+        storage = MemmapStorage(
+            bundle["data"],
+            index=sample_metadata.index,
+            columns=chemical_annotation.index.rename(None),
+            path=str(file_path),
+        )
+        dataset = type(self.dataset)(
+            data=storage,
+            sample_metadata=sample_metadata,
+            chemical_annotation=chemical_annotation,
+            sample_id_column=bundle["header"]["sample_id_column"],
+            metabolite_id_column=bundle["header"]["metabolite_id_column"],
+            storage="memmap",
+        )
+        if samples is None and metabolites is None:
+            return dataset
+        return dataset._take(
+            rows=None if samples is None else dataset.sample_positions(samples),
+            cols=(
+                None
+                if metabolites is None
+                else dataset.metabolite_positions(metabolites)
+            ),
+            view=True,
+        )
+
+    def from_store(self, directory: str, storage: StorageMode = "frame"):
+        """
+        Load a dataset from a store built with `append_to_store`.
+
+        The chunks of the store are gathered in a single block; metabolites added
+        to the store after a chunk was written are missing values in its samples.
+
+        Args:
+            directory: path of the store
+            storage: storage mode of the data, "frame" (default) or "array"
+
+        Returns:
+            MetabolomicDataset instance
+        """
+        store = read_store(directory)
+        chemical_annotation = store["chemical_annotation"]
+        data = pd.DataFrame(
+            store["data"],
+            index=store["sample_metadata"].index,
+            columns=chemical_annotation.index.rename(None),
+            copy=False,
+        )
+        return type(self.dataset)(
+            data=data,
+            sample_metadata=store["sample_metadata"],
+            chemical_annotation=chemical_annotation,
+            sample_id_column=store["manifest"]["sample_id_column"],
+            metabolite_id_column=store["manifest"]["metabolite_id_column"],
+            storage=storage,
+        )
+
+    def from_database(
+        self,
+        file_path: str,
+        samples: str | None = None,
+        metabolites: str | None = None,
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+    ):
+        """
+        Load the samples and metabolites selected by SQL queries from a database
+        saved with `save_database`.
+
+        The queries can join the "samples", "metabolites" and "data" tables, so
+        samples and metabolites can be selected on metadata and abundances at
+        once; they run in DuckDB, and only the selected data is read. For
+        example, samples with a high abundance of some lipid, on a long-format
+        database:
+
+            SELECT DISTINCT PARENT_SAMPLE_NAME FROM data JOIN metabolites USING (CHEM_ID)
+            WHERE SUPER_PATHWAY = 'Lipid' AND value > 100
+
+        Args:
+            file_path: path of the database file
+            samples: SQL query whose first column holds the ids of the samples to load;
+                all samples if None
+            metabolites: SQL query whose first column holds the ids of the metabolites
+                to load; all metabolites if None
+            storage: storage mode of the data, "frame" (default) or "array"
+            dtype: dtype policy of the data, as in `from_tables`
+
+        Returns:
+            MetabolomicDataset instance
+
+        Raises:
+            ImportError: if duckdb is not installed
+        """
+        selection = query_database(file_path, samples, metabolites)
+        return type(self.dataset)(
+            data=selection["data"],
+            sample_metadata=selection["sample_metadata"],
+            chemical_annotation=selection["chemical_annotation"],
+            sample_id_column=selection["sample_id_column"],
+            metabolite_id_column=selection["metabolite_id_column"],
+            storage=storage,
+            dtype=dtype,
+        )
+
+    def save_database(
+        self, file_path: str, layout: Literal["long", "wide"] = "long"
+    ) -> None:
+        """
+        Save the dataset to an embedded DuckDB database file, which can be queried
+        with `from_database`.
+
+        The sample metadata and chemical annotation are stored as the "samples"
+        and "metabolites" tables, and the data as the "data" table, joinable on
+        the ID columns.
+
+        Args:
+            file_path: path of the database file
+            layout: "long" (default) to store one row per sample, metabolite and
+                non-missing value, or "wide" to store one row per sample and one
+                column per metabolite
+
+        Raises:
+            ImportError: if duckdb is not installed
+        """
+        write_database(
+            file_path,
+            data=self.dataset.data,
+            sample_metadata=self.dataset.sample_metadata,
+            chemical_annotation=self.dataset.chemical_annotation,
+            sample_id_column=self.dataset._sample_id_column,
+            metabolite_id_column=self.dataset._metabolite_id_column,
+            layout=layout,
+        )
+        print(f"Saved to {file_path}")
+
+    def append_to_store(self, directory: str) -> dict:
+        """
+        Append the samples of the dataset to a store, creating it if it does not exist.
+
+        The samples are written as a new chunk of the store, without rewriting the
+        data already in it: adding a batch costs only the size of the batch.
+        Metabolites of the dataset that are not yet in the store are added to it,
+        and metabolites of the store that are not in the dataset are stored as
+        missing values. The store can be loaded with `from_store`.
+
+        Args:
+            directory: path of the store
+
+        Returns:
+            Dict with the "chunk" name, the number of "samples" added and the list of
+            "new_metabolites"
+
+        Raises:
+            ValueError: if some samples of the dataset are already in the store, or
+                if the store uses other ID columns
+        """
+        report = append_to_store(
+            directory,
+            data=self.dataset.data,
+            sample_metadata=self.dataset.sample_metadata,
+            chemical_annotation=self.dataset.chemical_annotation,
+            sample_id_column=self.dataset._sample_id_column,
+            metabolite_id_column=self.dataset._metabolite_id_column,
+        )
+        print(
+            f"Appended {report['samples']} samples and "
+            f"{len(report['new_metabolites'])} new metabolites to {directory}"
+        )
+        return report
+
+    def save_bundle(self, file_path: str):
+        """
+        Save the dataset to a single bundle file, which can be opened with `from_bundle`.
+
+        The bundle holds the data, the sample metadata, the chemical annotation
+        and the ID column names. The data is stored as a raw block with the dtype
+        of the dataset, so that it can be memory-mapped; the metadata tables are
+        stored as Parquet, which requires pyarrow (`pip install metabotk[parquet]`).
+
+        Args:
+            file_path: path of the bundle file
+        """
+        write_bundle(
+            file_path,
+            data=self.dataset.data,
+            sample_metadata=self.dataset.sample_metadata,
+            chemical_annotation=self.dataset.chemical_annotation,
+            sample_id_column=self.dataset._sample_id_column,
+            metabolite_id_column=self.dataset._metabolite_id_column,
+        )
+        print(f"Saved to {file_path}")
+
+    def save_memmap(self, prefix: str):
+        """
+        Save the dataset for memory-mapped access with `from_memmap`.
+
+        The sample metadata and chemical annotation are saved as in
+        `save_prefix`, and the data as a .npy file with the dtype of the dataset
+        (float64 if it has no dtype policy), written in blocks of samples.
+
+        Args:
+            prefix: prefix of the dataset files
         """
         prefix_dict = dataset_from_prefix(prefix)
-        self.dataset.data.to_csv(prefix_dict["data"], sep="\t", index=True)
         self.dataset.sample_metadata.to_csv(
             prefix_dict["sample_metadata"], sep="\t", index=True
         )
         self.dataset.chemical_annotation.to_csv(
             prefix_dict["chemical_annotation"], sep="\t", index=True
         )
+        data = self.dataset.data
+        dtype = np.float64 if self.dataset.dtype is None else self.dataset.dtype
+        values = np.lib.format.open_memmap(
+            f"{prefix}.npy", mode="w+", dtype=dtype, shape=data.shape
+        )
+        for block, index in iter_blocks(data.shape, axis=1):
+            values[index] = data.iloc[block].to_numpy(dtype=dtype)
+        values.flush()
+        del values
         print(f"Saved to {prefix}")
 
+    def save_prefix(self, prefix: str, format: Literal["tsv", "parquet"] | None = None):
+        """
+
+        Args:
+            prefix:
+            format: "tsv" (tab-separated text) or "parquet" (binary, keeping dtypes,
+                categoricals and index names; requires pyarrow, from the parquet
+                extra). If None, it is chosen from the extension of the prefix
+                (e.g. "dataset.parquet"), defaulting
+                to "tsv"
+        """
+        prefix, format = split_prefix_format(prefix, format)
+        prefix_dict = dataset_from_prefix(prefix, format)
+        tables = {
+            "data": self.dataset.data,
+            "sample_metadata": self.dataset.sample_metadata,
+            "chemical_annotation": self.dataset.chemical_annotation,
+        }
+        for name, table in tables.items():
+            if format == "parquet":
+                table.to_parquet(prefix_dict[name], index=True)
+            else:
+                table.to_csv(prefix_dict[name], sep="\t", index=True)
+        print(f"Saved to {prefix}")
+
+    def _excel_sheets(self, data_sheet: str = "Data") -> dict[str, pd.DataFrame]:
+        return {
+            "Chemical Annotation": self.dataset.chemical_annotation,
+            "Sample Meta Data": self.dataset.sample_metadata,
+            data_sheet: self.dataset.data,
+        }
+
     def save_excel(self, file_path, data_sheet="Data"):
         """
         Save the dataset to an Excel file.
@@ -104,7 +727,8 @@ class DatasetIO:
         This function saves the dataset to an Excel file. The data, chemical
         annotation, and sample metadata are saved to separate sheets in the
         Excel file. The name of the sheet containing the data is specified by
-        the `data_name` parameter.
+        the `data_name` parameter. Rows are streamed to a write-only workbook,
+        so memory use does not grow with the size of the dataset.
 
         Args:
             file_path (str): Path to save the Excel file.
@@ -112,9 +736,67 @@ class DatasetIO:
                 "data".
 
         """
-        with pd.ExcelWriter(file_path) as writer:
-            self.dataset.chemical_annotation.to_excel(
-                writer, sheet_name="Chemical Annotation"
-            )
-            self.dataset.sample_metadata.to_excel(writer, sheet_name="Sample Meta Data")
-            self.dataset.data.to_excel(writer, sheet_name=data_sheet)
+        write_excel(file_path, self._excel_sheets(data_sheet))
+
+
+def write_excel(file_path: str, sheets: dict[str, pd.DataFrame]) -> None:
+    """
+    Write DataFrames to the sheets of an Excel file, with a constant memory footprint.
+
+    Rows are appended to a write-only (streaming) openpyxl workbook, in blocks
+    of rows, with the index as first column as in `DataFrame.to_excel`; missing
+    values are written as empty cells.
+
+    Args:
+        file_path: path of the Excel file
+        sheets: DataFrames to write, by sheet name
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    for sheet_name, data_frame in sheets.items():
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append([data_frame.index.name, *data_frame.columns])
+        for block, _ in iter_blocks(data_frame.shape, axis=1):
+            rows = data_frame.iloc[block]
+            rows = rows.astype(object).where(rows.notna(), None)
+            for index, row in zip(rows.index, rows.to_numpy()):
+                sheet.append([index, *row])
+    workbook.save(file_path)
+
+
+def save_excel_files(
+    datasets: dict, data_sheet: str = "Data", max_workers: int | None = 1
+) -> None:
+    """
+    Save several datasets to Excel files, optionally writing the workbooks in parallel.
+
+    By default the workbooks are written sequentially in this process. With more
+    than one worker, each workbook is written by `write_excel` in a separate
+    process, since writing Excel files is bound by the Python interpreter; the
+    worker processes are spawned and import the calling module, so scripts must
+    call this under an `if __name__ == "__main__":` guard.
+
+    Args:
+        datasets: datasets to save, by file path
+        data_sheet: name of the sheet containing the data
+        max_workers: number of workbooks written at the same time; 1 (default)
+            writes them sequentially in this process, None uses one process per
+            processor
+    """
+    jobs = {
+        file_path: DatasetIO(dataset)._excel_sheets(data_sheet)
+        for file_path, dataset in datasets.items()
+    }
+    if max_workers == 1:
+        for file_path, sheets in jobs.items():
+            write_excel(file_path, sheets)
+        return
+    # spawn, since forking a process running pandas/pyarrow threads can deadlock
+    with ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        futures = [
+            executor.submit(write_excel, file_path, sheets)
+            for file_path, sheets in jobs.items()
+        ]
+        for future in futures:
+            future.result()
@@ -1,10 +1,13 @@
+import numpy as np
 import pandas as pd
-from typing import Literal
+from typing import Callable, Literal
+from metabotk.parse_and_setup import coerce_ids
+from metabotk.utils import get_remaining_positions
 
 
 class DatasetOperations:
     """
-    Operation functions (subset, drop, sort, split)
+    Operation functions (subset, drop, sort, split, concat)
     """
 
     def __init__(self, dataset):
@@ -14,107 +17,140 @@ class DatasetOperations:
         self,
         what: Literal["samples", "metabolites"] = "samples",
         ids: list[str] | str = [],
+        view: bool = False,
     ):
         """
 
         Args:
             what:
             ids:
+            view: if True, return a read-only view dataset over the current data,
+                which is only copied when new data is assigned to it
 
         Returns:
 
         """
         if what == "samples":
-            return self._subset_samples(ids)
+            return self._subset_samples(ids, view=view)
         elif what == "metabolites":
-            return self._subset_metabolites(ids)
+            return self._subset_metabolites(ids, view=view)
 
-    def _subset_samples(self, samples_to_subset: list[str] | str):
+    def _subset_samples(self, samples_to_subset: list[str] | str, view: bool = False):
         if not isinstance(samples_to_subset, list):
             samples_to_subset = list(samples_to_subset)
-        remaining_data = self.dataset.data.loc[samples_to_subset]
-        remaining_sample_metadata = self.dataset.sample_metadata.loc[samples_to_subset]
-        return self.dataset._setup(
-            data=remaining_data,
-            sample_metadata=remaining_sample_metadata,
-            chemical_annotation=self.dataset.chemical_annotation,
-            sample_id_column=self.dataset._sample_id_column,
-            metabolite_id_column=self.dataset._metabolite_id_column,
-        )
+        rows = self.dataset.sample_positions(samples_to_subset)
+        return self.dataset._take(rows=rows, view=view)
 
-    def _subset_metabolites(self, metabolites_to_subset: list[str] | str):
+    def _subset_metabolites(
+        self, metabolites_to_subset: list[str] | str, view: bool = False
+    ):
         """
 
         Args:
             metabolites_to_subset:
+            view:
 
         Returns:
 
         """
         if not isinstance(metabolites_to_subset, list):
             metabolites_to_subset = list(metabolites_to_subset)
-
-        remaining_data = self.dataset.data[metabolites_to_subset]
-
-        remaining_chemical_annotation = self.dataset.chemical_annotation.loc[
-            metabolites_to_subset
-        ]
-        return self.dataset._setup(
-            data=remaining_data,
-            sample_metadata=self.dataset.sample_metadata,
-            chemical_annotation=remaining_chemical_annotation,
-            sample_id_column=self.dataset._sample_id_column,
-            metabolite_id_column=self.dataset._metabolite_id_column,
-        )
+        cols = self.dataset.metabolite_positions(metabolites_to_subset)
+        return self.dataset._take(cols=cols, view=view)
 
     def drop(
         self,
         what: Literal["samples", "metabolites"] = "samples",
-        ids: list[str] | str = [],
+        ids: list[str] | str | np.ndarray | pd.Series | Callable = [],
+        view: bool = False,
     ):
         """
+        Drop samples or metabolites from the dataset, keeping the order of the others.
 
         Args:
-            what:
-            ids:
+            what: drop samples ("samples") or metabolites ("metabolites")
+            ids: what to drop, as a list of IDs (IDs not in the dataset are
+                ignored), a boolean mask over the samples or metabolites (an
+                array or list in dataset order, or a Series indexed by ID, whose
+                missing values are kept), or a
+                predicate taking the sample metadata or chemical annotation and
+                returning such a mask
+            view: if True, return a read-only view dataset over the current data
 
         Returns:
+            MetabolomicDataset instance
 
+        Raises:
+            ValueError: if a mask array does not match the number of samples or metabolites
         """
         if what == "samples":
-            return self._drop_samples(ids)
+            return self._drop_samples(ids, view=view)
         elif what == "metabolites":
-            return self._drop_metabolites(ids)
+            return self._drop_metabolites(ids, view=view)
 
-    def _drop_samples(self, samples_to_drop: list[str] | str):
+    @staticmethod
+    def _remaining_positions(
+        index: pd.Index, metadata: pd.DataFrame, to_drop
+    ) -> np.ndarray:
+        """
+        Positions of the elements of an index left after dropping IDs, a mask or
+        the elements matched by a predicate on their metadata, in index order.
+        """
+        if callable(to_drop):
+            to_drop = to_drop(metadata)
+        if isinstance(to_drop, pd.Series) and pd.api.types.is_bool_dtype(to_drop):
+            # predicates return masks over the metadata, already in index order
+            if not to_drop.index.equals(index):
+                to_drop = to_drop.set_axis(coerce_ids(to_drop.index))
+                to_drop = to_drop.reindex(index, fill_value=False)
+            return np.flatnonzero(~to_drop.to_numpy(dtype=bool, na_value=False))
+        if (
+            isinstance(to_drop, list)
+            and to_drop
+            and all(isinstance(i, (bool, np.bool_)) for i in to_drop)
+        ):
+            to_drop = np.asarray(to_drop, dtype=bool)
+        if isinstance(to_drop, np.ndarray) and to_drop.dtype == bool:
+            if len(to_drop) != len(index):
+                raise ValueError(
+                    f"The mask has {len(to_drop)} elements, expected {len(index)}"
+                )
+            return np.flatnonzero(~to_drop)
+        if not isinstance(to_drop, (list, pd.Index)):
+            to_drop = list(to_drop)
+        return get_remaining_positions(index, to_drop)
+
+    def _drop_samples(self, samples_to_drop, view: bool = False):
         """
         Drop specified samples from the dataset.
         Args:
-            samples_to_drop:
+            samples_to_drop: IDs, mask or predicate on the sample metadata
+            view:
 
         Returns:
 
         """
-        if not isinstance(samples_to_drop, list):
-            samples_to_drop = list(samples_to_drop)
-        remaining_samples = list(
-            set(self.dataset.samples).difference(set(samples_to_drop))
+        rows = self._remaining_positions(
+            self.dataset.sample_index, self.dataset.sample_metadata, samples_to_drop
         )
-        return self._subset_samples(remaining_samples)
+        return self.dataset._take(rows=rows, view=view)
 
-    def _drop_metabolites(self, metabolites_to_drop: list[str] | str):
+    def _drop_metabolites(self, metabolites_to_drop, view: bool = False):
         """
         Drop specified metabolites from the dataset.
         Args:
-            metabolites_to_drop:
+            metabolites_to_drop: IDs, mask or predicate on the chemical annotation
+            view:
 
         Returns:
 
         """
-        remaining_metabolites = list(
-            set(self.dataset.metabolites).difference(metabolites_to_drop)
+        cols = self._remaining_positions(
+            self.dataset.metabolite_index,
+            self.dataset.chemical_annotation,
+            metabolites_to_drop,
         )
-        return self._subset_metabolites(remaining_metabolites)
+        return self.dataset._take(cols=cols, view=view)
 
     def sort(
         self,
@@ -172,56 +208,225 @@ class DatasetOperations:
         self,
         by: Literal["samples", "metabolites"] = "samples",
         columns: list[str] = [],
+        view: bool = False,
     ):
+        """
+        Split the dataset by the values of sample metadata or chemical annotation columns.
+
+        The positions of all groups are computed in a single pass, and each group
+        is taken directly from the dataset, without aligning its tables again.
+
+        Args:
+            by: split the samples ("samples") or the metabolites ("metabolites")
+            columns: columns of the sample metadata or chemical annotation to group by
+            view: if True, the split datasets are read-only views over the current data
+
+        Returns:
+            Dict of datasets, keyed by group
+        """
         if by == "samples":
-            return self._split_by_sample_column(columns)
+            return self._split_by_sample_column(columns, view=view)
         elif by == "metabolites":
-            return self._split_by_metabolite_column(columns)
+            return self._split_by_metabolite_column(columns, view=view)
+
+    @staticmethod
+    def _group_positions(metadata: pd.DataFrame, columns: list[str] | str) -> dict:
+        """
+        Positions of the rows of each group of a metadata table, keyed as when
+        iterating over `groupby`.
+        """
+        indices = metadata.groupby(by=columns, observed=True).indices
+        if isinstance(columns, list) and len(columns) == 1:
+            return {(name,): positions for name, positions in indices.items()}
+        return indices
 
-    def _split_by_sample_column(self, sample_columns: list) -> dict:
+    def _split_by_sample_column(self, sample_columns: list, view: bool = False) -> dict:
         """
 
         Args:
             sample_columns:
+            view:
 
         Returns:
 
         """
         split_datasets = {}
-        for name, group in self.dataset.sample_metadata.groupby(by=sample_columns):
-            temp_dataset = self.subset(what="samples", ids=list(group.index))
-            split_datasets[name] = temp_dataset
+        groups = self._group_positions(self.dataset.sample_metadata, sample_columns)
+        for name, rows in groups.items():
+            split_datasets[name] = self.dataset._take(rows=rows, view=view)
         return split_datasets
 
-    def _split_by_metabolite_column(self, metabolite_columns: list) -> dict:
+    def _split_by_metabolite_column(
+        self, metabolite_columns: list, view: bool = False
+    ) -> dict:
         """
 
         Args:
             metabolite_columns:
+            view:
 
         Returns:
 
         """
         split_dataset = {}
-        for name, group in self.dataset.chemical_annotation.groupby(
-            by=metabolite_columns
-        ):
-            temp_dataset = self.subset(what="metabolites", ids=list(group.index))
-            split_dataset[name] = temp_dataset
+        groups = self._group_positions(
+            self.dataset.chemical_annotation, metabolite_columns
+        )
+        for name, cols in groups.items():
+            split_dataset[name] = self.dataset._take(cols=cols, view=view)
         return split_dataset
 
-    # TODO: implement dataset merging/concatenation
-    """
-    def concat(self, other):
-        merged_data = pd.concat([self.data, other.data])
-        merged_sample_metadata = pd.concat(
-            [self.sample_metadata, other.sample_metadata]
+    def concat(
+        self,
+        others,
+        on: Literal["samples", "metabolites"] = "samples",
+        join: Literal["outer", "inner"] = "outer",
+        conflicts: Literal["first", "raise"] = "first",
+    ):
+        """
+        Concatenate datasets to this dataset, along samples (e.g. acquisition
+        batches) or along metabolites (e.g. analytical platforms).
+
+        The output matrix is allocated once and each dataset is copied into it,
+        so the concatenated data is never copied again as datasets are added.
+        Layers are not carried over.
+
+        Args:
+            others: dataset or list of datasets to concatenate, with the same ID columns
+            on: "samples" (default) to stack the samples of the datasets, or
+                "metabolites" to stack their metabolites
+            join: "outer" (default) to keep the metabolites (or samples) of any
+                dataset, missing values filling the gaps, or "inner" to keep only
+                those shared by all datasets, in the order of this dataset
+            conflicts: how to reconcile the chemical annotation (or sample metadata)
+                of metabolites (or samples) found in several datasets: "first"
+                (default) keeps the first non-missing value of each column, "raise"
+                raises an error if the datasets disagree
+
+        Returns:
+            MetabolomicDataset instance
+
+        Raises:
+            ValueError: if the datasets have different ID columns, if the stacked
+                samples (or metabolites) are duplicated, or if conflicts is
+                "raise" and the annotations disagree
+        """
+        if on not in ("samples", "metabolites"):
+            raise ValueError(f"Unknown axis '{on}', choose 'samples' or 'metabolites'")
+        if join not in ("outer", "inner"):
+            raise ValueError(f"Unknown join '{join}', choose 'outer' or 'inner'")
+        if conflicts not in ("first", "raise"):
+            raise ValueError(
+                f"Unknown conflicts policy '{conflicts}', choose 'first' or 'raise'"
+            )
+        if not isinstance(others, (list, tuple)):
+            others = [others]
+        datasets = [self.dataset, *others]
+        id_columns = {
+            (dataset._sample_id_column, dataset._metabolite_id_column)
+            for dataset in datasets
+        }
+        if len(id_columns) > 1:
+            raise ValueError(f"The datasets have different ID columns: {id_columns}")
+
+        if on == "samples":
+            stacked = [dataset.sample_metadata for dataset in datasets]
+            aligned = [dataset.chemical_annotation for dataset in datasets]
+        else:
+            stacked = [dataset.chemical_annotation for dataset in datasets]
+            aligned = [dataset.sample_metadata for dataset in datasets]
+        stacked_metadata = pd.concat(stacked)
+        duplicated = stacked_metadata.index[stacked_metadata.index.duplicated()]
+        if len(duplicated):
+            raise ValueError(f"The {on} {list(duplicated)} are in several datasets")
+        aligned_ids = aligned[0].index
+        for table in aligned[1:]:
+            if join == "outer":
+                aligned_ids = aligned_ids.union(table.index, sort=False)
+            else:
+                aligned_ids = aligned_ids.intersection(table.index, sort=False)
+        aligned_metadata = self._reconcile_metadata(aligned, aligned_ids, conflicts)
+
+        # preallocate the output and copy each dataset into its block
+        blocks = [dataset.values for dataset in datasets]
+        if on == "metabolites":
+            blocks = [block.T for block in blocks]
+        values = np.full(
+            (len(stacked_metadata), len(aligned_ids)),
+            np.nan,
+            dtype=np.result_type(np.float32, *blocks),
         )
-        merged_chemical_annotation = self.chemical_annotation.merge(
-            other.chemical_annotation, left_index=True, right_index=True
+        start = 0
+        for block, table in zip(blocks, aligned):
+            stop = start + len(block)
+            positions = aligned_ids.get_indexer(table.index)
+            kept = positions != -1
+            values[start:stop, positions[kept]] = block[:, kept]
+            start = stop
+        if on == "metabolites":
+            values = values.T
+            sample_metadata, chemical_annotation = aligned_metadata, stacked_metadata
+        else:
+            sample_metadata, chemical_annotation = stacked_metadata, aligned_metadata
+        data = pd.DataFrame(
+            values,
+            index=sample_metadata.index,
+            columns=chemical_annotation.index.rename(None),
+            copy=False,
         )
-        return self.
-    """
+        return type(self.dataset)(
+            data=data,
+            sample_metadata=sample_metadata,
+            chemical_annotation=chemical_annotation,
+            sample_id_column=self.dataset._sample_id_column,
+            metabolite_id_column=self.dataset._metabolite_id_column,
+            storage=self.dataset.storage,
+            dtype=self.dataset.dtype,
+        )
+
+    def merge(
+        self,
+        others,
+        join: Literal["outer", "inner"] = "outer",
+        conflicts: Literal["first", "raise"] = "first",
+    ):
+        """
+        Merge the metabolites of datasets measured on the same samples, e.g. on
+        different analytical platforms; see `concat`.
+
+        Args:
+            others: dataset or list of datasets to merge
+            join: "outer" (default) to keep the samples of any dataset, or "inner"
+                to keep only those shared by all datasets
+            conflicts: "first" (default) or "raise", as in `concat`
+
+        Returns:
+            MetabolomicDataset instance
+        """
+        return self.concat(others, on="metabolites", join=join, conflicts=conflicts)
+
+    @staticmethod
+    def _reconcile_metadata(
+        tables: list[pd.DataFrame], ids: pd.Index, conflicts: str
+    ) -> pd.DataFrame:
+        """
+        Combine the metadata of the same ids found in several tables, keeping the
+        first non-missing value of each column.
+
+        Raises:
+            ValueError: if conflicts is "raise" and the tables disagree on some values
+        """
+        combined = pd.concat(tables)
+        combined = combined[combined.index.isin(ids)]
+        if conflicts == "raise":
+            shared = combined[combined.index.duplicated(keep=False)]
+            counts = shared.groupby(level=0, sort=False).nunique()
+            conflicting = list(counts.columns[(counts > 1).any()])
+            if conflicting:
+                raise ValueError(f"The datasets disagree on the columns {conflicting}")
+        combined = combined.groupby(level=0, sort=False).first()
+        return combined.loc[ids]
+
     """
     Utility functions
     """
@@ -257,18 +462,23 @@ class DatasetOperations:
             chemical_annotation=self.dataset.chemical_annotation,
             sample_id_column=self.dataset._sample_id_column,
             metabolite_id_column=new_column,
+            storage=self.dataset.storage,
+            dtype=self.dataset.dtype,
         )
 
     def replace_sample_names_in_data(self, new_index: str):
         # Check that the column exists in the sample metadata
         if new_index not in self.dataset.sample_metadata.columns:
             raise ValueError(f"No column named {new_index} in the sample metadata")
-        new_data = self.dataset.data
-        new_data.index = self.dataset.sample_metadata[new_index]
+        new_data = self.dataset.data.set_axis(
+            self.dataset.sample_metadata[new_index], axis=0
+        )
         return self.dataset._setup(
-            data=self.dataset.data,
+            data=new_data,
             sample_metadata=self.dataset.sample_metadata,
             chemical_annotation=self.dataset.chemical_annotation,
             sample_id_column=new_index,
             metabolite_id_column=self.dataset._metabolite_id_column,
+            storage=self.dataset.storage,
+            dtype=self.dataset.dtype,
         )
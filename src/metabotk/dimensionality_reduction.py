@@ -28,7 +28,20 @@ class DimensionalityReduction:
         Returns:
             pca_transformed (DataFrame): DataFrame containing the PCA-transformed data.
             pca (PCA): sklearn PCA object.
+
+        Results are cached on the dataset until its data or metadata are replaced.
         """
+        pca_transformed, pca = self.dataset.cache.get_or_compute(
+            "pca",
+            {"n_components": n_components},
+            lambda: self._compute_pca(n_components),
+        )
+        if get_pca_object:
+            return pca_transformed, pca
+        else:
+            return pca_transformed
+
+    def _compute_pca(self, n_components):
         input_data = self.dataset.data
         # Check if all columns have numeric data types
         if input_data.isnull().any().any():
@@ -59,7 +72,4 @@ class DimensionalityReduction:
         pca_transformed = self.dataset.sample_metadata.merge(
             pca_transformed, left_index=True, right_index=True
         )
-        if get_pca_object:
-            return pca_transformed, pca
-        else:
-            return pca_transformed
+        return pca_transformed, pca
@@ -7,12 +7,15 @@ Currently implemented methods:
 
 """
 
+import warnings
 import dill
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
 from sklearn.model_selection import StratifiedKFold
 from boruta_py_versioned import BorutaPy
 import pandas as pd
 from metabotk.utils import create_directory
+from metabotk.cache import DiskCache, is_integer_seed
+from metabotk.dataset_io import save_excel_files
 
 
 class FeatureSelection:
@@ -81,6 +84,7 @@ class FeatureSelection:
         alpha=0.01,
         max_iterations=1000,
         output_dir=None,
+        cache_dir=None,
     ):
         """
         Boruta feature selection
@@ -97,6 +101,11 @@ class FeatureSelection:
             max_iterations (int): Max iterations for the Boruta algorithm.
             random_state (int): Random state for reproducibility.
             get_model (bool): Return the Boruta model.
+            cache_dir (str): Directory of an on-disk cache; if given, the
+                results are reused when Boruta is run again with the same
+                dataset content, parameters and seed. Only runs with an
+                integer random_state are cached, since the others are not
+                reproducible.
 
         Returns:
             tuple[DataFrame, DataFrame, BorutaPy]: Tuple with ranking and
@@ -108,6 +117,68 @@ class FeatureSelection:
         """
         if not y_column:
             raise ValueError("y value must be specified")
+        params = {
+            "y_column": y_column,
+            "kind": kind,
+            "random_state": random_state,
+            "max_depth": max_depth,
+            "class_weight": class_weight,
+            "n_estimators": n_estimators,
+            "alpha": alpha,
+            "max_iterations": max_iterations,
+        }
+        if cache_dir and not is_integer_seed(random_state):
+            warnings.warn(
+                "The Boruta results are not cached, since they are not reproducible "
+                "without an integer random_state"
+            )
+            cache_dir = None
+        if cache_dir:
+            params["random_state"] = int(random_state)
+            feat_selector, importance_history, ranking = DiskCache(
+                cache_dir
+            ).get_or_compute(
+                "boruta",
+                self.dataset.fingerprint,
+                params,
+                lambda: self._fit_boruta(**params, threads=threads),
+            )
+        else:
+            feat_selector, importance_history, ranking = self._fit_boruta(
+                **params, threads=threads
+            )
+
+        if output_dir:
+            with open(f"{output_dir}/boruta_model.pickle", "wb") as f:
+                dill.dump(feat_selector, f)
+            importance_history.to_csv(
+                f"{output_dir}/importance_history.tsv", sep="\t", index=False
+            )
+
+            ranking.to_csv(f"{output_dir}/ranking.tsv", sep="\t", index=False)
+            return ranking
+        else:
+            return ranking
+
+    def _fit_boruta(
+        self,
+        y_column,
+        kind,
+        threads,
+        random_state,
+        max_depth,
+        class_weight,
+        n_estimators,
+        alpha,
+        max_iterations,
+    ):
+        """
+        Fit BorutaPy and collect its importance history and ranking.
+
+        Returns:
+            tuple[BorutaPy, DataFrame, DataFrame]: fitted selector, importance
+                history and ranking.
+        """
         X = self.dataset.data.values
 
         y = self.dataset.sample_metadata[y_column].values
@@ -133,35 +204,24 @@ class FeatureSelection:
             feat_selector.importance_history_,
             index=range(len(feat_selector.importance_history_)),
         )
-        importance_history.columns = self.dataset.metabolites
+        importance_history.columns = self.dataset.metabolite_index.rename(None)
         importance_history.index.name = "iteration"
         importance_history = importance_history.reset_index()
 
         ranking = pd.DataFrame(
             feat_selector.ranking_,
             columns=["rank"],
-            index=self.dataset.metabolites,
+            index=self.dataset.metabolite_index.rename("metabolite"),
         )
-        ranking.index.name = "metabolite"
         ranking = ranking.reset_index()
-
-        if output_dir:
-            with open(f"{output_dir}/boruta_model.pickle", "wb") as f:
-                dill.dump(feat_selector, f)
-            importance_history.to_csv(
-                f"{output_dir}/importance_history.tsv", sep="\t", index=False
-            )
-
-            ranking.to_csv(f"{output_dir}/ranking.tsv", sep="\t", index=False)
-            return ranking
-        else:
-            return ranking
+        return feat_selector, importance_history, ranking
 
     def stratified_kfold(
         self,
         n_splits: int,
         stratification_column: str,
         output_dir=None,
+        max_workers=1,
     ) -> dict:
         """Split the dataset using a stratified approach for cross-validation.
 
@@ -177,6 +237,10 @@ class FeatureSelection:
             output_dir: Directory to save dataframes to.
             stratification_column: Column in sample metadata to use for
                 stratification.
+            max_workers: Number of fold workbooks written in parallel when
+                output_dir is given; 1 (default) writes them sequentially.
+                Parallel writes use worker processes, see `save_excel_files`
+                for the `if __name__ == "__main__":` guard they need.
         Returns:
             Dictionary with keys as fold numbers and values as the train
             dataframes.
@@ -201,8 +265,11 @@ class FeatureSelection:
             split_train[foldname] = train
             split_test[foldname] = test
 
-            if output_dir:
-                train.io.save_excel(f"{output_dir}/{foldname}_train.xlsx")
-                test.io.save_excel(f"{output_dir}/{foldname}_test.xlsx")
+        if output_dir:
+            workbooks = {}
+            for foldname in split_train:
+                workbooks[f"{output_dir}/{foldname}_train.xlsx"] = split_train[foldname]
+                workbooks[f"{output_dir}/{foldname}_test.xlsx"] = split_test[foldname]
+            save_excel_files(workbooks, max_workers=max_workers)
 
         return {"training_set": split_train, "test_set": split_test}
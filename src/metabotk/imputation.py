@@ -1,8 +1,10 @@
+import warnings
 import miceforest as mf
 import numpy as np
 import pandas as pd
 from sklearn.utils import check_random_state
 from metabotk.statistics_handler import get_top_n_correlations
+from metabotk.cache import DiskCache, is_integer_seed
 
 
 class ImputationHandler:
@@ -38,16 +40,56 @@ class ImputationHandler:
         n_iterations=5,
         random_state=None,
         get_kernel=False,
+        cache_dir=None,
     ):
         """
         Perform missing data imputation using MICE (Mixed-effects Imputation by Chained Equations).
 
         Parameters:
             n_correlated_metabolites (int): Number of metabolites to use for correlated imputation.
+            random_state (int): Random seed (default: None).
+            cache_dir (str): Directory of an on-disk cache; if given, the imputation is reused
+                when run again with the same dataset content, parameters and seed. Only
+                imputations with an integer random_state are cached, since the others
+                are not reproducible.
 
         Returns:
             dict: Dictionary with imputed datasets, keys are integers starting from 1.
         """
+        params = {
+            "n_correlated_metabolites": n_correlated_metabolites,
+            "n_imputed_datasets": n_imputed_datasets,
+            "n_iterations": n_iterations,
+            "random_state": random_state,
+        }
+        if cache_dir and not is_integer_seed(random_state):
+            warnings.warn(
+                "The imputation is not cached, since it is not reproducible without "
+                "an integer random_state"
+            )
+            cache_dir = None
+        if cache_dir:
+            params["random_state"] = int(random_state)
+            kds, imputed = DiskCache(cache_dir).get_or_compute(
+                "miceforest",
+                self._dataset_manager.fingerprint,
+                params,
+                lambda: self._run_miceforest(**params),
+            )
+        else:
+            kds, imputed = self._run_miceforest(**params)
+        if get_kernel == True:
+            return kds, imputed
+        else:
+            return imputed
+
+    def _run_miceforest(
+        self,
+        n_correlated_metabolites,
+        n_imputed_datasets,
+        n_iterations,
+        random_state,
+    ):
         corrs = get_top_n_correlations(
             data_frame=self._dataset_manager.data, n=n_correlated_metabolites
         )
@@ -72,7 +114,4 @@ class ImputationHandler:
             dataset + 1: kds.complete_data(dataset=dataset)
             for dataset in range(n_imputed_datasets)
         }
-        if get_kernel == True:
-            return kds, imputed
-        else:
-            return imputed
+        return kds, imputed
@@ -0,0 +1,175 @@
+"""
+Named data layers sharing the samples, metabolites and metadata of a dataset
+"""
+
+from collections.abc import MutableMapping
+from typing import Callable
+import os
+import numpy as np
+import pandas as pd
+from metabotk.parse_and_setup import coerce_ids, setup_data
+from metabotk.storage import make_storage
+from metabotk.utils import get_positions, parse_input
+
+
+class Layers(MutableMapping):
+    """
+    Collection of named data matrices aligned to the samples and metabolites of a dataset.
+
+    Layers hold alternative versions of the data (e.g. raw peak areas,
+    normalized, imputed or residualized values) without duplicating the sample
+    metadata and chemical annotation. A layer can be set as:
+        - a DataFrame, with samples as rows and metabolites as columns
+        - a callable returning such a DataFrame, loaded on first access
+        - a path to a table readable by `parse_input`, loaded on first access
+
+    Layers are reordered to the sample and metabolite order of the dataset and
+    stored with its storage mode. `del layers[name]` removes a layer, while
+    `unload(name)` only frees the loaded matrix of a lazy layer, which is
+    loaded again on the next access.
+    """
+
+    def __init__(
+        self,
+        index: pd.Index,
+        columns: pd.Index,
+        storage: str = "frame",
+        sample_id_column: str | None = None,
+        dtype=None,
+    ) -> None:
+        """
+        Initialize the class.
+
+        Parameters:
+            index (pd.Index): sample ids of the dataset
+            columns (pd.Index): metabolite ids of the dataset
+            storage (str): storage mode of the layers, "frame" or "array"
+            sample_id_column (str): name of the sample id column, used to set up layers read from files
+            dtype (str): dtype policy of the layers, as in `make_storage`
+        """
+        self._index = index
+        self._columns = columns
+        self._storage = storage
+        self._sample_id_column = sample_id_column
+        self._dtype = dtype
+        self._loaded: dict = {}
+        self._loaders: dict[str, Callable[[], pd.DataFrame]] = {}
+
+    def _align(self, frame: pd.DataFrame):
+        frame = frame.copy(deep=False)
+        frame.index = coerce_ids(frame.index)
+        frame.columns = coerce_ids(frame.columns)
+        if not (
+            frame.index.equals(self._index) and frame.columns.equals(self._columns)
+        ):
+            rows = get_positions(frame.index, self._index)
+            cols = get_positions(frame.columns, self._columns)
+            frame = frame.iloc[rows, cols]
+        frame = frame.rename_axis(index=self._index.name)
+        return make_storage(frame, self._storage, self._dtype)
+
+    def _loader_from_path(self, path: str | os.PathLike[str]):
+        if self._sample_id_column is None:
+            raise ValueError("A sample id column is needed to read layers from files")
+        return lambda: setup_data(
+            parse_input(path, id_column=self._sample_id_column),
+            self._sample_id_column,
+        )
+
+    def __setitem__(self, name: str, layer) -> None:
+        self._loaded.pop(name, None)
+        self._loaders.pop(name, None)
+        if isinstance(layer, pd.DataFrame):
+            self._loaded[name] = self._align(layer)
+        elif isinstance(layer, (str, os.PathLike)):
+            self._loaders[name] = self._loader_from_path(layer)
+        elif callable(layer):
+            self._loaders[name] = layer
+        else:
+            raise TypeError(
+                "Layers must be DataFrames, callables returning a DataFrame or file paths"
+            )
+
+    def _load(self, name: str):
+        """
+        Return the storage of a layer, loading it without keeping it if needed.
+        """
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._loaders:
+            raise KeyError(f"No layer named '{name}'")
+        return self._align(self._loaders[name]())
+
+    def _get_storage(self, name: str):
+        if name not in self._loaded:
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        return self._get_storage(name).to_frame()
+
+    def __delitem__(self, name: str) -> None:
+        if name not in self:
+            raise KeyError(f"No layer named '{name}'")
+        self._loaded.pop(name, None)
+        self._loaders.pop(name, None)
+
+    def __iter__(self):
+        return iter(dict.fromkeys([*self._loaders, *self._loaded]))
+
+    def __len__(self) -> int:
+        return len(set(self._loaders) | set(self._loaded))
+
+    def __contains__(self, name) -> bool:
+        return name in self._loaded or name in self._loaders
+
+    def __repr__(self) -> str:
+        status = {name: self.is_loaded(name) for name in self}
+        return f"Layers({status})"
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def unload(self, name: str) -> None:
+        """
+        Free the matrix of a lazily loaded layer; it is loaded again on next access.
+
+        Raises:
+            ValueError: if the layer has no loader and would be lost
+        """
+        if name not in self._loaders:
+            raise ValueError(
+                f"Layer '{name}' was not lazily loaded and cannot be unloaded"
+            )
+        self._loaded.pop(name, None)
+
+    def take(self, rows: np.ndarray, cols: np.ndarray, view: bool = False):
+        """
+        Select the same samples and metabolites in every layer.
+
+        Loaded layers are taken directly; lazy layers stay lazy and are subset
+        once they are loaded.
+
+        Parameters:
+            rows (np.ndarray): positions of the samples to keep
+            cols (np.ndarray): positions of the metabolites to keep
+            view (bool): if True, loaded layers are views over the current layers
+
+        Returns:
+            Layers instance
+        """
+        layers = Layers(
+            self._index[rows],
+            self._columns[cols],
+            self._storage,
+            self._sample_id_column,
+            self._dtype,
+        )
+        for name, storage in self._loaded.items():
+            storage = storage.take(rows, cols)
+            layers._loaded[name] = storage if view else storage.materialize()
+        for name in self._loaders:
+            layers._loaders[name] = (
+                lambda name=name: self._load(name).take(rows, cols).to_frame()
+            )
+        return layers
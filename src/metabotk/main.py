@@ -32,6 +32,8 @@ class MetaboTK(MetabolomicDataset):
         chemical_annotation=pd.DataFrame(),
         sample_id_column="sample",
         metabolite_id_column="CHEM_ID",
+        storage="frame",
+        dtype=None,
     ) -> None:
         super().__init__(
             data=data,
@@ -39,6 +41,8 @@ class MetaboTK(MetabolomicDataset):
             chemical_annotation=chemical_annotation,
             sample_id_column=sample_id_column,
             metabolite_id_column=metabolite_id_column,
+            storage=storage,
+            dtype=dtype,
         )
 
     @property
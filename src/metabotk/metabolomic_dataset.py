@@ -1,11 +1,17 @@
+import warnings
+import numpy as np
 import pandas as pd
-from metabotk.parse_and_setup import (
-    setup_data,
-    setup_sample_metadata,
-    setup_chemical_annotation,
-)
+from metabotk.parse_and_setup import setup_tables, align_tables
 
-from metabotk.utils import validate_new_data, validate_new_metadata
+from metabotk.utils import validate_new_data, validate_new_metadata, get_positions
+from metabotk.storage import StorageMode, FloatDtype, make_storage, precision_loss
+from metabotk.layers import Layers
+from metabotk.cache import (
+    ResultCache,
+    fingerprint_array,
+    fingerprint_frame,
+    combine_fingerprints,
+)
 
 
 class MetabolomicDataset:
@@ -20,6 +26,25 @@ class MetabolomicDataset:
         chemical_annotation: pd.DataFrame containing the chemical annotation, with metabolites as rows and metabolite metadata as columns
         samples: list of sample ids
         metabolites: list of metabolite ids
+        sample_index: immutable pd.Index of sample ids, with hashed lookups
+        metabolite_index: immutable pd.Index of metabolite ids, with hashed lookups
+        values: np.ndarray with the raw abundance matrix
+        storage: storage mode of the abundance matrix ("frame", "array" or "memmap")
+        is_view: whether the data is a read-only view over the data of a parent dataset
+        alignment_report: dict listing the sample and metabolite IDs dropped when aligning
+            the input tables (None if the dataset was not built by _setup)
+        dtype: dtype policy of the abundance matrix (None keeps the input dtypes)
+        precision_report: dict summarizing the precision lost by converting the input
+            data to a float32 dtype policy (None if no conversion was made by _setup)
+        categorical_report: dict with the bytes saved by each metadata column stored as
+            categorical by _setup, under "sample_metadata" and "chemical_annotation"
+        cache: ResultCache with derived results (statistics, correlations, PCA); it is
+            cleared whenever data, sample_metadata or chemical_annotation are set.
+            In-place edits of the returned DataFrames bypass this, call
+            `cache.clear()` after them
+        fingerprint: content hash of the dataset, stable across processes
+        layers: named alternative data matrices (e.g. raw, normalized, imputed) sharing
+            the samples, metabolites and metadata of the dataset
     """
 
     def __init__(
@@ -29,6 +54,8 @@ class MetabolomicDataset:
         chemical_annotation: pd.DataFrame,
         sample_id_column: str,
         metabolite_id_column: str,
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
     ) -> None:
         """
         Initialize the class.
@@ -39,14 +66,30 @@ class MetabolomicDataset:
             data (pd.DataFrame): metabolomic data, with samples as rows and metabolites as columns
             sample_metadata (pd.DataFrame): sample metadata, with samples as rows and sample metadata as columns
             chemical_annotation (pd.DataFrame): chemical annotation, with metabolites as rows and metabolite metadata as columns
+            storage (str): "frame" to keep the data as a DataFrame, "array" to keep it as a single contiguous float block,
+                "memmap" for data memory-mapped from a file (see `DatasetIO.from_memmap`)
+            dtype (str): "float32" to store the data in single precision, "float64" for double
+                precision; None keeps the input dtypes (float64 in "array" mode)
         """
         self._sample_id_column: str = sample_id_column
         self._metabolite_id_column: str = metabolite_id_column
-        self.__data = data
+        self.__storage = make_storage(data, storage, dtype)
         self.__sample_metadata = sample_metadata
         self.__chemical_annotation = chemical_annotation
-        self.__samples = list(sample_metadata.index)
-        self.__metabolites = list(chemical_annotation.index)
+        self.__set_sample_index(sample_metadata.index)
+        self.__set_metabolite_index(chemical_annotation.index)
+        self.alignment_report: dict | None = None
+        self.precision_report: dict | None = None
+        self.categorical_report: dict | None = None
+        self.__cache = ResultCache()
+        self.__fingerprints: dict[str, str] = {}
+        self.__layers = Layers(
+            self.__storage.index,
+            self.__storage.columns,
+            self.__storage.mode,
+            sample_id_column,
+            self.__storage.dtype,
+        )
 
     @classmethod
     def _setup(
@@ -56,6 +99,9 @@ class MetabolomicDataset:
         chemical_annotation: pd.DataFrame,
         sample_id_column: str,
         metabolite_id_column: str,
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+        categorical: bool = False,
     ):
         """
         Setup the class.
@@ -66,36 +112,211 @@ class MetabolomicDataset:
             data (pd.DataFrame): metabolomic data, with samples as rows and metabolites as columns
             sample_metadata (pd.DataFrame): sample metadata, with samples as rows and sample metadata as columns
             chemical_annotation (pd.DataFrame): chemical annotation, with metabolites as rows and metabolite metadata as columns
+            storage (str): storage mode of the data, "frame" (default) or "array"
+            dtype (str): dtype policy of the data, "float32", "float64" or None to keep the
+                input dtypes; converting to float32 sets `precision_report`
+            categorical (bool): store low-cardinality string metadata columns as categoricals;
+                the memory saved is reported in `categorical_report`. Off by default, since
+                categorical columns reject values outside their categories
+        Returns:
+            MetabolomicDataset populated instance
+        """
+        tables = setup_tables(
+            sample_metadata,
+            chemical_annotation,
+            data,
+            sample_id_column,
+            metabolite_id_column,
+            categorical=categorical,
+            max_workers=1,
+        )
+        return cls._from_tables(
+            tables, sample_id_column, metabolite_id_column, storage, dtype
+        )
+
+    @classmethod
+    def _from_tables(
+        cls,
+        tables: dict,
+        sample_id_column: str,
+        metabolite_id_column: str,
+        storage: StorageMode = "frame",
+        dtype: FloatDtype | None = None,
+    ):
+        """
+        Build the class from tables already set up by `setup_tables`.
+
+        Parameters:
+            tables (dict): output of `setup_tables`
+            sample_id_column (str): name of the sample id column
+            metabolite_id_column (str): name of the metabolite id column
+            storage (str): storage mode of the data, "frame" (default) or "array"
+            dtype (str): dtype policy of the data, as in `_setup`
         Returns:
             MetabolomicDataset populated instance
         """
-        data = setup_data(data, sample_id_column)
-        sample_metadata = setup_sample_metadata(sample_metadata, sample_id_column)
-        chemical_annotation = setup_chemical_annotation(
-            chemical_annotation, metabolite_id_column
+        aligned = align_tables(
+            tables["data"], tables["sample_metadata"], tables["chemical_annotation"]
         )
-        chemical_annotation.index = chemical_annotation.index.map(str)
-        sample_metadata.index = sample_metadata.index.map(str)
-        data.columns = data.columns.map(str)
-        data.index = data.index.map(str)
-        metabolites = [i for i in data.columns if i in list(chemical_annotation.index)]
-        data = data[metabolites]
-        sample_metadata = sample_metadata.loc[data.index]
+        sample_metadata = aligned["sample_metadata"]
         sample_metadata.index.name = sample_id_column
-        chemical_annotation = chemical_annotation.loc[data.columns]
+        chemical_annotation = aligned["chemical_annotation"]
         chemical_annotation.index.name = metabolite_id_column
 
-        return cls(
-            data=data,
+        dataset = cls(
+            data=aligned["data"],
             sample_metadata=sample_metadata,
             chemical_annotation=chemical_annotation,
             sample_id_column=sample_id_column,
             metabolite_id_column=metabolite_id_column,
+            storage=storage,
+            dtype=dtype,
+        )
+        dataset.alignment_report = aligned["alignment_report"]
+        dataset.categorical_report = tables["categorical_report"]
+        if dtype is not None and np.dtype(dtype).itemsize < 8:
+            report = precision_loss(aligned["data"], dataset.data)
+            if report["n_overflow"] or report["n_underflow"]:
+                warnings.warn(
+                    f"Converting the data to {report['dtype']} turned "
+                    f"{report['n_overflow']} values to infinity and "
+                    f"{report['n_underflow']} values to zero"
+                )
+            dataset.precision_report = report
+        return dataset
+
+    def _take(self, rows=None, cols=None, view: bool = False):
+        """
+        Build a new dataset from integer positions of samples and metabolites.
+
+        The setup and alignment steps are skipped, since the positions come from
+        an already aligned dataset.
+
+        Parameters:
+            rows (array-like): positions of the samples to keep; all samples if None
+            cols (array-like): positions of the metabolites to keep; all metabolites if None
+            view (bool): if True, the new dataset is a read-only view over the data of
+                this dataset, and its data is only copied when it is replaced
+        Returns:
+            MetabolomicDataset populated instance
+        """
+        if rows is None:
+            rows = np.arange(len(self.sample_metadata))
+        if cols is None:
+            cols = np.arange(len(self.chemical_annotation))
+        rows = np.asarray(rows, dtype=np.intp)
+        cols = np.asarray(cols, dtype=np.intp)
+        storage = self.__storage.take(rows, cols)
+        if not view:
+            storage = storage.materialize()
+        dataset = type(self)(
+            data=storage,
+            sample_metadata=self.sample_metadata.iloc[rows],
+            chemical_annotation=self.chemical_annotation.iloc[cols],
+            sample_id_column=self._sample_id_column,
+            metabolite_id_column=self._metabolite_id_column,
+            storage=self.storage,
+            dtype=self.dtype,
+        )
+        dataset.__layers = self.__layers.take(rows, cols, view=view)
+        return dataset
+
+    @property
+    def layers(self) -> Layers:
+        return self.__layers
+
+    def with_layer(self, name: str):
+        """
+        Return a dataset whose data is one of the layers of this dataset.
+
+        The new dataset shares the sample metadata, chemical annotation and
+        layers of this dataset, without copying them or aligning them again, so
+        that all handlers can be used on the layer.
+
+        Parameters:
+            name (str): name of the layer
+        Returns:
+            MetabolomicDataset instance
+        """
+        dataset = type(self)(
+            data=self.__layers._get_storage(name),
+            sample_metadata=self.sample_metadata,
+            chemical_annotation=self.chemical_annotation,
+            sample_id_column=self._sample_id_column,
+            metabolite_id_column=self._metabolite_id_column,
+            storage=self.storage,
+            dtype=self.dtype,
+        )
+        dataset.__layers = self.__layers
+        return dataset
+
+    @property
+    def cache(self) -> ResultCache:
+        return self.__cache
+
+    def _invalidate(self, component: str) -> None:
+        """
+        Discard derived results after a component of the dataset has changed.
+
+        Parameters:
+            component (str): "data", "sample_metadata" or "chemical_annotation"
+        """
+        self.__cache.clear()
+        self.__fingerprints.pop(component, None)
+
+    @property
+    def fingerprint(self) -> str:
+        """
+        Content hash of the dataset, covering the data, both metadata tables and
+        the ID column names.
+
+        The hash of each component is memoized until the corresponding setter is
+        used, so only changed components are hashed again.
+        """
+        if "data" not in self.__fingerprints:
+            self.__fingerprints["data"] = fingerprint_array(
+                self.values, self.__storage.index, self.__storage.columns
+            )
+        if "sample_metadata" not in self.__fingerprints:
+            self.__fingerprints["sample_metadata"] = fingerprint_frame(
+                self.sample_metadata
+            )
+        if "chemical_annotation" not in self.__fingerprints:
+            self.__fingerprints["chemical_annotation"] = fingerprint_frame(
+                self.chemical_annotation
+            )
+        return combine_fingerprints(
+            self._sample_id_column,
+            self._metabolite_id_column,
+            self.__fingerprints["data"],
+            self.__fingerprints["sample_metadata"],
+            self.__fingerprints["chemical_annotation"],
         )
 
+    @property
+    def storage(self) -> str:
+        return self.__storage.mode
+
+    @property
+    def dtype(self) -> np.dtype | None:
+        return self.__storage.dtype
+
+    @property
+    def is_view(self) -> bool:
+        return self.__storage.is_view
+
+    @property
+    def values(self) -> np.ndarray:
+        """
+        Raw abundance matrix, with samples as rows and metabolites as columns.
+
+        In "array" storage mode this is the underlying block itself, not a copy.
+        """
+        return self.__storage.values
+
     @property
     def data(self):
-        return self.__data
+        return self.__storage.to_frame()
 
     @data.setter
     def data(self, new_data: pd.DataFrame):
@@ -105,8 +326,9 @@ class MetabolomicDataset:
         Args:
             new_data: pd.DataFrame
         """
-        validate_new_data(self.data, new_data)
-        self.__data = new_data
+        validate_new_data(self.__storage, new_data)
+        self.__storage = self.__storage.replace(new_data)
+        self._invalidate("data")
 
     @property
     def sample_metadata(self):
@@ -121,6 +343,8 @@ class MetabolomicDataset:
         """
         validate_new_metadata(self.sample_metadata, new_sample_metadata)
         self.__sample_metadata = new_sample_metadata
+        self.__set_sample_index(new_sample_metadata.index)
+        self._invalidate("sample_metadata")
 
     @property
     def chemical_annotation(self):
@@ -135,9 +359,60 @@ class MetabolomicDataset:
         """
         validate_new_metadata(self.chemical_annotation, new_chemical_annotation)
         self.__chemical_annotation = new_chemical_annotation
+        self.__set_metabolite_index(new_chemical_annotation.index)
+        self._invalidate("chemical_annotation")
+
+    def __set_sample_index(self, index) -> None:
+        self.__sample_index = pd.Index(index)
+        self.__samples = None
+
+    def __set_metabolite_index(self, index) -> None:
+        self.__metabolite_index = pd.Index(index)
+        self.__metabolites = None
+
+    @property
+    def sample_index(self) -> pd.Index:
+        return self.__sample_index
+
+    @property
+    def metabolite_index(self) -> pd.Index:
+        return self.__metabolite_index
+
+    def sample_positions(self, ids) -> np.ndarray:
+        """
+        Resolve sample IDs to their row positions, in a single hashed lookup.
+
+        Args:
+            ids: list-like of sample ids
+
+        Returns:
+            np.ndarray of integer positions, in the order of ids
+
+        Raises:
+            KeyError: if any of the IDs is not a sample of the dataset
+        """
+        return get_positions(self.__sample_index, ids)
+
+    def metabolite_positions(self, ids) -> np.ndarray:
+        """
+        Resolve metabolite IDs to their column positions, in a single hashed lookup.
+
+        Args:
+            ids: list-like of metabolite ids
+
+        Returns:
+            np.ndarray of integer positions, in the order of ids
+
+        Raises:
+            KeyError: if any of the IDs is not a metabolite of the dataset
+        """
+        return get_positions(self.__metabolite_index, ids)
 
     @property
     def samples(self) -> list[str]:
+        # the list is built once from the index; do not modify it in place
+        if self.__samples is None:
+            self.__samples = self.__sample_index.tolist()
         return self.__samples
 
     @samples.setter
@@ -153,11 +428,14 @@ class MetabolomicDataset:
         """
         if len(new_samples) != len(self.data):
             raise ValueError("Number of samples must match number of data rows")
-        self.__samples = new_samples
+        self.__set_sample_index(new_samples)
 
     @property
     def metabolites(self) -> list[str]:
-        return list(self.chemical_annotation.index)
+        # the list is built once from the index; do not modify it in place
+        if self.__metabolites is None:
+            self.__metabolites = self.__metabolite_index.tolist()
+        return self.__metabolites
 
     @metabolites.setter
     def metabolites(self, new_metabolites: list[str]):
@@ -172,4 +450,4 @@ class MetabolomicDataset:
         """
         if len(new_metabolites) != len(self.data.columns):
             raise ValueError("Number of metabolites must match number of data columns")
-        self.__metabolites = new_metabolites
+        self.__set_metabolite_index(new_metabolites)
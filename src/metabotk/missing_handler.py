@@ -1,7 +1,7 @@
 import numpy as np
 
 import pandas as pd
-from metabotk.utils import validate_dataframe
+from metabotk.utils import validate_dataframe, iter_blocks, float_values, chunk_data
 from typing import Literal
 
 """
@@ -57,6 +57,27 @@ def count_missing(data):
     return n_missing
 
 
+def count_missing_in_array(values, axis=0):
+    """
+    Counts missing values in each column or row of a 2D array.
+
+    The array is processed in blocks of columns (or rows), so memory-mapped
+    arrays are never loaded whole.
+
+    Parameters:
+        values (np.ndarray): 2D array containing numerical values.
+        axis (int, optional): Axis along which to count missing values.
+            0 for columns, 1 for rows. Default is 0.
+
+    Returns:
+        np.ndarray: Number of missing values in each column or row.
+    """
+    n_missing = np.zeros(values.shape[1 - axis], dtype=np.int64)
+    for block, index in iter_blocks(values.shape, axis):
+        n_missing[block] = _detect_missing(values[index]).sum(axis=axis)
+    return n_missing
+
+
 def count_missing_in_dataframe(data_frame, axis=0):
     """
     Counts missing values in each row or column of a DataFrame.
@@ -70,8 +91,39 @@ def count_missing_in_dataframe(data_frame, axis=0):
         Series: Pandas Series with the row/column index and the number of missing values.
     """
     validate_dataframe(data_frame)
-    missing_values = data_frame.apply(_detect_missing, axis=axis)
-    n_missing_values = missing_values.sum(axis=axis)
+    n_missing_values = pd.Series(
+        count_missing_in_array(float_values(data_frame), axis),
+        index=data_frame.columns if axis == 0 else data_frame.index,
+    )
+    return n_missing_values
+
+
+def count_missing_in_chunks(chunks, axis=0):
+    """
+    Counts missing values in each metabolite or sample over chunks of samples.
+
+    Parameters:
+        chunks: iterable of MetabolomicDataset or DataFrame chunks holding the same
+            metabolites, e.g. from `DatasetIO.iter_prefix`
+        axis (int, optional): 0 to count the missing values of each metabolite over
+            all chunks, 1 to count those of each sample. Default is 0.
+
+    Returns:
+        Series: Pandas Series with the metabolite/sample index and the number of missing values.
+    """
+    counts = (count_missing_in_dataframe(chunk_data(chunk), axis) for chunk in chunks)
+    if axis == 1:
+        return pd.concat(counts)
+    n_missing_values = None
+    for count in counts:
+        if n_missing_values is None:
+            n_missing_values = count
+        elif not count.index.equals(n_missing_values.index):
+            raise ValueError("All chunks must hold the same metabolites")
+        else:
+            n_missing_values = n_missing_values + count
+    if n_missing_values is None:
+        raise ValueError("No chunks to count missing values in")
     return n_missing_values
 
 
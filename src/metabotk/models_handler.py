@@ -1,7 +1,10 @@
 import numpy as np
+import pandas as pd
 import statsmodels.formula.api as smf
 import dill
 from metabotk.utils import create_directory
+from metabotk.cache import DiskCache
+from metabotk.storage import _copy_on_write
 
 
 class ModelsHandler:
@@ -33,8 +36,12 @@ class ModelsHandler:
         """
         self.dataset = dataset
         self.merged = self.dataset.ops.merge_sample_metadata_data()
-        self.residuals = self.dataset.data.copy()
-        self.residuals.loc[:] = np.nan
+        self.residuals = pd.DataFrame(
+            np.nan,
+            index=self.dataset.data.index,
+            columns=self.dataset.data.columns,
+            dtype=self.dataset.dtype,
+        )
 
     def fit_linear_model(self, metabolite, formula):
         """
@@ -53,26 +60,43 @@ class ModelsHandler:
         residuals = fitted_model.resid
         return residuals, model
 
-    def get_linear_model_residuals(self, formula, models_path=None):
+    def get_linear_model_residuals(self, formula, models_path=None, cache_dir=None):
         """
         Fit linear model for each metabolite and extract residuals.
 
         Parameters:
             formula (str): list of variables to include in the formula after '~' , in form var1 + var2 + C(var3) where C indicates a categorical variable.
             models_path (str): path to directory where models will be saved
+            cache_dir (str): directory of an on-disk cache; if given, the residuals are reused when
+                the models are fitted again with the same dataset content and formula
+                (models are then only saved by the run that fitted them)
 
         Returns:
             residuals (DataFrame): dataframe of residuals for all metabolites
         """
+        if cache_dir:
+            self.residuals = DiskCache(cache_dir).get_or_compute(
+                "linear_model_residuals",
+                self.dataset.fingerprint,
+                {"formula": formula},
+                lambda: self._fit_residuals(formula, models_path),
+            )
+            return self.residuals
+        return self._fit_residuals(formula, models_path)
+
+    def _fit_residuals(self, formula, models_path=None):
         if formula == "":
-            self.residuals = self.dataset.data.copy()
+            data = self.dataset.data
+            self.residuals = data.copy(deep=False) if _copy_on_write() else data.copy()
             return self.residuals
         else:
             if models_path:
                 create_directory(models_path)
             for metabolite in self.dataset.metabolites:
                 residuals, model = self.fit_linear_model(metabolite, formula)
-                self.residuals[metabolite] = residuals
+                self.residuals[metabolite] = residuals.astype(
+                    self.residuals[metabolite].dtype
+                )
                 if models_path:
                     with open(f"{models_path}/{metabolite}.pickle", "wb") as handle:
                         dill.dump(model, handle)
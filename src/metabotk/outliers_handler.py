@@ -1,7 +1,8 @@
 from typing import Literal
+import warnings
 import numpy as np
 import pandas as pd
-from metabotk.utils import validate_dataframe
+from metabotk.utils import validate_dataframe, iter_blocks, float_values, chunk_data
 
 """
 Module containing functions to detect, count and remove outlier values
@@ -35,6 +36,40 @@ def detect_outliers(data, threshold):
     return is_outlier
 
 
+def detect_outliers_in_array(
+    values: np.ndarray, threshold: float, axis: Literal[0, 1] = 0
+):
+    """
+    Detect outlier values in each column or row of a 2D numerical array.
+
+    Vectorized equivalent of applying `detect_outliers` to every column (axis=0)
+    or row (axis=1) of the array. The array is processed in blocks of columns
+    (or rows), so memory-mapped arrays are never loaded whole.
+
+    Parameters:
+    - values: 2D numerical array
+    - threshold: a factor that determines the range from the IQR
+    - axis: 0 to detect outliers column-wise, 1 to detect them row-wise
+
+    Returns:
+    - Boolean array with the same shape as values, indicating outliers (True) and non-outliers (False)
+    """
+    is_outlier = np.zeros(values.shape, dtype=bool)
+    for _, index in iter_blocks(values.shape, axis):
+        block = values[index]
+        with warnings.catch_warnings():
+            # all-NaN slices produce NaN cutoffs, which never flag a value as outlier
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            q1, median, q3 = np.nanquantile(
+                block, [0.25, 0.5, 0.75], axis=axis, keepdims=True
+            )
+        iqr = q3 - q1
+        cutoff_lower = median - (threshold * iqr)
+        cutoff_upper = median + (threshold * iqr)
+        is_outlier[index] = (block < cutoff_lower) | (block > cutoff_upper)
+    return is_outlier
+
+
 def get_outliers_matrix(
     data_frame: pd.DataFrame, threshold: float, axis: Literal[0, 1] = 0
 ):
@@ -50,10 +85,33 @@ def get_outliers_matrix(
     - pandas DataFrame indicating outliers (True) and non-outliers (False)
     """
     validate_dataframe(data_frame)
-    matrix = data_frame.apply(lambda x: detect_outliers(x, threshold), axis=axis)
+    matrix = pd.DataFrame(
+        detect_outliers_in_array(float_values(data_frame), threshold, axis),
+        index=data_frame.index,
+        columns=data_frame.columns,
+    )
     return matrix
 
 
+def iter_outliers_matrices(chunks, threshold: float):
+    """
+    Get the matrices indicating the outliers of each sample, chunk by chunk.
+
+    Outliers are detected row-wise (within each sample), so each chunk of
+    samples is processed on its own; metabolite-wise outliers need all the
+    samples at once and cannot be detected chunk by chunk.
+
+    Parameters:
+    - chunks: iterable of MetabolomicDataset or DataFrame chunks, e.g. from `DatasetIO.iter_prefix`
+    - threshold: a factor that determines the range from the IQR
+
+    Yields:
+    - pandas DataFrame indicating outliers (True) and non-outliers (False) in each chunk
+    """
+    for chunk in chunks:
+        yield get_outliers_matrix(chunk_data(chunk), threshold, axis=1)
+
+
 def count_outliers(data_frame: pd.DataFrame, threshold: float, axis: Literal[0, 1] = 0):
     """
     Count number of outlier values in each row or column of a dataframe.
@@ -87,6 +145,10 @@ def remove_outliers(
     - pandas DataFrame where the outlier values are replaced by NAs
     """
     validate_dataframe(data_frame)
-    outliers = get_outliers_matrix(data_frame, threshold, axis=axis)
-    data_frame_without_outliers = data_frame.where(~outliers, np.nan)
+    # a single copy of the values, keeping their dtype, is masked in place
+    values = float_values(data_frame, copy=True)
+    values[detect_outliers_in_array(values, threshold, axis)] = np.nan
+    data_frame_without_outliers = pd.DataFrame(
+        values, index=data_frame.index, columns=data_frame.columns, copy=False
+    )
     return data_frame_without_outliers
@@ -1,7 +1,44 @@
+import numpy as np
 import pandas as pd
 import os
 import warnings
+import openpyxl
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Literal
 from metabotk.utils import parse_input, reset_index_if_not_none
+from metabotk.cache import as_parse_cache
+
+# string metadata columns with at most this ratio of unique values to rows are
+# stored as categoricals
+CATEGORICAL_MAX_RATIO = 0.5
+
+# selection of samples or metabolites: a list of IDs, or a function taking the
+# metadata table and returning a boolean mask of the rows to select
+Selection = list[str] | Callable[[pd.DataFrame], pd.Series]
+
+
+def read_excel_sheet(
+    file_path: str | os.PathLike[str], sheet_name: str, cache_dir=None
+) -> pd.DataFrame:
+    """
+    Read a single sheet of an Excel file.
+
+    Args:
+        file_path: path of the Excel file
+        sheet_name: name of the sheet
+        cache_dir: on-disk cache of the parsed sheet, as in `parse_input`; no caching if None
+
+    Returns:
+        DataFrame of the sheet
+    """
+    cache = as_parse_cache(cache_dir)
+    if cache is None:
+        return pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl")
+    return cache.get_or_parse(
+        file_path,
+        {"sheet_name": sheet_name},
+        lambda: pd.read_excel(file_path, sheet_name=sheet_name, engine="openpyxl"),
+    )
 
 
 def read_excel(
@@ -9,20 +46,67 @@ def read_excel(
     sample_metadata_sheet: str = "Sample Meta Data",
     chemical_annotation_sheet: str = "Chemical Annotation",
     data_sheet: str = "Data",
+    max_workers: int = 3,
+    cache_dir=None,
 ) -> dict[str, pd.DataFrame]:
-    sheets = pd.read_excel(file_path, sheet_name=None)
-    dataset_dict = {
-        "sample_metadata": sheets.pop(sample_metadata_sheet),
-        "chemical_annotation": sheets.pop(chemical_annotation_sheet),
-        "data": sheets.pop(data_sheet),
+    """
+    Read the sample metadata, chemical annotation and data sheets of an Excel file.
+
+    Only the three requested sheets are parsed, each from its own read-only
+    (streaming) workbook handle, so they can be parsed concurrently; other
+    sheets of the workbook are never loaded.
+
+    Args:
+        file_path: path of the Excel file
+        sample_metadata_sheet: name of the sample metadata sheet
+        chemical_annotation_sheet: name of the chemical annotation sheet
+        data_sheet: name of the data sheet
+        max_workers: number of sheets parsed at the same time; 1 parses them sequentially
+        cache_dir: on-disk cache of the parsed sheets, as in `parse_input`; no caching if None
+
+    Returns:
+        Dict of dataframes
+
+    Raises:
+        ValueError: if any of the sheets is not found in the workbook
+    """
+    sheet_names = {
+        "sample_metadata": sample_metadata_sheet,
+        "chemical_annotation": chemical_annotation_sheet,
+        "data": data_sheet,
     }
+    cache = as_parse_cache(cache_dir)
+    # the sheet names are only checked when some sheet has to be parsed
+    if cache is None or not all(
+        (file_path, {"sheet_name": name}) in cache for name in sheet_names.values()
+    ):
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        available = workbook.sheetnames
+        workbook.close()
+        missing = [name for name in sheet_names.values() if name not in available]
+        if missing:
+            raise ValueError(
+                f"Sheets {missing} not found, available sheets: {available}"
+            )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            key: executor.submit(read_excel_sheet, file_path, name, cache)
+            for key, name in sheet_names.items()
+        }
+        dataset_dict = {key: future.result() for key, future in futures.items()}
     return dataset_dict
 
 
+def _str_columns(id_column: str | None) -> list[str] | None:
+    return None if id_column is None else [id_column]
+
+
 def read_tables(
     sample_metadata: str | os.PathLike[str] | pd.DataFrame,
     chemical_annotation: str | os.PathLike[str] | pd.DataFrame,
     data: str | os.PathLike[str] | pd.DataFrame,
+    sample_id_column: str | None = None,
+    metabolite_id_column: str | None = None,
 ) -> dict[str, pd.DataFrame]:
     """
 
@@ -30,47 +114,108 @@ def read_tables(
         sample_metadata:
         chemical_annotation:
         data:
+        sample_id_column: if given, data files are parsed with every column other
+            than the sample id column read as float, and the sample id column of
+            the sample metadata is read as strings
+        metabolite_id_column: if given, the metabolite id column of the chemical
+            annotation is read as strings
 
     Returns:
 
     """
     dataset_dict = {
-        "sample_metadata": parse_input(sample_metadata),
-        "chemical_annotation": parse_input(chemical_annotation),
-        "data": parse_input(data),
+        "sample_metadata": parse_input(
+            sample_metadata, str_columns=_str_columns(sample_id_column)
+        ),
+        "chemical_annotation": parse_input(
+            chemical_annotation, str_columns=_str_columns(metabolite_id_column)
+        ),
+        "data": parse_input(data, id_column=sample_id_column),
     }
     return dataset_dict
 
 
-def dataset_from_prefix(prefix: str) -> dict[str, str]:
+# extension added to the dataset files of each prefix format
+PREFIX_FORMATS = {"tsv": "", "parquet": ".parquet"}
+
+
+def split_prefix_format(
+    prefix: str, format: Literal["tsv", "parquet"] | None = None
+) -> tuple[str, str]:
+    """
+    Get the prefix and format of dataset files.
+
+    Args:
+        prefix: prefix of the dataset files; a ".parquet" extension selects the
+            Parquet format and is removed from the prefix
+        format: "tsv" or "parquet"; if None, it is chosen from the extension of
+            the prefix, defaulting to "tsv"
+
+    Returns:
+        Tuple of the prefix without format extension and the format
+
+    Raises:
+        ValueError: if the format is not recognized
+    """
+    for prefix_format, extension in PREFIX_FORMATS.items():
+        if extension and prefix.endswith(extension):
+            prefix = prefix.removesuffix(extension)
+            format = format or prefix_format
+    format = format or "tsv"
+    if format not in PREFIX_FORMATS:
+        raise ValueError(
+            f"Unknown format '{format}', choose one of {list(PREFIX_FORMATS)}"
+        )
+    return prefix, format
+
+
+def dataset_from_prefix(
+    prefix: str, format: Literal["tsv", "parquet"] | None = None
+) -> dict[str, str]:
     """
 
     Args:
         prefix:
+        format: "tsv" or "parquet"; if None, it is chosen from the extension of the prefix
     Returns:
 
     """
+    prefix, format = split_prefix_format(prefix, format)
+    extension = PREFIX_FORMATS[format]
     prefix_dict = {
-        "sample_metadata": f"{prefix}.samples",
-        "chemical_annotation": f"{prefix}.metabolites",
-        "data": f"{prefix}.data",
+        "sample_metadata": f"{prefix}.samples{extension}",
+        "chemical_annotation": f"{prefix}.metabolites{extension}",
+        "data": f"{prefix}.data{extension}",
     }
     return prefix_dict
 
 
-def read_prefix(prefix: str) -> dict[str, pd.DataFrame]:
+def read_prefix(
+    prefix: str,
+    format: Literal["tsv", "parquet"] | None = None,
+    sample_id_column: str | None = None,
+    metabolite_id_column: str | None = None,
+) -> dict[str, pd.DataFrame]:
     """
     Parse files from prefix
     Args:
         prefix: prefix valid for all three dataset files
+        format: "tsv" or "parquet"; if None, it is chosen from the extension of the prefix
+        sample_id_column: if given, the data file is parsed with every column other
+            than the sample id column read as float, and the sample id column of
+            the sample metadata is read as strings
+        metabolite_id_column: if given, the metabolite id column of the chemical
+            annotation is read as strings
     Returns:
         Dict of dataframes
     """
-    prefix_dict = dataset_from_prefix(prefix)
+    prefix_dict = dataset_from_prefix(prefix, format)
     return read_tables(
         sample_metadata=prefix_dict["sample_metadata"],
         chemical_annotation=prefix_dict["chemical_annotation"],
         data=prefix_dict["data"],
+        sample_id_column=sample_id_column,
+        metabolite_id_column=metabolite_id_column,
     )
 
 
@@ -92,17 +237,60 @@ def setup_data(data: pd.DataFrame, sample_id_column: str):
     data = reset_index_if_not_none(data)
     if sample_id_column not in data.columns:
         raise ValueError(f"No sample ID column '{sample_id_column}' found in data")
-    data.columns = [str(i) for i in data.columns]
+    data.columns = coerce_ids(data.columns)
     data.set_index(sample_id_column, inplace=True)
     return data
 
 
-def setup_sample_metadata(sample_metadata: pd.DataFrame, sample_id_column: str):
+def encode_categoricals(
+    data_frame: pd.DataFrame, max_ratio: float = CATEGORICAL_MAX_RATIO
+) -> dict[str, int]:
+    """
+    Store low-cardinality string columns of a DataFrame as categoricals, in place.
+
+    A column is converted when its ratio of unique values to rows is at most
+    max_ratio and the conversion reduces its memory usage.
+
+    Args:
+        data_frame: metadata table
+        max_ratio: maximum ratio of unique values to rows of converted columns
+
+    Returns:
+        Dict with the bytes saved for each converted column
+    """
+    memory_saved = {}
+    if len(data_frame) < 2:
+        return memory_saved
+    for column in data_frame.columns:
+        values = data_frame[column]
+        if not (
+            pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values)
+        ) or isinstance(values.dtype, pd.CategoricalDtype):
+            continue
+        if values.nunique() > max_ratio * len(values):
+            continue
+        encoded = values.astype("category")
+        saved = values.memory_usage(deep=True, index=False) - encoded.memory_usage(
+            deep=True, index=False
+        )
+        if saved > 0:
+            data_frame[column] = encoded
+            memory_saved[column] = int(saved)
+    return memory_saved
+
+
+def setup_sample_metadata(
+    sample_metadata: pd.DataFrame,
+    sample_id_column: str,
+    categorical: bool = False,
+    report: Callable[[dict[str, int]], None] | None = None,
+):
     """
     Args:
         sample_metadata:
         sample_id_column:
-        data:
+        categorical: store low-cardinality string columns as categoricals
+        report: function called with the bytes saved by each categorical column
 
     Returns:
 
@@ -126,17 +314,26 @@ def setup_sample_metadata(sample_metadata: pd.DataFrame, sample_id_column: str):
         sample_metadata.set_index(sample_id_column, inplace=True)
     else:
         raise ValueError(f"No sample ID column '{sample_id_column}' found in data")
+    if categorical:
+        memory_saved = encode_categoricals(sample_metadata)
+        if report is not None:
+            report(memory_saved)
     return sample_metadata
 
 
 def setup_chemical_annotation(
-    chemical_annotation: pd.DataFrame, metabolite_id_column: str
+    chemical_annotation: pd.DataFrame,
+    metabolite_id_column: str,
+    categorical: bool = False,
+    report: Callable[[dict[str, int]], None] | None = None,
 ):
     """
 
     Args:
         chemical_annotation:
         metabolite_id_column:
+        categorical: store low-cardinality string columns as categoricals
+        report: function called with the bytes saved by each categorical column
 
     Returns:
 
@@ -160,4 +357,240 @@ def setup_chemical_annotation(
         chemical_annotation.set_index(metabolite_id_column, inplace=True)
     else:
         raise ValueError("No metabolite ID column found in chemical annotation")
+    if categorical:
+        memory_saved = encode_categoricals(chemical_annotation)
+        if report is not None:
+            report(memory_saved)
     return chemical_annotation
+
+
+"""
+Functions to align the dataset files on their IDs
+"""
+
+
+def _selected_ids(selection) -> pd.Index | None:
+    """
+    IDs of a selection given as a list of IDs; None for no selection or predicates.
+    """
+    if selection is None or callable(selection):
+        return None
+    return coerce_ids(pd.Index(list(selection)))
+
+
+def select_rows(table: pd.DataFrame, ids: pd.Index | None) -> pd.DataFrame:
+    """
+    Keep the rows of a table indexed by ID whose ID is in ids; all rows if ids is None.
+    """
+    if ids is None:
+        return table
+    return table.iloc[_isin(coerce_ids(table.index), ids)]
+
+
+def setup_tables(
+    sample_metadata: str | os.PathLike[str] | pd.DataFrame,
+    chemical_annotation: str | os.PathLike[str] | pd.DataFrame,
+    data: str | os.PathLike[str] | pd.DataFrame,
+    sample_id_column: str,
+    metabolite_id_column: str,
+    categorical: bool = False,
+    max_workers: int = 3,
+    samples: Selection | None = None,
+    metabolites: Selection | None = None,
+    cache_dir=None,
+) -> dict:
+    """
+    Parse and set up the sample metadata, chemical annotation and data of a dataset.
+
+    Each table is parsed and set up in its own thread, so the setup of the
+    metadata tables overlaps with the parsing of the much larger data file, and
+    the latency of opening the three files is paid only once.
+
+    Samples and metabolites can be selected while loading, as lists of IDs or as
+    predicates on the sample metadata or chemical annotation (e.g.
+    `lambda annotation: annotation["SUPER_PATHWAY"] == "Lipid"`). Only the
+    selected columns of data files are parsed, and only the selected rows are
+    kept while parsing them, so the unselected data is never held in memory. The
+    data file is parsed after the metadata table a predicate refers to.
+
+    Args:
+        sample_metadata: sample metadata, as a DataFrame or a file path
+        chemical_annotation: chemical annotation, as a DataFrame or a file path
+        data: data, as a DataFrame or a file path
+        sample_id_column: name of the sample id column
+        metabolite_id_column: name of the metabolite id column
+        categorical: store low-cardinality string metadata columns as categoricals
+        max_workers: number of tables processed at the same time; 1 processes them sequentially
+        samples: IDs of the samples to load, or function taking the set up sample
+            metadata and returning a boolean mask of the samples to load; all if None
+        metabolites: IDs of the metabolites to load, or function taking the set up
+            chemical annotation and returning a boolean mask of the metabolites to load;
+            all if None
+        cache_dir: on-disk cache of the parsed files, as in `parse_input`; no caching if None
+
+    Returns:
+        Dict with the set up "data", "sample_metadata" and "chemical_annotation",
+        and a "categorical_report" dict with the bytes saved by each categorical column
+    """
+    categorical_report = {"sample_metadata": {}, "chemical_annotation": {}}
+    selected = {
+        "sample_metadata": _selected_ids(samples),
+        "chemical_annotation": _selected_ids(metabolites),
+    }
+    futures = {}
+    tables = {}
+
+    def wait_for(key):
+        if futures:
+            futures[key].result()
+
+    def setup_metadata(key, setup, table, id_column, selection):
+        table = setup(
+            parse_input(table, cache_dir=cache_dir, str_columns=[id_column]),
+            id_column,
+            categorical=categorical,
+            report=lambda saved: categorical_report.update({key: saved}),
+        )
+        if callable(selection):
+            mask = np.asarray(selection(table), dtype=bool)
+            selected[key] = coerce_ids(table.index[mask])
+        return select_rows(table, selected[key])
+
+    def setup_selected_data():
+        if callable(samples):
+            wait_for("sample_metadata")
+        if callable(metabolites):
+            wait_for("chemical_annotation")
+        sample_ids = selected["sample_metadata"]
+        metabolite_ids = selected["chemical_annotation"]
+        data_frame = setup_data(
+            parse_input(
+                data,
+                id_column=sample_id_column,
+                usecols=metabolite_ids,
+                ids=sample_ids,
+                cache_dir=cache_dir,
+            ),
+            sample_id_column,
+        )
+        data_frame = select_rows(data_frame, sample_ids)
+        if metabolite_ids is not None:
+            data_frame = data_frame.iloc[
+                :, _isin(coerce_ids(data_frame.columns), metabolite_ids)
+            ]
+        return data_frame
+
+    # the metadata tables come first, so that the data can wait for them
+    tasks = {
+        "sample_metadata": lambda: setup_metadata(
+            "sample_metadata",
+            setup_sample_metadata,
+            sample_metadata,
+            sample_id_column,
+            samples,
+        ),
+        "chemical_annotation": lambda: setup_metadata(
+            "chemical_annotation",
+            setup_chemical_annotation,
+            chemical_annotation,
+            metabolite_id_column,
+            metabolites,
+        ),
+        "data": setup_selected_data,
+    }
+    if max_workers == 1:
+        for key, task in tasks.items():
+            tables[key] = task()
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key, task in tasks.items():
+                futures[key] = executor.submit(task)
+            tables = {key: future.result() for key, future in futures.items()}
+    tables["categorical_report"] = categorical_report
+    return tables
+
+
+def coerce_ids(index: pd.Index) -> pd.Index:
+    """
+    Convert an index of IDs to strings, in a single vectorized pass.
+
+    Indexes already holding only strings are returned unchanged.
+
+    Args:
+        index: index of sample or metabolite IDs
+
+    Returns:
+        Index of string IDs, with the same name
+    """
+    if pd.api.types.infer_dtype(index, skipna=False) == "string":
+        return index
+    return index.astype(str)
+
+
+def _isin(index: pd.Index, other: pd.Index) -> np.ndarray:
+    """
+    Boolean mask of the elements of index found in other, using a hashed lookup.
+    """
+    if other.is_unique:
+        return other.get_indexer(index) != -1
+    return index.isin(other)
+
+
+def align_tables(
+    data: pd.DataFrame,
+    sample_metadata: pd.DataFrame,
+    chemical_annotation: pd.DataFrame,
+) -> dict:
+    """
+    Align data, sample metadata and chemical annotation on their IDs.
+
+    IDs are coerced to strings once; samples and metabolites are then matched
+    with hashed index lookups. Only samples found in both the data and the sample
+    metadata, and metabolites found in both the data and the chemical annotation,
+    are kept, in the order of the data.
+
+    Args:
+        data: data indexed by sample ID, with metabolite IDs as columns
+        sample_metadata: sample metadata indexed by sample ID
+        chemical_annotation: chemical annotation indexed by metabolite ID
+
+    Returns:
+        Dict with the aligned "data", "sample_metadata" and "chemical_annotation",
+        and an "alignment_report" dict listing the IDs dropped from each side:
+        "samples_only_in_data", "samples_only_in_sample_metadata",
+        "metabolites_only_in_data", "metabolites_only_in_chemical_annotation"
+    """
+    data.index = coerce_ids(data.index)
+    data.columns = coerce_ids(data.columns)
+    sample_metadata.index = coerce_ids(sample_metadata.index)
+    chemical_annotation.index = coerce_ids(chemical_annotation.index)
+
+    samples_in_metadata = _isin(data.index, sample_metadata.index)
+    metabolites_in_annotation = _isin(data.columns, chemical_annotation.index)
+    report = {
+        "samples_only_in_data": list(data.index[~samples_in_metadata]),
+        "samples_only_in_sample_metadata": list(
+            sample_metadata.index[~_isin(sample_metadata.index, data.index)]
+        ),
+        "metabolites_only_in_data": list(data.columns[~metabolites_in_annotation]),
+        "metabolites_only_in_chemical_annotation": list(
+            chemical_annotation.index[~_isin(chemical_annotation.index, data.columns)]
+        ),
+    }
+    if report["samples_only_in_data"]:
+        warnings.warn(
+            f"{len(report['samples_only_in_data'])} samples in the data were not "
+            "found in the sample metadata and were dropped"
+        )
+    if not (samples_in_metadata.all() and metabolites_in_annotation.all()):
+        data = data.iloc[
+            np.flatnonzero(samples_in_metadata),
+            np.flatnonzero(metabolites_in_annotation),
+        ]
+    dataset_dict = {
+        "data": data,
+        "sample_metadata": sample_metadata.loc[data.index],
+        "chemical_annotation": chemical_annotation.loc[data.columns],
+        "alignment_report": report,
+    }
+    return dataset_dict
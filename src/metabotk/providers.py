@@ -0,0 +1,125 @@
+"""
+Readers of the data formats of metabolomics providers
+"""
+
+import os
+import openpyxl
+import pandas as pd
+from metabotk.parse_and_setup import read_excel, read_excel_sheet, setup_data
+
+# data sheets of Metabolon Client Data Tables, and the names of their layers
+CDT_DATA_SHEETS = {
+    "Peak Area Data": "peak_area",
+    "Batch-normalized Data": "batch_normalized",
+    "Batch-norm Imputed Data": "batch_normalized_imputed",
+    "Log Transformed Data": "log_transformed",
+}
+
+
+class MetabolonCDT:
+    """
+    Reader of Metabolon Client Data Table (CDT) Excel workbooks.
+
+    The sheet names of the workbook are indexed when the reader is created,
+    without parsing any sheet. The sample metadata, the chemical annotation and
+    one data sheet are then read with `read_tables`, and the other data sheets
+    can be read one at a time with `read_layer`, e.g. as lazy dataset layers.
+
+    Attributes:
+        file_path: path of the CDT workbook
+        sample_metadata_sheet: name of the sample metadata sheet
+        chemical_annotation_sheet: name of the chemical annotation sheet
+        data_sheets: dict of the data sheets found in the workbook, by layer name
+            ("peak_area", "batch_normalized", "batch_normalized_imputed", "log_transformed")
+    """
+
+    def __init__(
+        self,
+        file_path: str | os.PathLike[str],
+        sample_metadata_sheet: str = "Sample Meta Data",
+        chemical_annotation_sheet: str = "Chemical Annotation",
+        cache_dir=None,
+    ) -> None:
+        """
+        Initialize the class.
+
+        Parameters:
+            file_path (str): path of the CDT workbook
+            sample_metadata_sheet (str): name of the sample metadata sheet
+            chemical_annotation_sheet (str): name of the chemical annotation sheet
+            cache_dir: on-disk cache of the parsed sheets, as in `parse_input`; no caching if None
+
+        Raises:
+            ValueError: if the metadata sheets or all the data sheets are missing
+        """
+        self.file_path = file_path
+        self.sample_metadata_sheet = sample_metadata_sheet
+        self.chemical_annotation_sheet = chemical_annotation_sheet
+        self._cache_dir = cache_dir
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        sheet_names = workbook.sheetnames
+        workbook.close()
+        missing = [
+            name
+            for name in [sample_metadata_sheet, chemical_annotation_sheet]
+            if name not in sheet_names
+        ]
+        if missing:
+            raise ValueError(
+                f"Sheets {missing} not found, available sheets: {sheet_names}"
+            )
+        self.data_sheets = {
+            layer: sheet
+            for sheet, layer in CDT_DATA_SHEETS.items()
+            if sheet in sheet_names
+        }
+        if not self.data_sheets:
+            raise ValueError(
+                f"No data sheets found, expected any of {list(CDT_DATA_SHEETS)}"
+            )
+
+    @property
+    def layers(self) -> list[str]:
+        return list(self.data_sheets)
+
+    def _sheet(self, layer: str) -> str:
+        if layer not in self.data_sheets:
+            raise KeyError(
+                f"No data sheet for layer '{layer}', available layers: {self.layers}"
+            )
+        return self.data_sheets[layer]
+
+    def read_tables(self, layer: str | None = None) -> dict[str, pd.DataFrame]:
+        """
+        Read the sample metadata, the chemical annotation and a data sheet.
+
+        Parameters:
+            layer (str): layer of the data sheet to read; the first available of
+                "peak_area", "batch_normalized", "batch_normalized_imputed" and
+                "log_transformed" if None
+
+        Returns:
+            Dict of dataframes
+        """
+        layer = self.layers[0] if layer is None else layer
+        return read_excel(
+            self.file_path,
+            sample_metadata_sheet=self.sample_metadata_sheet,
+            chemical_annotation_sheet=self.chemical_annotation_sheet,
+            data_sheet=self._sheet(layer),
+            cache_dir=self._cache_dir,
+        )
+
+    def read_layer(self, layer: str, sample_id_column: str) -> pd.DataFrame:
+        """
+        Read a data sheet, indexed by sample id.
+
+        Parameters:
+            layer (str): layer of the data sheet
+            sample_id_column (str): name of the sample id column
+
+        Returns:
+            data with samples as rows and metabolites as columns
+        """
+        data = read_excel_sheet(self.file_path, self._sheet(layer), self._cache_dir)
+        return setup_data(data, sample_id_column)
@@ -1,3 +1,7 @@
+import pandas as pd
+from metabotk.utils import chunk_data
+
+
 class ScalingHandler:
     """
     Class for performing scaling procedures on metabolomics data.
@@ -16,8 +20,8 @@ class ScalingHandler:
         """
         Scale by dividing each metabolite value by the Total Sum Abundance (TSA) of its sample
         """
-        tsa = self._dataset_manager.data.sum(axis=1).to_dict()
-        scaled = self._dataset_manager.data.apply(lambda x: x / tsa[x.name], axis=1)
+        data = self._dataset_manager.data
+        scaled = data.div(data.sum(axis=1), axis=0)
         if inplace:
             self._dataset_manager.data = scaled
         else:
@@ -32,3 +36,28 @@ class ScalingHandler:
             self._dataset_manager.data = scaled
         else:
             return scaled
+
+
+def iter_tsa(chunks):
+    """
+    Scale chunks of samples by their Total Sum Abundance (TSA), one chunk at a time.
+
+    TSA scaling only depends on the values of each sample, so chunks of samples
+    can be scaled independently. Dataset chunks get the scaled data set on them
+    and are yielded back, while DataFrame chunks are left unchanged and yielded
+    as new scaled DataFrames.
+
+    Parameters:
+        chunks: iterable of MetabolomicDataset or DataFrame chunks, e.g. from `DatasetIO.iter_prefix`
+
+    Yields:
+        scaled chunks, of the same type as the input chunks
+    """
+    for chunk in chunks:
+        data = chunk_data(chunk)
+        scaled = data.div(data.sum(axis=1), axis=0)
+        if isinstance(chunk, pd.DataFrame):
+            yield scaled
+        else:
+            chunk.data = scaled
+            yield chunk
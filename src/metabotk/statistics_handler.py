@@ -2,14 +2,29 @@
 Statistics module
 """
 
+import warnings
 import pandas as pd
 import numpy as np
 from typing import Literal
-from metabotk.utils import ensure_numeric_data
+from metabotk.utils import ensure_numeric_data, iter_blocks, float_values, chunk_data
 
 import metabotk.outliers_handler as outliers
 import metabotk.missing_handler as missing
 
+STATISTICS = [
+    "count",
+    "mean",
+    "std",
+    "min",
+    "25%",
+    "median",
+    "75%",
+    "max",
+    "CV%",
+    "missing",
+    "outliers",
+]
+
 
 def compute_correlations(
     data_frame: pd.DataFrame, method: str = "pearson"
@@ -44,6 +59,21 @@ def get_top_n_correlations(
         for each id and their values.
     """
     correlations = compute_correlations(data_frame, method)
+    return get_top_n_from_correlations(correlations, n)
+
+
+def get_top_n_from_correlations(correlations: pd.DataFrame, n: int = 10):
+    """
+    Get the top n correlations for each column of a correlation matrix.
+
+    Parameters:
+        correlations (DataFrame): Square correlation matrix.
+        n (int): Number of top correlations to return. Default is 10.
+
+    Returns:
+        DataFrame: Pandas DataFrame containing top n correlations
+        for each id and their values.
+    """
     top_correlations = []
 
     for id in correlations.columns:
@@ -93,6 +123,9 @@ def total_sum_abundance(data_frame, exclude_incomplete=True):
     """
     Computes total sum abundance (TSA) row-wise
 
+    Rows are summed in blocks, so memory-mapped data is never loaded whole.
+    Sums are accumulated in float64 whatever the dtype of the data.
+
     Parameters:
         data_frame (DataFrame): pandas DataFrame containing numerical data.
         exclude_incomplete (bool): option to exclude columns containing incomplete values
@@ -101,12 +134,16 @@ def total_sum_abundance(data_frame, exclude_incomplete=True):
     Returns:
         Series: Pandas Series containing TSA values for each row.
     """
+    values = float_values(data_frame)
     if exclude_incomplete:
-        data_frame = data_frame.dropna(axis=1).copy()
-    else:
-        data_frame = data_frame.copy()
-    tsa = data_frame.sum(axis=1, skipna=True)
-    tsa.name = "TSA"
+        complete = missing.count_missing_in_array(values, axis=0) == 0
+    tsa = np.zeros(len(data_frame))
+    for block, index in iter_blocks(values.shape, axis=1):
+        block_values = values[index]
+        if exclude_incomplete:
+            block_values = block_values[:, complete]
+        tsa[block] = np.nansum(block_values, axis=1, dtype=np.float64)
+    tsa = pd.Series(tsa, index=data_frame.index, name="TSA")
     return tsa
 
 
@@ -147,6 +184,57 @@ def compute_statistics(data, outlier_threshold):
     return stats
 
 
+def compute_array_statistics(values, outlier_threshold, axis=0):
+    """
+    Computes basic statistics along an axis of a 2D numerical array.
+
+    Vectorized equivalent of applying `compute_statistics` to every column
+    (axis=0) or row (axis=1) of the array, working directly on the raw block.
+    The array is processed in blocks of columns (or rows), so memory-mapped
+    arrays are never loaded whole. Each block is upcast to float64, so that
+    means, standard deviations and CV% of float32 data keep their precision.
+
+    Parameters:
+        values (np.ndarray): 2D array containing numerical values.
+        outlier_threshold (float): Threshold for outlier detection.
+        axis (int): Which axis to compute statistics on (0 column-wise, 1 row-wise).
+
+    Returns:
+        np.ndarray: Array of shape (len(STATISTICS), n) with one row per statistic.
+    """
+    stats = np.empty((len(STATISTICS), values.shape[1 - axis]), dtype=np.float64)
+    for block, index in iter_blocks(values.shape, axis):
+        stats[:, block] = _compute_block_statistics(
+            np.asarray(values[index], dtype=np.float64), outlier_threshold, axis
+        )
+    return stats
+
+
+def _compute_block_statistics(values, outlier_threshold, axis):
+    is_missing = np.isnan(values)
+    with warnings.catch_warnings():
+        # empty or single-value slices yield NaN, as in pandas' describe
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        mean = np.nanmean(values, axis=axis)
+        q1, median, q3 = np.nanquantile(values, [0.25, 0.5, 0.75], axis=axis)
+        stats = [
+            (~is_missing).sum(axis=axis),
+            mean,
+            np.nanstd(values, axis=axis, ddof=1),
+            np.nanmin(values, axis=axis),
+            q1,
+            median,
+            q3,
+            np.nanmax(values, axis=axis),
+            np.nanstd(values, axis=axis) / mean * 100,
+            is_missing.sum(axis=axis),
+            outliers.detect_outliers_in_array(values, outlier_threshold, axis).sum(
+                axis=axis
+            ),
+        ]
+    return np.vstack(stats)
+
+
 def compute_dataframe_statistics(data_frame, outlier_threshold, axis):
     """
     Computes basic statistics for a pandas DataFrame.
@@ -171,15 +259,119 @@ def compute_dataframe_statistics(data_frame, outlier_threshold, axis):
         - Number of missing values
         - Number of outliers
     """
-    stats = data_frame.apply(
-        lambda x: compute_statistics(x, outlier_threshold=outlier_threshold),
-        axis=axis,
+    stats = compute_array_statistics(float_values(data_frame), outlier_threshold, axis)
+    stats = pd.DataFrame(
+        stats.transpose(),
+        index=data_frame.columns if axis == 0 else data_frame.index,
+        columns=STATISTICS,
     )
-    if axis == 0:
-        stats = stats.transpose()
     return stats
 
 
+class StatisticsAccumulator:
+    """
+    Metabolite-wise statistics accumulated over chunks of samples.
+
+    The count, mean, standard deviation, min, max, CV% and number of missing
+    values of each metabolite are updated one chunk at a time, merging the
+    moments of each chunk in float64 (Chan et al.'s parallel algorithm), so the
+    results match those of `compute_dataframe_statistics` on the whole data.
+    Quantiles and outliers need all the samples at once and are not computed.
+
+    Attributes:
+        columns: metabolite ids, set by the first chunk
+    """
+
+    def __init__(self) -> None:
+        self.columns = None
+
+    def update(self, chunk) -> None:
+        """
+        Add a chunk of samples to the statistics.
+
+        Parameters:
+            chunk: MetabolomicDataset or DataFrame with samples as rows and metabolites as columns
+
+        Raises:
+            ValueError: if the metabolites of the chunk differ from those of the first chunk
+        """
+        data_frame = chunk_data(chunk)
+        if self.columns is None:
+            self.columns = data_frame.columns
+            n_columns = len(self.columns)
+            self._count = np.zeros(n_columns)
+            self._mean = np.zeros(n_columns)
+            self._m2 = np.zeros(n_columns)
+            self._min = np.full(n_columns, np.nan)
+            self._max = np.full(n_columns, np.nan)
+            self._missing = np.zeros(n_columns)
+        elif not data_frame.columns.equals(self.columns):
+            raise ValueError("All chunks must hold the same metabolites")
+        values = np.asarray(float_values(data_frame), dtype=np.float64)
+        is_missing = np.isnan(values)
+        count = (~is_missing).sum(axis=0)
+        with warnings.catch_warnings():
+            # all-missing columns of a chunk do not change the statistics
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            mean = np.nan_to_num(np.nanmean(values, axis=0))
+            m2 = np.nansum((values - mean) ** 2, axis=0)
+            self._min = np.fmin(self._min, np.nanmin(values, axis=0))
+            self._max = np.fmax(self._max, np.nanmax(values, axis=0))
+        total = self._count + count
+        weight = np.divide(count, total, out=np.zeros_like(total), where=total > 0)
+        delta = mean - self._mean
+        self._mean = self._mean + delta * weight
+        self._m2 = self._m2 + m2 + delta**2 * self._count * weight
+        self._count = total
+        self._missing = self._missing + is_missing.sum(axis=0)
+
+    def result(self) -> pd.DataFrame:
+        """
+        Get the statistics of the chunks added so far.
+
+        Returns:
+            DataFrame with the metabolite ids as index and the count, mean, std, min,
+            max, CV% and missing statistics as columns
+        """
+        if self.columns is None:
+            raise ValueError("No chunks were added to the statistics")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(self._count > 0, self._mean, np.nan)
+            std = np.sqrt(self._m2 / (self._count - 1))
+            std[self._count < 2] = np.nan
+            cv = np.sqrt(self._m2 / self._count) / mean * 100
+        stats = pd.DataFrame(
+            {
+                "count": self._count,
+                "mean": mean,
+                "std": std,
+                "min": self._min,
+                "max": self._max,
+                "CV%": cv,
+                "missing": self._missing,
+            },
+            index=self.columns,
+        )
+        return stats
+
+
+def accumulate_statistics(chunks) -> pd.DataFrame:
+    """
+    Compute metabolite-wise statistics over chunks of samples, in one pass.
+
+    Parameters:
+        chunks: iterable of MetabolomicDataset or DataFrame chunks holding the same
+            metabolites, e.g. from `DatasetIO.iter_prefix`
+
+    Returns:
+        DataFrame of statistics, as in `StatisticsAccumulator.result`
+    """
+    accumulator = StatisticsAccumulator()
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.result()
+
+
 class Statistics:
     """
     Class for obtaining basic statistics about the data.
@@ -235,12 +427,14 @@ class Statistics:
                 "No data available. Please import data before computing statistics."
             )
 
-        # Compute statistics using StatisticsHandler
-        metabolite_stats = compute_dataframe_statistics(
-            self.dataset.data, outlier_threshold, axis=0
+        # Compute statistics using StatisticsHandler, reusing cached results
+        return self.dataset.cache.get_or_compute(
+            "metabolite_stats",
+            {"outlier_threshold": outlier_threshold},
+            lambda: compute_dataframe_statistics(
+                self.dataset.data, outlier_threshold, axis=0
+            ),
         )
-        # self.metabolite_stats=metabolite_stats
-        return metabolite_stats
 
     def sample_stats(self, outlier_threshold=5):
         """
@@ -259,6 +453,13 @@ class Statistics:
             raise ValueError(
                 "No data available. Please import data before computing statistics."
             )
+        return self.dataset.cache.get_or_compute(
+            "sample_stats",
+            {"outlier_threshold": outlier_threshold},
+            lambda: self._compute_sample_stats(outlier_threshold),
+        )
+
+    def _compute_sample_stats(self, outlier_threshold):
         sample_stats = compute_dataframe_statistics(
             self.dataset.data, outlier_threshold, axis=1
         )
@@ -278,10 +479,18 @@ class Statistics:
         return sample_stats
 
     def corr(self, method: str = "pearson"):
-        return compute_correlations(self.dataset.data, method)
+        return self.dataset.cache.get_or_compute(
+            "corr",
+            {"method": method},
+            lambda: compute_correlations(self.dataset.data, method),
+        )
 
     def top_corr(self, n: int = 10, method: str = "pearson"):
-        return get_top_n_correlations(self.dataset.data, n, method)
+        return self.dataset.cache.get_or_compute(
+            "top_corr",
+            {"n": n, "method": method},
+            lambda: get_top_n_from_correlations(self.corr(method), n),
+        )
 
     def remove_outliers(
         self, threshold: float, on: Literal["samples", "metabolites"] = "metabolites"
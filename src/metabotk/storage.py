@@ -0,0 +1,418 @@
+"""
+Storage backends for the abundance matrix of a MetabolomicDataset.
+
+Three storage modes are available:
+    - "frame": the matrix is kept as a pandas DataFrame (default)
+    - "array": the matrix is kept as one contiguous C-ordered NumPy float block,
+      with the sample and metabolite IDs held as separate indexes; the DataFrame
+      returned by `to_frame` is a zero-copy view built on demand
+    - "memmap": like "array", but the block is memory-mapped from a .npy file,
+      so only the parts that are accessed are read from disk. Memory-mapped
+      storages can only be opened from files (`MemmapStorage.open`); data set
+      from a DataFrame in this mode is kept in memory as an "array" block
+
+Any storage can also be viewed through integer row and column selectors
+(`take`), which gives a read-only ViewStorage that only copies data when it is
+materialized or replaced.
+
+All storages can follow a dtype policy: with dtype="float32" the matrix is
+stored in single precision, halving its memory footprint. `precision_loss`
+reports how much precision is lost by the conversion.
+"""
+
+from typing import Literal
+import numpy as np
+import pandas as pd
+from metabotk.utils import iter_blocks
+
+StorageMode = Literal["frame", "array", "memmap"]
+FloatDtype = Literal["float32", "float64"]
+
+
+class FrameStorage:
+    """
+    Abundance matrix stored as a pandas DataFrame.
+
+    Attributes:
+        dtype: dtype every column is cast to, or None to keep the input dtypes
+    """
+
+    mode = "frame"
+    is_view = False
+
+    def __init__(self, frame: pd.DataFrame, dtype: FloatDtype | None = None) -> None:
+        self._frame = frame
+        self.dtype = None if dtype is None else np.dtype(dtype)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dtype: FloatDtype | None = None):
+        if dtype is not None and (frame.dtypes != np.dtype(dtype)).any():
+            frame = frame.astype(dtype)
+        return cls(frame, dtype)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._frame.shape
+
+    @property
+    def index(self) -> pd.Index:
+        return self._frame.index
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._frame.columns
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._frame.to_numpy()
+
+    def to_frame(self) -> pd.DataFrame:
+        return self._frame
+
+    def replace(self, new_frame: pd.DataFrame):
+        """
+        Return a storage of the same kind and dtype holding new_frame.
+        """
+        return FrameStorage.from_frame(new_frame, self.dtype)
+
+    def take(self, rows: np.ndarray, cols: np.ndarray):
+        return ViewStorage(self, rows, cols)
+
+
+class ArrayStorage:
+    """
+    Abundance matrix stored as a single C-ordered float block.
+
+    Attributes:
+        values: 2D np.ndarray with samples as rows and metabolites as columns
+        index: pd.Index of sample ids
+        columns: pd.Index of metabolite ids
+    """
+
+    mode = "array"
+    is_view = False
+
+    def __init__(self, values: np.ndarray, index: pd.Index, columns: pd.Index) -> None:
+        values = np.ascontiguousarray(values)
+        if not np.issubdtype(values.dtype, np.floating):
+            values = values.astype(np.float64)
+        if values.ndim != 2 or values.shape != (len(index), len(columns)):
+            raise ValueError("Block shape must match the sample and metabolite indexes")
+        self._values = values
+        self._index = index
+        self._columns = columns
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dtype: FloatDtype | None = None):
+        return cls(
+            values=frame.to_numpy(dtype=np.float64 if dtype is None else dtype),
+            index=frame.index,
+            columns=frame.columns,
+        )
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._values.dtype
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self._values.shape
+
+    @property
+    def index(self) -> pd.Index:
+        return self._index
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._columns
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Build a DataFrame sharing memory with the block; writes to the returned
+        frame are reflected in the block.
+        """
+        return pd.DataFrame(
+            self._values, index=self._index, columns=self._columns, copy=False
+        )
+
+    def replace(self, new_frame: pd.DataFrame):
+        """
+        Return a storage of the same kind and dtype holding new_frame.
+        """
+        return ArrayStorage.from_frame(new_frame, self.dtype)
+
+    def take(self, rows: np.ndarray, cols: np.ndarray):
+        return ViewStorage(self, rows, cols)
+
+
+class MemmapStorage(ArrayStorage):
+    """
+    Abundance matrix memory-mapped from a .npy file.
+
+    Replacing the data never writes to the file: the new data is kept in memory
+    as an ArrayStorage.
+
+    Attributes:
+        values: np.memmap with samples as rows and metabolites as columns
+        index: pd.Index of sample ids
+        columns: pd.Index of metabolite ids
+        path: path of the .npy file
+    """
+
+    mode = "memmap"
+
+    def __init__(
+        self,
+        values: np.ndarray,
+        index: pd.Index,
+        columns: pd.Index,
+        path: str | None = None,
+    ) -> None:
+        # contiguity is not enforced, since it would read the whole file in memory
+        if values.ndim != 2 or values.shape != (len(index), len(columns)):
+            raise ValueError("Block shape must match the sample and metabolite indexes")
+        self._values = values
+        self._index = index
+        self._columns = columns
+        self.path = path
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        index: pd.Index,
+        columns: pd.Index,
+        mmap_mode: Literal["r", "r+", "c"] = "r",
+    ):
+        """
+        Memory-map a .npy file holding the abundance matrix.
+
+        Parameters:
+            path (str): path of the .npy file
+            index (pd.Index): sample ids, in the order of the rows of the file
+            columns (pd.Index): metabolite ids, in the order of the columns of the file
+            mmap_mode (str): "r" for read-only access (default), "r+" to write
+                changes back to the file, "c" for copy-on-write
+
+        Returns:
+            MemmapStorage instance
+        """
+        values = np.load(path, mmap_mode=mmap_mode)
+        if not np.issubdtype(values.dtype, np.floating):
+            raise ValueError(
+                f"Memory-mapped data must be floating point, not {values.dtype}"
+            )
+        return cls(values, index, columns, path)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, dtype: FloatDtype | None = None):
+        return ArrayStorage.from_frame(frame, dtype)
+
+
+def _as_slice(positions: np.ndarray) -> slice | np.ndarray:
+    """
+    Convert evenly spaced increasing positions to a slice, so that they can be
+    used for basic (zero-copy) indexing; other positions are returned unchanged.
+    """
+    if len(positions) == 0:
+        return slice(0, 0)
+    if len(positions) == 1:
+        return slice(positions[0], positions[0] + 1)
+    steps = np.diff(positions)
+    if steps[0] > 0 and (steps == steps[0]).all():
+        return slice(positions[0], positions[-1] + 1, steps[0])
+    return positions
+
+
+def _copy_on_write() -> bool:
+    """
+    Whether pandas copy-on-write is enabled: always with pandas >= 3, opt-in before.
+    """
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.get_option("mode.copy_on_write") is True
+
+
+class ViewStorage:
+    """
+    Read-only view over the data of a parent storage.
+
+    The view stores the parent storage together with integer row and column
+    selectors. The selected data is only taken on first access, and without
+    copying when the selectors are evenly spaced ranges. Replacing the data
+    materializes an independent storage of the parent's kind.
+
+    Attributes:
+        mode: storage mode of the parent ("frame", "array" or "memmap")
+        dtype: dtype policy of the parent
+    """
+
+    is_view = True
+
+    def __init__(self, base, rows: np.ndarray, cols: np.ndarray) -> None:
+        self._base = base
+        self._rows = np.asarray(rows, dtype=np.intp)
+        self._cols = np.asarray(cols, dtype=np.intp)
+        self._index = base.index[self._rows]
+        self._columns = base.columns[self._cols]
+        self._frame = None
+        self.mode = base.mode
+        self.dtype = base.dtype
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (len(self._rows), len(self._cols))
+
+    @property
+    def index(self) -> pd.Index:
+        return self._index
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._columns
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.to_frame().to_numpy()
+
+    def to_frame(self) -> pd.DataFrame:
+        if self._frame is None:
+            rows, cols = _as_slice(self._rows), _as_slice(self._cols)
+            if self.mode == "frame":
+                # with copy-on-write, writes to the selection never reach the parent;
+                # without it, the selection is copied to keep the parent isolated
+                frame = self._base.to_frame().iloc[rows, cols]
+                if not _copy_on_write():
+                    frame = frame.copy()
+            else:
+                if isinstance(rows, slice) or isinstance(cols, slice):
+                    values = self._base.values[rows, cols]
+                else:
+                    values = self._base.values[np.ix_(rows, cols)]
+                values.setflags(write=False)
+                frame = pd.DataFrame(
+                    values, index=self._index, columns=self._columns, copy=False
+                )
+            self._frame = frame
+        return self._frame
+
+    def replace(self, new_frame: pd.DataFrame):
+        """
+        Return an independent storage of the parent's kind and dtype holding new_frame.
+        """
+        return make_storage(new_frame, self.mode, self.dtype)
+
+    def take(self, rows: np.ndarray, cols: np.ndarray):
+        return ViewStorage(self._base, self._rows[rows], self._cols[cols])
+
+    def materialize(self):
+        """
+        Return an independent, writable copy of the view in the parent's storage
+        mode; views over memory-mapped data are copied to memory.
+
+        The selection is taken once from the parent: fancy indexing already
+        copies, so only selections made of slices, which are views, are copied.
+        """
+        rows, cols = _as_slice(self._rows), _as_slice(self._cols)
+        is_view = isinstance(rows, slice) and isinstance(cols, slice)
+        if self.mode == "frame":
+            frame = self._base.to_frame()
+            if is_view:
+                return FrameStorage(frame.iloc[rows, cols].copy(), self.dtype)
+            if frame.dtypes.nunique() > 1:
+                # mixed dtypes cannot be taken as one block
+                return FrameStorage(frame.iloc[rows, cols], self.dtype)
+            values = frame.to_numpy()
+        else:
+            values = self._base.values
+        if is_view:
+            values = np.array(values[rows, cols], order="C")
+        elif isinstance(rows, slice) or isinstance(cols, slice):
+            values = np.ascontiguousarray(values[rows, cols])
+        else:
+            values = values[np.ix_(rows, cols)]
+        if self.mode == "frame":
+            frame = pd.DataFrame(
+                values, index=self._index, columns=self._columns, copy=False
+            )
+            return FrameStorage(frame, self.dtype)
+        return ArrayStorage(values, self._index, self._columns)
+
+
+def make_storage(
+    data: pd.DataFrame,
+    mode: StorageMode = "frame",
+    dtype: FloatDtype | None = None,
+):
+    """
+    Wrap a DataFrame in the storage backend matching mode.
+
+    Storage instances are returned unchanged. DataFrames cannot be memory-mapped
+    without a file, so in "memmap" mode they are stored as an in-memory array.
+
+    Args:
+        data: metabolomic data, with samples as rows and metabolites as columns
+        mode: "frame", "array" or "memmap"
+        dtype: "float32" or "float64" to cast the data; None keeps the dtypes of
+            frames and stores arrays as float64
+
+    Returns:
+        storage instance
+
+    Raises:
+        ValueError: if the mode is not recognized
+    """
+    if isinstance(data, (FrameStorage, ArrayStorage, ViewStorage)):
+        return data
+    if mode == "frame":
+        return FrameStorage.from_frame(data, dtype)
+    elif mode in ("array", "memmap"):
+        return ArrayStorage.from_frame(data, dtype)
+    else:
+        raise ValueError(f"Unknown storage mode '{mode}'")
+
+
+def precision_loss(original: pd.DataFrame, converted: pd.DataFrame) -> dict:
+    """
+    Summarize the precision lost when converting data to a lower precision dtype.
+
+    The comparison is done in float64, in blocks of rows.
+
+    Args:
+        original: data before the conversion
+        converted: data after the conversion, with the same shape
+
+    Returns:
+        Dict with the "dtype" of the converted data, the largest absolute and
+        relative errors ("max_abs_error", "max_rel_error"), the number of finite
+        values that became infinite ("n_overflow") and the number of non-zero
+        values that became zero ("n_underflow")
+    """
+    max_abs_error = max_rel_error = 0.0
+    n_overflow = n_underflow = 0
+    for block, _ in iter_blocks(original.shape, axis=1):
+        before = original.iloc[block].to_numpy(dtype=np.float64)
+        after = converted.iloc[block].to_numpy(dtype=np.float64)
+        finite = np.isfinite(before)
+        n_overflow += int((finite & np.isinf(after)).sum())
+        n_underflow += int(((before != 0) & finite & (after == 0)).sum())
+        comparable = finite & np.isfinite(after)
+        error = np.abs(before[comparable] - after[comparable])
+        if error.size:
+            max_abs_error = max(max_abs_error, float(error.max()))
+            nonzero = before[comparable] != 0
+            if nonzero.any():
+                relative = error[nonzero] / np.abs(before[comparable][nonzero])
+                max_rel_error = max(max_rel_error, float(relative.max()))
+    report = {
+        "dtype": str(np.result_type(*converted.dtypes)),
+        "max_abs_error": max_abs_error,
+        "max_rel_error": max_rel_error,
+        "n_overflow": n_overflow,
+        "n_underflow": n_underflow,
+    }
+    return report
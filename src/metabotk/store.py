@@ -0,0 +1,245 @@
+"""
+Append-only on-disk dataset stores
+
+A store is a directory holding a dataset split in chunks of samples, so that new
+acquisition batches can be added without rewriting the existing data:
+
+    - manifest.json, describing the chunks and the ID columns
+    - metabolites.parquet, the chemical annotation of all the metabolites
+    - for each chunk, <chunk>.npy with its data and <chunk>.samples.parquet with
+      its sample metadata
+
+Metabolites are never reordered: new metabolites are added after the existing
+ones, so each chunk holds the first "n_metabolites" metabolites of the store,
+and the values of the metabolites added after a chunk are missing in it. The
+manifest is replaced last and atomically, so an interrupted append leaves the
+store as it was.
+
+The metadata tables are stored as Parquet, which requires pyarrow
+(`pip install metabotk[parquet]`).
+"""
+
+import json
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from metabotk.parse_and_setup import coerce_ids
+from metabotk.utils import create_directory, iter_blocks
+
+STORE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+ANNOTATION_NAME = "metabolites.parquet"
+
+
+def _write_atomic(path: str, write) -> None:
+    """
+    Write a file through a temporary file in the same directory, so readers
+    never see partial files.
+    """
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as handle:
+        write(handle)
+    os.replace(handle.name, path)
+
+
+def read_manifest(directory: str | os.PathLike[str]) -> dict:
+    """
+    Read the manifest of a store.
+
+    Args:
+        directory: path of the store
+
+    Returns:
+        Dict describing the store
+
+    Raises:
+        ValueError: if the directory is not a store or has an unsupported version
+    """
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise ValueError(f"{directory} is not a metabotk dataset store")
+    with open(path) as handle:
+        manifest = json.load(handle)
+    if manifest["version"] > STORE_VERSION:
+        raise ValueError(
+            f"Unsupported store version {manifest['version']}, "
+            f"the latest supported is {STORE_VERSION}"
+        )
+    return manifest
+
+
+def _read_chemical_annotation(directory, manifest: dict) -> pd.DataFrame:
+    annotation = pd.read_parquet(os.path.join(directory, ANNOTATION_NAME))
+    # metabolites added by an interrupted append are not part of the store
+    return annotation.iloc[: manifest["n_metabolites"]]
+
+
+def _read_sample_ids(directory, manifest: dict) -> pd.Index:
+    ids = [
+        pd.read_parquet(
+            os.path.join(directory, f"{chunk['name']}.samples.parquet"), columns=[]
+        ).index
+        for chunk in manifest["chunks"]
+    ]
+    return coerce_ids(ids[0].append(ids[1:]))
+
+
+def append_to_store(
+    directory: str | os.PathLike[str],
+    data: pd.DataFrame,
+    sample_metadata: pd.DataFrame,
+    chemical_annotation: pd.DataFrame,
+    sample_id_column: str,
+    metabolite_id_column: str,
+) -> dict:
+    """
+    Add a batch of samples to a store, creating the store if it does not exist.
+
+    The batch is written as a new chunk; existing chunks are never rewritten.
+    Metabolites of the batch that are not in the store are added to its chemical
+    annotation, and the metabolites of the store missing from the batch are
+    stored as missing values.
+
+    Args:
+        directory: path of the store
+        data: data with samples as rows and metabolites as columns, aligned to the metadata
+        sample_metadata: sample metadata indexed by sample id
+        chemical_annotation: chemical annotation indexed by metabolite id
+        sample_id_column: name of the sample id column
+        metabolite_id_column: name of the metabolite id column
+
+    Returns:
+        Dict with the "chunk" name, the number of "samples" added and the list of
+        "new_metabolites"
+
+    Raises:
+        ValueError: if the ID columns differ from those of the store, or if some
+            samples of the batch are already in the store
+    """
+    directory = str(directory)
+    if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        manifest = read_manifest(directory)
+        if (manifest["sample_id_column"], manifest["metabolite_id_column"]) != (
+            sample_id_column,
+            metabolite_id_column,
+        ):
+            raise ValueError(
+                "The ID columns of the batch differ from those of the store: "
+                f"'{manifest['sample_id_column']}' and '{manifest['metabolite_id_column']}'"
+            )
+        existing_annotation = _read_chemical_annotation(directory, manifest)
+        duplicated = _read_sample_ids(directory, manifest).intersection(
+            coerce_ids(data.index)
+        )
+        if len(duplicated):
+            raise ValueError(
+                f"Samples {list(duplicated)} are already in the store {directory}"
+            )
+        dtype = np.dtype(manifest["dtype"])
+    else:
+        create_directory(directory)
+        dtypes = set(data.dtypes)
+        dtype = dtypes.pop() if len(dtypes) == 1 else np.dtype(np.float64)
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.dtype(np.float64)
+        manifest = {
+            "version": STORE_VERSION,
+            "sample_id_column": sample_id_column,
+            "metabolite_id_column": metabolite_id_column,
+            "dtype": dtype.str,
+            "n_metabolites": 0,
+            "chunks": [],
+        }
+        existing_annotation = chemical_annotation.iloc[:0]
+
+    existing = coerce_ids(existing_annotation.index)
+    batch_metabolites = coerce_ids(data.columns)
+    is_new = existing.get_indexer(batch_metabolites) == -1
+    new_metabolites = list(batch_metabolites[is_new])
+    metabolites = existing.append(batch_metabolites[is_new])
+    positions = metabolites.get_indexer(batch_metabolites)
+
+    chunk = f"chunk-{len(manifest['chunks']):05d}"
+    # preallocate the chunk with missing values for the metabolites absent from the batch
+    chunk_data = np.lib.format.open_memmap(
+        os.path.join(directory, f"{chunk}.npy"),
+        mode="w+",
+        dtype=dtype,
+        shape=(len(data), len(metabolites)),
+    )
+    chunk_data[:] = np.nan
+    for block, _ in iter_blocks(data.shape, axis=1):
+        chunk_data[block, positions] = data.iloc[block].to_numpy(dtype=dtype)
+    chunk_data.flush()
+    del chunk_data
+    sample_metadata.to_parquet(
+        os.path.join(directory, f"{chunk}.samples.parquet"), index=True
+    )
+    if new_metabolites or not manifest["chunks"]:
+        rows = coerce_ids(chemical_annotation.index).get_indexer(
+            batch_metabolites[is_new]
+        )
+        annotation = chemical_annotation.iloc[rows]
+        if len(existing_annotation):
+            annotation = pd.concat([existing_annotation, annotation])
+        _write_atomic(
+            os.path.join(directory, ANNOTATION_NAME),
+            lambda handle: annotation.to_parquet(handle, index=True),
+        )
+
+    manifest["n_metabolites"] = len(metabolites)
+    manifest["chunks"].append(
+        {"name": chunk, "n_samples": len(data), "n_metabolites": len(metabolites)}
+    )
+    _write_atomic(
+        os.path.join(directory, MANIFEST_NAME),
+        lambda handle: handle.write(json.dumps(manifest, indent=2).encode()),
+    )
+    append_report = {
+        "chunk": chunk,
+        "samples": len(data),
+        "new_metabolites": new_metabolites,
+    }
+    return append_report
+
+
+def read_store(directory: str | os.PathLike[str]) -> dict:
+    """
+    Read a store, gathering its chunks in a single preallocated block.
+
+    Chunks are memory-mapped and copied to the block one at a time, so the data
+    is never held twice in memory.
+
+    Args:
+        directory: path of the store
+
+    Returns:
+        Dict with the "sample_metadata" and "chemical_annotation" DataFrames, the
+        "data" array and the store "manifest"
+    """
+    directory = str(directory)
+    manifest = read_manifest(directory)
+    dtype = np.dtype(manifest["dtype"])
+    chemical_annotation = _read_chemical_annotation(directory, manifest)
+    n_samples = sum(chunk["n_samples"] for chunk in manifest["chunks"])
+    data = np.full((n_samples, manifest["n_metabolites"]), np.nan, dtype=dtype)
+    sample_metadata = []
+    start = 0
+    for chunk in manifest["chunks"]:
+        values = np.load(os.path.join(directory, f"{chunk['name']}.npy"), mmap_mode="r")
+        stop = start + chunk["n_samples"]
+        data[start:stop, : chunk["n_metabolites"]] = values
+        start = stop
+        sample_metadata.append(
+            pd.read_parquet(os.path.join(directory, f"{chunk['name']}.samples.parquet"))
+        )
+    sample_metadata = pd.concat(sample_metadata)
+    store_dict = {
+        "sample_metadata": sample_metadata,
+        "chemical_annotation": chemical_annotation,
+        "data": data,
+        "manifest": manifest,
+    }
+    return store_dict
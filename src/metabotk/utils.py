@@ -2,6 +2,11 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import os
+import warnings
+
+# maximum number of values in the blocks processed at a time by block-wise
+# computations, so that their temporaries stay small for memory-mapped data
+BLOCK_ELEMENTS = 2**22
 
 
 def create_directory(directory_path: str):
@@ -37,19 +42,205 @@ def validate_dataframe(data_frame):
         raise TypeError("Data must be a pandas DataFrame.")
 
 
-def parse_input(input_data: str | os.PathLike[str] | pd.DataFrame) -> pd.DataFrame:
+# compression extensions decompressed transparently when parsing files
+COMPRESSION_EXTENSIONS = (".gz", ".bz2", ".xz", ".zst")
+
+
+def _require_zstandard() -> None:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "Reading zstd-compressed files requires the zstandard package, "
+            "install it with `pip install metabotk[zstd]`"
+        ) from None
+
+
+def _file_format(file_path: str) -> str:
+    """
+    Get the separator of a text file, or "parquet" for Parquet files, from its extension.
+
+    Raises:
+        ImportError: if the file is compressed with zstd and zstandard is not installed
+    """
+    if file_path.endswith(".zst"):
+        _require_zstandard()
+    for extension in COMPRESSION_EXTENSIONS:
+        file_path = file_path.removesuffix(extension)
+    if file_path.endswith(".parquet"):
+        return "parquet"
+    elif file_path.endswith(".csv"):
+        return ","
+    elif file_path.endswith((".tsv", ".data", ".samples", ".metabolites")):
+        return "\t"
+    raise TypeError(
+        "Invalid file extension: input should be a Pandas DataFrame or a file path to a TSV or CSV file."
+    )
+
+
+def _numeric_columns(file_path: str, sep: str, id_column: str, usecols=None):
+    """
+    Get the columns to read from a text table of numeric values, and their dtypes.
+    """
+    header = pd.read_csv(file_path, sep=sep, nrows=0).columns
+    if id_column not in header:
+        raise ValueError(f"No sample ID column '{id_column}' found in data")
+    if usecols is not None:
+        usecols = set(map(str, usecols))
+        header = [i for i in header if i == id_column or i in usecols]
+    dtype = {column: np.float64 for column in header}
+    dtype[id_column] = str
+    return header, dtype
+
+
+def _text_engine(file_path: str) -> str:
     """
-    Parse input data as pandas dataframe or as file path to TSV or CSV file
+    Use the multithreaded pyarrow parser when available, the C parser otherwise;
+    pyarrow cannot decompress xz files.
+    """
+    if file_path.endswith(".xz"):
+        return "c"
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "c"
+    return "pyarrow"
+
+
+def _read_csv_pyarrow(file_path: str, sep: str, dtype: dict, usecols) -> pd.DataFrame:
+    """
+    Read a text table with the pyarrow parser, passing the column types to the
+    parser itself: the pyarrow engine of pandas casts the columns after
+    inferring their types, which turns IDs such as "007" into "7".
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    column_types = {
+        column: pa.string() if column_type is str else pa.float64()
+        for column, column_type in dtype.items()
+    }
+    table = pa_csv.read_csv(
+        file_path,
+        parse_options=pa_csv.ParseOptions(delimiter=sep),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types, include_columns=list(usecols)
+        ),
+    )
+    return table.to_pandas()
+
+
+def _read_selected_rows(file_path: str, id_column: str, ids, **kwargs) -> pd.DataFrame:
+    """
+    Read the rows of a text table whose ID is in ids, in chunks of rows, so that
+    the other rows are never held in memory together.
+    """
+    ids = pd.Index(ids).astype(str)
+    chunksize = max(1, BLOCK_ELEMENTS // len(kwargs["usecols"]))
+    chunks = [
+        chunk[chunk[id_column].isin(ids)]
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, **kwargs)
+    ]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _read_numeric_table(
+    file_path: str, sep: str, id_column: str, usecols=None, ids=None
+) -> pd.DataFrame:
+    """
+    Read a table of numeric values with an ID column, parsing every other column as float.
+    """
+    header, dtype = _numeric_columns(file_path, sep, id_column, usecols)
+    kwargs = {"sep": sep, "dtype": dtype, "usecols": header}
+    try:
+        if ids is not None:
+            return _read_selected_rows(file_path, id_column, ids, **kwargs)
+        if _text_engine(file_path) == "pyarrow":
+            return _read_csv_pyarrow(file_path, sep, dtype, header)
+        return pd.read_csv(file_path, **kwargs)
+    except ValueError:
+        warnings.warn(
+            f"Non-numeric values found in {file_path}, parsing it with type inference"
+        )
+        kwargs["dtype"] = {id_column: str}
+        if ids is not None:
+            return _read_selected_rows(file_path, id_column, ids, **kwargs)
+        return pd.read_csv(file_path, **kwargs)
+
+
+def _read_parquet(
+    file_path: str, id_column: str | None = None, usecols=None, ids=None
+) -> pd.DataFrame:
+    """
+    Read a Parquet file, reading only the selected columns and, when the ID column
+    holds strings, only the row groups holding the selected IDs.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filters = None
+    if usecols is not None or ids is not None:
+        schema = pq.read_schema(file_path)
+        if usecols is not None:
+            usecols = set(map(str, usecols))
+            usecols = [i for i in schema.names if i == id_column or i in usecols]
+        if ids is not None and id_column in schema.names:
+            id_type = schema.field(id_column).type
+            if pa.types.is_string(id_type) or pa.types.is_large_string(id_type):
+                filters = [(id_column, "in", list(map(str, ids)))]
+    data = pd.read_parquet(file_path, columns=usecols, filters=filters)
+    if ids is not None and filters is None:
+        ids = pd.Index(ids).astype(str)
+        if id_column in data.columns:
+            data = data[data[id_column].astype(str).isin(ids)]
+        else:
+            data = data[data.index.astype(str).isin(ids)]
+    return data
+
+
+def parse_input(
+    input_data: str | os.PathLike[str] | pd.DataFrame,
+    id_column: str | None = None,
+    usecols: list[str] | None = None,
+    ids: list[str] | None = None,
+    cache_dir=None,
+    str_columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Parse input data as pandas dataframe or as file path to TSV, CSV or Parquet file
 
     This function allows users to provide input data as a pandas DataFrame or
-    as a file path to a TSV or CSV file. If the input is a DataFrame, it is
+    as a file path to a TSV, CSV or Parquet file. If the input is a DataFrame, it is
     returned as is. If the input is a file path, the function loads the data
-    from the file and returns it as a DataFrame.
+    from the file and returns it as a DataFrame. Text files compressed with
+    gzip, bzip2, xz or zstd (e.g. ".tsv.gz", ".data.zst") are decompressed
+    transparently; zstd requires the zstandard package (the zstd extra).
+
+    If id_column is given, the file is read as an abundance table: every other
+    column is parsed directly as float, with the multithreaded pyarrow parser
+    when pyarrow is installed, instead of inferring the dtype of each column.
 
     Parameters
     ----------
     input_data : pandas.DataFrame or str
         Input data to be parsed.
+    id_column : str, optional
+        Name of the ID column of an abundance table.
+    usecols : list of str, optional
+        Columns to read from files, besides the ID column; all columns if None.
+    ids : list of str, optional
+        IDs of the rows to read from files, matched against id_column as strings;
+        all rows if None. Text files are then read in chunks of rows, keeping only
+        the selected ones.
+    cache_dir : str, bool or metabotk.cache.ParseCache, optional
+        Directory of an on-disk cache of parsed files, keyed by the path, size and
+        modification time of the file and by the reader options; True caches each
+        file in a `.metabotk_cache` directory next to it. A ParseCache instance can
+        be given to set the maximum size of the cache. No caching if None.
+    str_columns : list of str, optional
+        Columns of text files read as strings instead of inferring their dtype,
+        e.g. the ID column of a metadata table, so that IDs such as "007" are
+        kept as written, as in the ID column of abundance tables.
 
     Returns
     -------
@@ -60,30 +251,245 @@ def parse_input(input_data: str | os.PathLike[str] | pd.DataFrame) -> pd.DataFra
     ------
     TypeError
         If the input is not a pandas DataFrame or a file path.
+    ValueError
+        If ids are given without id_column.
     """
+    if ids is not None and id_column is None:
+        raise ValueError("Selecting rows by ID requires the ID column")
+    if isinstance(input_data, os.PathLike):
+        input_data = os.fspath(input_data)
+    if cache_dir is not None and isinstance(input_data, str):
+        # imported here, since the cache module depends on this one
+        from metabotk.cache import as_parse_cache
+
+        cache = as_parse_cache(cache_dir)
+        if cache is not None:
+            options = {
+                "id_column": id_column,
+                "usecols": None if usecols is None else list(map(str, usecols)),
+                "ids": None if ids is None else list(map(str, ids)),
+                "str_columns": str_columns,
+            }
+            return cache.get_or_parse(
+                input_data,
+                options,
+                lambda: parse_input(
+                    input_data, id_column, usecols, ids, str_columns=str_columns
+                ),
+            )
     if isinstance(input_data, pd.DataFrame):
         # data = input_data.reset_index()
         return input_data
     elif isinstance(input_data, str):
-        if input_data.endswith(".tsv"):
-            data = pd.read_table(input_data, sep="\t")
-            return data
-        elif input_data.endswith(".csv"):
-            data = pd.read_csv(input_data)
-            return data
-        elif input_data.endswith((".data", ".samples", ".metabolites")):
-            data = pd.read_table(input_data)
-            return data
-        else:
-            raise TypeError(
-                "Invalid file extension: input should be a Pandas DataFrame or a file path to a TSV or CSV file."
-            )
+        sep = _file_format(input_data)
+        if sep == "parquet":
+            # keeps dtypes, categoricals and index names; requires pyarrow
+            return _read_parquet(input_data, id_column, usecols, ids)
+        if id_column is not None:
+            return _read_numeric_table(input_data, sep, id_column, usecols, ids)
+        dtype = None if str_columns is None else dict.fromkeys(str_columns, str)
+        data = pd.read_csv(input_data, sep=sep, usecols=usecols, dtype=dtype)
+        return data
     else:
         raise TypeError(
             "Input should be a Pandas DataFrame or a file path to a TSV or CSV file."
         )
 
 
+def iter_input(
+    input_data: str | os.PathLike[str] | pd.DataFrame,
+    id_column: str,
+    chunk_size: int,
+    usecols: list[str] | None = None,
+):
+    """
+    Parse an abundance table in chunks of rows.
+
+    Text files are parsed with every column other than the ID column read as
+    float, Parquet files batch by batch; only one chunk is held in memory at a time.
+
+    Parameters
+    ----------
+    input_data : pandas.DataFrame or str
+        Input data to be parsed, as in `parse_input`.
+    id_column : str
+        Name of the ID column.
+    chunk_size : int
+        Number of rows per chunk.
+    usecols : list of str, optional
+        Columns to read from files, besides the ID column; all columns if None.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Chunks of at most chunk_size rows, in file order.
+
+    Raises
+    ------
+    ValueError
+        If chunk_size is not a positive integer.
+    """
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer")
+    if isinstance(input_data, pd.DataFrame):
+        for start in range(0, len(input_data), chunk_size):
+            yield input_data.iloc[start : start + chunk_size]
+        return
+    if isinstance(input_data, os.PathLike):
+        input_data = os.fspath(input_data)
+    if not isinstance(input_data, str):
+        raise TypeError(
+            "Input should be a Pandas DataFrame or a file path to a TSV or CSV file."
+        )
+    sep = _file_format(input_data)
+    if sep == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(input_data)
+        columns = None
+        if usecols is not None:
+            usecols = set(map(str, usecols))
+            columns = [
+                i
+                for i in parquet_file.schema_arrow.names
+                if i == id_column or i in usecols
+            ]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield pa.Table.from_batches([batch]).to_pandas()
+        return
+    header, dtype = _numeric_columns(input_data, sep, id_column, usecols)
+    yield from pd.read_csv(
+        input_data, sep=sep, dtype=dtype, usecols=header, chunksize=chunk_size
+    )
+
+
+def get_positions(index: pd.Index, ids) -> np.ndarray:
+    """
+    Resolve a list of IDs to their integer positions in an index.
+
+    Parameters
+    ----------
+    index : pandas.Index
+        Index to search.
+    ids : list-like
+        IDs to resolve.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer positions of the IDs, in the order they were given.
+
+    Raises
+    ------
+    KeyError
+        If any of the IDs is not found in the index.
+    """
+    positions = index.get_indexer_for(ids)
+    if (positions == -1).any():
+        missing = [i for i, p in zip(ids, positions) if p == -1]
+        raise KeyError(f"IDs not found: {missing}")
+    return positions
+
+
+def get_remaining_positions(index: pd.Index, ids) -> np.ndarray:
+    """
+    Get the positions of the elements of an index that are not in a list of IDs.
+
+    Parameters
+    ----------
+    index : pandas.Index
+        Index to search.
+    ids : list-like
+        IDs to exclude; IDs not found in the index are ignored.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer positions of the remaining elements, in the order of the index.
+    """
+    keep = np.ones(len(index), dtype=bool)
+    positions = index.get_indexer_for(ids)
+    keep[positions[positions != -1]] = False
+    return np.flatnonzero(keep)
+
+
+def float_values(data_frame: pd.DataFrame, copy: bool = False) -> np.ndarray:
+    """
+    Return the values of a numeric DataFrame as a floating point array.
+
+    Data whose columns all share one floating point dtype keeps it, so float32
+    data is not upcast to a float64 temporary; other data is converted to float64.
+
+    Parameters
+    ----------
+    data_frame : pandas.DataFrame
+        DataFrame containing only numeric values.
+    copy : bool
+        If True, the returned array never shares memory with the DataFrame.
+
+    Returns
+    -------
+    numpy.ndarray
+        2D array of values.
+    """
+    dtypes = set(data_frame.dtypes)
+    if len(dtypes) == 1 and np.issubdtype(next(iter(dtypes)), np.floating):
+        return data_frame.to_numpy(copy=copy)
+    return data_frame.to_numpy(dtype=np.float64, copy=copy)
+
+
+def chunk_data(chunk) -> pd.DataFrame:
+    """
+    Return the data of a chunk of samples, given as a dataset or as a DataFrame.
+
+    Parameters
+    ----------
+    chunk : MetabolomicDataset or pandas.DataFrame
+        Chunk yielded by a streaming reader such as `DatasetIO.iter_prefix`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Data of the chunk, with samples as rows and metabolites as columns.
+    """
+    if isinstance(chunk, pd.DataFrame):
+        return chunk
+    return chunk.data
+
+
+def iter_blocks(shape: tuple[int, int], axis: int = 0, block_elements=None):
+    """
+    Split a 2D array into blocks of whole columns (axis=0) or whole rows (axis=1).
+
+    Computations reducing along axis can process one block at a time, so that
+    only one block of a memory-mapped array is read in memory at once.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the 2D array.
+    axis : int
+        0 to split into blocks of columns, 1 to split into blocks of rows.
+    block_elements : int, optional
+        Maximum number of values per block; defaults to BLOCK_ELEMENTS. Blocks
+        always hold at least one column or row.
+
+    Yields
+    ------
+    tuple
+        Slice of the columns (or rows) in the block, and the index selecting the
+        block in the array.
+    """
+    if block_elements is None:
+        block_elements = BLOCK_ELEMENTS
+    length = shape[1 - axis]
+    step = max(1, block_elements // max(1, shape[axis]))
+    for start in range(0, length, step):
+        block = slice(start, min(start + step, length))
+        yield block, (slice(None), block) if axis == 0 else (block, slice(None))
+
+
 def reset_index_if_not_none(df: pd.DataFrame):
     """
 
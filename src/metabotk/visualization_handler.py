@@ -57,7 +57,7 @@ class Visualization:
         plot: seaborn.axisgrid.FacetGrid
             Seaborn scatterplot object.
         """
-        if not pca:
+        if pca is None:
             print("PCA not found, computing now with 3 components...")
             pca = self.dimred.get_pca(n_components=3)
         plot = sns.scatterplot(data=pca, x=x, y=y, hue=hue, style=style)
@@ -0,0 +1,289 @@
+import shutil
+from pathlib import Path
+import subprocess
+import sys
+import pytest
+import pandas as pd
+import numpy as np
+from metabotk.cache import ResultCache, DiskCache, ParseCache
+from metabotk.parse_and_setup import read_excel
+from metabotk.utils import parse_input
+from metabotk.metabolomic_dataset import MetabolomicDataset
+from metabotk.statistics_handler import Statistics
+from metabotk.imputation import ImputationHandler
+from metabotk.feature_selection import FeatureSelection
+
+
+@pytest.fixture
+def dataset():
+    dataset = MetabolomicDataset._setup(
+        data=pd.read_csv("tests/test_data/data.csv"),
+        sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+        chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+        sample_id_column="PARENT_SAMPLE_NAME",
+        metabolite_id_column="CHEM_ID",
+    )
+    return dataset
+
+
+class TestResultCache:
+    def test_compute_once(self):
+        cache = ResultCache()
+        calls = []
+        for _ in range(3):
+            result = cache.get_or_compute("op", {"a": 1}, lambda: calls.append(1) or 5)
+        assert result == 5
+        assert len(calls) == 1
+
+    def test_tuple_results_are_copied(self):
+        cache = ResultCache()
+        frame, array = cache.get_or_compute(
+            "op", {}, lambda: (pd.DataFrame({"a": [1, 2]}), np.zeros(2))
+        )
+        frame.loc[0, "a"] = 5
+        array[0] = 5
+        frame, array = cache.get_or_compute("op", {}, lambda: None)
+        assert frame["a"].tolist() == [1, 2]
+        assert array.tolist() == [0, 0]
+
+    def test_parameters_in_key(self):
+        cache = ResultCache()
+        assert cache.get_or_compute("op", {"a": 1}, lambda: 1) == 1
+        assert cache.get_or_compute("op", {"a": 2}, lambda: 2) == 2
+        assert len(cache) == 2
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        cache.get_or_compute("a", {}, lambda: 1)
+        cache.get_or_compute("b", {}, lambda: 2)
+        cache.get_or_compute("a", {}, lambda: 1)
+        cache.get_or_compute("c", {}, lambda: 3)
+        assert ResultCache.make_key("a", {}) in cache
+        assert ResultCache.make_key("b", {}) not in cache
+        assert len(cache) == 2
+
+    def test_invalid_size(self):
+        with pytest.raises(ValueError):
+            ResultCache(maxsize=-1)
+
+
+class TestDatasetCache:
+    def test_statistics_cached(self, dataset):
+        stats = Statistics(dataset)
+        pd.testing.assert_frame_equal(
+            stats.metabolite_stats(), stats.metabolite_stats()
+        )
+        pd.testing.assert_frame_equal(stats.corr(), stats.corr())
+        assert len(dataset.cache) == 2
+        stats.metabolite_stats(outlier_threshold=3)
+        assert len(dataset.cache) == 3
+
+    def test_results_are_copies(self, dataset):
+        stats = Statistics(dataset)
+        first = stats.metabolite_stats()
+        expected = first.copy()
+        first.iloc[:, :] = 0
+        pd.testing.assert_frame_equal(stats.metabolite_stats(), expected)
+
+    @pytest.mark.parametrize(
+        "attribute", ["data", "sample_metadata", "chemical_annotation"]
+    )
+    def test_setter_invalidates(self, dataset, attribute):
+        stats = Statistics(dataset)
+        before = stats.sample_stats()
+        setattr(dataset, attribute, getattr(dataset, attribute).copy())
+        assert len(dataset.cache) == 0
+        assert stats.sample_stats() is not before
+
+    def test_new_data_recomputed(self, dataset):
+        stats = Statistics(dataset)
+        before = stats.metabolite_stats()
+        dataset.data = dataset.data * 2
+        after = stats.metabolite_stats()
+        np.testing.assert_allclose(after["mean"], before["mean"] * 2)
+
+
+class TestFingerprint:
+    def test_stable_across_processes(self, dataset):
+        script = (
+            "import pandas as pd\n"
+            "from metabotk.metabolomic_dataset import MetabolomicDataset\n"
+            "print(MetabolomicDataset._setup("
+            "data=pd.read_csv('tests/test_data/data.csv'),"
+            "sample_metadata=pd.read_csv('tests/test_data/sample_metadata.csv'),"
+            "chemical_annotation=pd.read_csv('tests/test_data/chemical_annotation.csv'),"
+            "sample_id_column='PARENT_SAMPLE_NAME',"
+            "metabolite_id_column='CHEM_ID').fingerprint)"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", script], capture_output=True, text=True, check=True
+        )
+        assert output.stdout.strip() == dataset.fingerprint
+
+    def test_independent_of_storage(self, dataset):
+        array_dataset = MetabolomicDataset(
+            data=dataset.data,
+            sample_metadata=dataset.sample_metadata,
+            chemical_annotation=dataset.chemical_annotation,
+            sample_id_column=dataset._sample_id_column,
+            metabolite_id_column=dataset._metabolite_id_column,
+            storage="array",
+        )
+        assert array_dataset.fingerprint == dataset.fingerprint
+
+    @pytest.mark.parametrize(
+        "attribute", ["data", "sample_metadata", "chemical_annotation"]
+    )
+    def test_setter_changes_fingerprint(self, dataset, attribute):
+        before = dataset.fingerprint
+        new_value = getattr(dataset, attribute).copy()
+        new_value.iloc[0, 0] = np.nan if attribute == "data" else "changed"
+        setattr(dataset, attribute, new_value)
+        assert dataset.fingerprint != before
+
+    def test_id_columns_in_fingerprint(self, dataset):
+        before = dataset.fingerprint
+        dataset._metabolite_id_column = "OTHER"
+        assert dataset.fingerprint != before
+
+
+class TestDiskCache:
+    def test_compute_once(self, tmp_path):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return pd.DataFrame({"a": [1, 2]})
+
+        for _ in range(2):
+            result = DiskCache(tmp_path).get_or_compute("op", "abc", {"x": 1}, compute)
+        assert len(calls) == 1
+        assert result.equals(pd.DataFrame({"a": [1, 2]}))
+        assert len(list(tmp_path.glob("op-*.pickle"))) == 1
+
+    def test_key_depends_on_fingerprint_and_params(self, tmp_path):
+        cache = DiskCache(tmp_path)
+        assert cache.get_or_compute("op", "abc", {"x": 1}, lambda: 1) == 1
+        assert cache.get_or_compute("op", "abd", {"x": 1}, lambda: 2) == 2
+        assert cache.get_or_compute("op", "abc", {"x": 2}, lambda: 3) == 3
+
+
+class TestImputationCache:
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+
+        def run(self, **params):
+            calls.append(params["random_state"])
+            return None, {1: len(calls)}
+
+        monkeypatch.setattr(ImputationHandler, "_run_miceforest", run)
+        return calls
+
+    def test_seeded_imputation_is_cached(self, dataset, tmp_path, calls):
+        handler = ImputationHandler(dataset)
+        for _ in range(2):
+            imputed = handler.miceforest(5, random_state=1, cache_dir=tmp_path)
+        assert imputed == {1: 1}
+        handler.miceforest(5, random_state=2, cache_dir=tmp_path)
+        assert calls == [1, 2]
+
+    def test_unseeded_imputation_is_not_cached(self, dataset, tmp_path, calls):
+        handler = ImputationHandler(dataset)
+        for _ in range(2):
+            with pytest.warns(UserWarning):
+                handler.miceforest(5, cache_dir=tmp_path)
+        assert calls == [None, None]
+        assert not list(tmp_path.iterdir())
+
+
+class TestBorutaCache:
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        calls = []
+
+        def fit(self, **params):
+            calls.append(params["random_state"])
+            return None, None, len(calls)
+
+        monkeypatch.setattr(FeatureSelection, "_fit_boruta", fit)
+        return calls
+
+    def test_seeded_run_is_cached(self, dataset, tmp_path, calls):
+        selection = FeatureSelection(dataset)
+        for seed in [1, np.int64(1)]:
+            selection.boruta("sex", random_state=seed, cache_dir=tmp_path)
+        assert calls == [1]
+
+    @pytest.mark.parametrize("random_state", [None, True, np.random.RandomState(0)])
+    def test_unseeded_run_is_not_cached(self, dataset, tmp_path, calls, random_state):
+        selection = FeatureSelection(dataset)
+        for _ in range(2):
+            with pytest.warns(UserWarning):
+                selection.boruta("sex", random_state=random_state, cache_dir=tmp_path)
+        assert len(calls) == 2
+        assert not list(tmp_path.iterdir())
+
+
+class TestParseCache:
+    @pytest.fixture
+    def table(self, tmp_path):
+        path = tmp_path / "table.tsv"
+        pd.read_csv("tests/test_data/data.csv").to_csv(path, sep="\t", index=False)
+        return str(path)
+
+    def test_parse_once(self, table, tmp_path):
+        cache = ParseCache(tmp_path / "cache")
+        calls = []
+
+        def parse():
+            calls.append(1)
+            return parse_input(table)
+
+        first = cache.get_or_parse(table, {}, parse)
+        second = cache.get_or_parse(table, {}, parse)
+        assert len(calls) == 1
+        pd.testing.assert_frame_equal(first, second)
+
+    def test_invalidated_by_changes(self, table, tmp_path):
+        cache_dir = tmp_path / "cache"
+        first = parse_input(table, id_column="PARENT_SAMPLE_NAME", cache_dir=cache_dir)
+        changed = first.iloc[:5]
+        changed.to_csv(table, sep="\t", index=False)
+        second = parse_input(table, id_column="PARENT_SAMPLE_NAME", cache_dir=cache_dir)
+        assert len(second) == 5
+        options = parse_input(
+            table, id_column="PARENT_SAMPLE_NAME", usecols=["50"], cache_dir=cache_dir
+        )
+        assert list(options.columns) == ["PARENT_SAMPLE_NAME", "50"]
+
+    def test_sidecar(self, table, tmp_path):
+        parse_input(table, cache_dir=True)
+        assert len(list((tmp_path / ".metabotk_cache").glob("table.tsv-*.pickle"))) == 1
+
+    def test_path_like(self, table, tmp_path):
+        parsed = parse_input(Path(table), cache_dir=True)
+        assert len(list((tmp_path / ".metabotk_cache").glob("table.tsv-*.pickle"))) == 1
+        pd.testing.assert_frame_equal(parsed, parse_input(table))
+
+    def test_eviction(self, table, tmp_path):
+        cache = ParseCache(tmp_path / "cache", max_bytes=0)
+        for options in [{"a": 1}, {"a": 2}, {"a": 3}]:
+            cache.get_or_parse(table, options, lambda: parse_input(table))
+        # only the last entry is kept
+        assert len(list((tmp_path / "cache").glob("*.pickle"))) == 1
+        assert (table, {"a": 3}) in cache
+
+    def test_read_excel(self, tmp_path):
+        path = tmp_path / "dataset.xlsx"
+        shutil.copy("tests/test_data/cdt_demo.xlsx", path)
+        sheets = {
+            "sample_metadata_sheet": "Sample Meta Data",
+            "chemical_annotation_sheet": "Chemical Annotation",
+            "data_sheet": "Peak Area Data",
+        }
+        first = read_excel(str(path), **sheets, cache_dir=tmp_path / "cache")
+        assert len(list((tmp_path / "cache").glob("*.pickle"))) == 3
+        second = read_excel(str(path), **sheets, cache_dir=tmp_path / "cache")
+        for key in first:
+            pd.testing.assert_frame_equal(first[key], second[key])
@@ -0,0 +1,561 @@
+import asyncio
+import pytest
+from metabotk.main import MetaboTK
+import metabotk.utils as utils
+from metabotk.bundle import read_bundle_header, BUNDLE_ALIGNMENT
+from metabotk.dataset_io import write_excel, save_excel_files
+from metabotk.scaling import iter_tsa
+from metabotk.providers import MetabolonCDT
+import numpy as np
+import pandas as pd
+
+
+@pytest.fixture
+def dataset():
+    dataset = MetaboTK().io.from_tables(
+        sample_metadata="tests/test_data/sample_metadata.csv",
+        chemical_annotation="tests/test_data/chemical_annotation.csv",
+        data="tests/test_data/data.csv",
+        sample_id_column="PARENT_SAMPLE_NAME",
+    )
+    return dataset
+
+
+@pytest.fixture
+def memmap_dataset(dataset, tmp_path):
+    prefix = str(tmp_path / "dataset")
+    dataset.io.save_memmap(prefix)
+    return MetaboTK().io.from_memmap(prefix, sample_id_column="PARENT_SAMPLE_NAME")
+
+
+class TestMemmap:
+    def test_round_trip(self, dataset, memmap_dataset):
+        assert memmap_dataset.storage == "memmap"
+        assert isinstance(memmap_dataset.values, np.memmap)
+        pd.testing.assert_frame_equal(
+            memmap_dataset.data, dataset.data, check_index_type=False
+        )
+        assert memmap_dataset.samples == dataset.samples
+        assert memmap_dataset.metabolites == dataset.metabolites
+
+    def test_read_only(self, memmap_dataset):
+        with pytest.raises(ValueError):
+            memmap_dataset.values[0, 0] = 0
+
+    def test_replaced_data_is_in_memory(self, memmap_dataset):
+        memmap_dataset.data = memmap_dataset.data * 2
+        assert memmap_dataset.storage == "array"
+        assert not isinstance(memmap_dataset.values, np.memmap)
+
+    def test_subset(self, dataset, memmap_dataset):
+        samples = dataset.samples[:5]
+        view = memmap_dataset.ops.subset(what="samples", ids=samples, view=True)
+        assert view.storage == "memmap"
+        copy = memmap_dataset.ops.subset(what="samples", ids=samples)
+        assert copy.storage == "array"
+        pd.testing.assert_frame_equal(view.data, copy.data)
+
+    def test_shape_mismatch(self, dataset, tmp_path):
+        prefix = str(tmp_path / "dataset")
+        dataset.io.save_memmap(prefix)
+        np.save(f"{prefix}.npy", dataset.values[1:])
+        with pytest.raises(ValueError):
+            MetaboTK().io.from_memmap(prefix, sample_id_column="PARENT_SAMPLE_NAME")
+
+
+class TestBlockProcessing:
+    @pytest.fixture(autouse=True)
+    def small_blocks(self, monkeypatch):
+        # force several blocks on the small test dataset
+        monkeypatch.setattr(utils, "BLOCK_ELEMENTS", 100)
+
+    def test_iter_blocks(self):
+        blocks = list(utils.iter_blocks((10, 25), axis=0, block_elements=30))
+        assert [block for block, _ in blocks] == [
+            slice(i, min(i + 3, 25)) for i in range(0, 25, 3)
+        ]
+        blocks = list(utils.iter_blocks((10, 25), axis=1, block_elements=30))
+        assert [index for _, index in blocks] == [
+            (slice(0, 1), slice(None)),
+            (slice(1, 2), slice(None)),
+        ] + [(slice(i, i + 1), slice(None)) for i in range(2, 10)]
+
+    def test_statistics_match_in_memory(self, dataset, memmap_dataset):
+        pd.testing.assert_frame_equal(
+            memmap_dataset.stats.metabolite_stats(),
+            dataset.stats.metabolite_stats(),
+            check_index_type=False,
+        )
+        pd.testing.assert_frame_equal(
+            memmap_dataset.stats.sample_stats(),
+            dataset.stats.sample_stats(),
+            check_index_type=False,
+        )
+
+    @pytest.mark.parametrize("on", ["samples", "metabolites"])
+    def test_remove_outliers_and_missing(self, dataset, memmap_dataset, on):
+        pd.testing.assert_frame_equal(
+            memmap_dataset.stats.remove_outliers(threshold=1.5, on=on),
+            dataset.stats.remove_outliers(threshold=1.5, on=on),
+            check_index_type=False,
+        )
+        pd.testing.assert_frame_equal(
+            memmap_dataset.stats.remove_missing(threshold=0.1, on=on),
+            dataset.stats.remove_missing(threshold=0.1, on=on),
+            check_index_type=False,
+        )
+
+
+class TestParquetPrefix:
+    @pytest.mark.parametrize(
+        "prefix, format", [("dataset.parquet", None), ("dataset", "parquet")]
+    )
+    def test_round_trip(self, dataset, tmp_path, prefix, format):
+        prefix = str(tmp_path / prefix)
+        dataset.io.save_prefix(prefix, format=format)
+        assert (tmp_path / "dataset.data.parquet").exists()
+        loaded = MetaboTK().io.from_prefix(
+            prefix, sample_id_column="PARENT_SAMPLE_NAME", format=format
+        )
+        pd.testing.assert_frame_equal(loaded.data, dataset.data)
+        pd.testing.assert_frame_equal(loaded.sample_metadata, dataset.sample_metadata)
+        pd.testing.assert_frame_equal(
+            loaded.chemical_annotation, dataset.chemical_annotation
+        )
+
+    def test_keeps_dtypes(self, tmp_path):
+        dataset = MetaboTK().io.from_tables(
+            sample_metadata="tests/test_data/sample_metadata.csv",
+            chemical_annotation="tests/test_data/chemical_annotation.csv",
+            data="tests/test_data/data.csv",
+            sample_id_column="PARENT_SAMPLE_NAME",
+            categorical=True,
+        )
+        float32 = MetaboTK(
+            data=dataset.data,
+            sample_metadata=dataset.sample_metadata,
+            chemical_annotation=dataset.chemical_annotation,
+            sample_id_column="PARENT_SAMPLE_NAME",
+            dtype="float32",
+        )
+        prefix = str(tmp_path / "dataset.parquet")
+        float32.io.save_prefix(prefix)
+        loaded = MetaboTK().io.from_prefix(
+            prefix, sample_id_column="PARENT_SAMPLE_NAME", categorical=False
+        )
+        assert (loaded.data.dtypes == np.float32).all()
+        assert isinstance(
+            loaded.chemical_annotation["SUPER_PATHWAY"].dtype, pd.CategoricalDtype
+        )
+
+    def test_tsv_is_default(self, dataset, tmp_path):
+        prefix = str(tmp_path / "dataset")
+        dataset.io.save_prefix(prefix)
+        assert (tmp_path / "dataset.data").exists()
+        loaded = MetaboTK().io.from_prefix(
+            prefix, sample_id_column="PARENT_SAMPLE_NAME"
+        )
+        pd.testing.assert_frame_equal(loaded.data, dataset.data, check_dtype=False)
+
+    def test_unknown_format(self, dataset, tmp_path):
+        with pytest.raises(ValueError):
+            dataset.io.save_prefix(str(tmp_path / "dataset"), format="xlsx")
+
+
+class TestConcurrentLoading:
+    @pytest.fixture
+    def prefix(self, dataset, tmp_path):
+        prefix = str(tmp_path / "dataset")
+        dataset.io.save_prefix(prefix)
+        return prefix
+
+    @pytest.mark.parametrize("max_workers", [1, 3])
+    def test_from_prefix(self, dataset, prefix, max_workers):
+        loaded = MetaboTK().io.from_prefix(
+            prefix, sample_id_column="PARENT_SAMPLE_NAME", max_workers=max_workers
+        )
+        pd.testing.assert_frame_equal(loaded.data, dataset.data, check_dtype=False)
+        assert loaded.categorical_report == dataset.categorical_report
+
+    def test_afrom_prefix(self, dataset, prefix):
+        async def load_all():
+            return await asyncio.gather(
+                *[
+                    MetaboTK().io.afrom_prefix(
+                        prefix, sample_id_column="PARENT_SAMPLE_NAME"
+                    )
+                    for _ in range(3)
+                ]
+            )
+
+        for loaded in asyncio.run(load_all()):
+            pd.testing.assert_frame_equal(loaded.data, dataset.data, check_dtype=False)
+            assert loaded.samples == dataset.samples
+
+    def test_errors_are_raised(self, prefix):
+        with pytest.raises(ValueError):
+            MetaboTK().io.from_prefix(prefix, sample_id_column="missing")
+
+
+def test_numeric_looking_ids(tmp_path):
+    with open(tmp_path / "samples.tsv", "w") as handle:
+        handle.write("sample\tsex\n007\tF\n010\tM\n")
+    with open(tmp_path / "metabolites.tsv", "w") as handle:
+        handle.write("metabolite\tname\n001\ta\n002\tb\n")
+    with open(tmp_path / "data.tsv", "w") as handle:
+        handle.write("sample\t001\t002\n007\t1.0\t2.0\n010\t3.0\t4.0\n")
+    loaded = MetaboTK().io.from_tables(
+        sample_metadata=str(tmp_path / "samples.tsv"),
+        chemical_annotation=str(tmp_path / "metabolites.tsv"),
+        data=str(tmp_path / "data.tsv"),
+        sample_id_column="sample",
+        metabolite_id_column="metabolite",
+    )
+    assert loaded.samples == ["007", "010"]
+    assert loaded.metabolites == ["001", "002"]
+
+
+class TestLoadSelection:
+    @pytest.fixture(params=["tsv", "parquet"])
+    def prefix(self, request, dataset, tmp_path):
+        prefix = str(tmp_path / "dataset")
+        dataset.io.save_prefix(prefix, format=request.param)
+        return f"{prefix}.parquet" if request.param == "parquet" else prefix
+
+    def test_select_ids(self, dataset, prefix):
+        samples = list(dataset.samples[::4])
+        metabolites = list(dataset.metabolites[10:20])
+        loaded = MetaboTK().io.from_prefix(
+            prefix,
+            sample_id_column="PARENT_SAMPLE_NAME",
+            samples=samples,
+            metabolites=metabolites,
+        )
+        assert loaded.samples == samples
+        assert loaded.metabolites == metabolites
+        expected = dataset.data.loc[samples, metabolites]
+        pd.testing.assert_frame_equal(loaded.data, expected, check_dtype=False)
+        assert loaded.alignment_report["samples_only_in_sample_metadata"] == []
+
+    def test_select_predicates(self, dataset, prefix):
+        loaded = MetaboTK().io.from_prefix(
+            prefix,
+            sample_id_column="PARENT_SAMPLE_NAME",
+            samples=lambda metadata: metadata["sex"] == "F",
+            metabolites=lambda annotation: annotation["SUPER_PATHWAY"] == "Lipid",
+        )
+        assert (loaded.sample_metadata["sex"] == "F").all()
+        assert (loaded.chemical_annotation["SUPER_PATHWAY"] == "Lipid").all()
+        assert len(loaded.samples) == (dataset.sample_metadata["sex"] == "F").sum()
+        expected = dataset.data.loc[loaded.samples, loaded.metabolites]
+        pd.testing.assert_frame_equal(loaded.data, expected, check_dtype=False)
+
+    def test_select_from_dataframes(self, dataset):
+        samples = list(dataset.samples[:5])
+        loaded = MetaboTK().io.from_tables(
+            sample_metadata=dataset.sample_metadata,
+            chemical_annotation=dataset.chemical_annotation,
+            data=dataset.data,
+            sample_id_column="PARENT_SAMPLE_NAME",
+            samples=samples,
+        )
+        assert loaded.samples == samples
+        assert loaded.metabolites == dataset.metabolites
+
+    def test_parse_selected_rows(self):
+        data = utils.parse_input(
+            "tests/test_data/data.csv",
+            id_column="PARENT_SAMPLE_NAME",
+            usecols=["50"],
+            ids=["INTR-03200 [COPY 2]"],
+        )
+        assert data.shape == (1, 2)
+        with pytest.raises(ValueError):
+            utils.parse_input("tests/test_data/data.csv", ids=["INTR-03200 [COPY 2]"])
+
+
+class TestStore:
+    def test_append_batches(self, dataset, tmp_path):
+        store = str(tmp_path / "store")
+        samples = dataset.samples
+        first = dataset.ops.subset(what="samples", ids=samples[:20])
+        second = dataset.ops.subset(what="samples", ids=samples[20:])
+        first.io.append_to_store(store)
+        chunk = tmp_path / "store" / "chunk-00000.npy"
+        modified = chunk.stat().st_mtime_ns
+        report = second.io.append_to_store(store)
+        assert report == {"chunk": "chunk-00001", "samples": 26, "new_metabolites": []}
+        assert chunk.stat().st_mtime_ns == modified
+        loaded = MetaboTK().io.from_store(store)
+        pd.testing.assert_frame_equal(loaded.data, dataset.data, check_dtype=False)
+        pd.testing.assert_frame_equal(
+            loaded.sample_metadata, dataset.sample_metadata, check_dtype=False
+        )
+
+    def test_new_metabolites(self, dataset, tmp_path):
+        store = str(tmp_path / "store")
+        samples, metabolites = dataset.samples, dataset.metabolites
+        first = dataset.ops.subset(what="samples", ids=samples[:20])
+        first = first.ops.subset(what="metabolites", ids=metabolites[:50])
+        second = dataset.ops.subset(what="samples", ids=samples[20:])
+        second = second.ops.subset(what="metabolites", ids=metabolites[10:])
+        first.io.append_to_store(store)
+        report = second.io.append_to_store(store)
+        assert report["new_metabolites"] == metabolites[50:]
+        loaded = MetaboTK().io.from_store(store)
+        assert loaded.samples == samples
+        assert loaded.metabolites == metabolites
+        assert loaded.data.loc[samples[:20], metabolites[50:]].isna().all().all()
+        assert loaded.data.loc[samples[20:], metabolites[:10]].isna().all().all()
+        pd.testing.assert_frame_equal(
+            loaded.data.loc[samples[20:], metabolites[10:]],
+            dataset.data.loc[samples[20:], metabolites[10:]],
+            check_dtype=False,
+        )
+
+    def test_duplicate_samples(self, dataset, tmp_path):
+        store = str(tmp_path / "store")
+        dataset.io.append_to_store(store)
+        with pytest.raises(ValueError):
+            dataset.io.append_to_store(store)
+        assert len(list((tmp_path / "store").glob("chunk-*.npy"))) == 1
+
+    def test_not_a_store(self, tmp_path):
+        with pytest.raises(ValueError):
+            MetaboTK().io.from_store(str(tmp_path))
+
+
+class TestStreaming:
+    @pytest.fixture(params=["tsv", "parquet"])
+    def prefix(self, request, dataset, tmp_path):
+        prefix = str(tmp_path / "dataset")
+        dataset.io.save_prefix(prefix, format=request.param)
+        return f"{prefix}.parquet" if request.param == "parquet" else prefix
+
+    def test_iter_prefix(self, dataset, prefix):
+        chunks = list(
+            MetaboTK().io.iter_prefix(
+                prefix, chunk_size=10, sample_id_column="PARENT_SAMPLE_NAME"
+            )
+        )
+        assert [len(chunk.samples) for chunk in chunks] == [10, 10, 10, 10, 6]
+        for chunk in chunks:
+            assert chunk.metabolites == dataset.metabolites
+            pd.testing.assert_frame_equal(
+                chunk.sample_metadata,
+                dataset.sample_metadata.loc[chunk.samples],
+                check_dtype=False,
+                check_categorical=False,
+            )
+        data = pd.concat([chunk.data for chunk in chunks])
+        pd.testing.assert_frame_equal(data, dataset.data, check_dtype=False)
+
+    def test_chunk_functions(self, dataset):
+        chunks = MetaboTK().io.iter_tables(
+            sample_metadata=dataset.sample_metadata,
+            chemical_annotation=dataset.chemical_annotation,
+            data=dataset.data,
+            chunk_size=8,
+            sample_id_column="PARENT_SAMPLE_NAME",
+        )
+        scaled = [chunk.data for chunk in iter_tsa(chunks)]
+        pd.testing.assert_frame_equal(
+            pd.concat(scaled), dataset.data.div(dataset.data.sum(axis=1), axis=0)
+        )
+
+
+class TestMetabolonCDT:
+    path = "tests/test_data/cdt_demo.xlsx"
+
+    def test_index_sheets(self):
+        cdt = MetabolonCDT(self.path)
+        assert cdt.layers == ["peak_area", "batch_normalized", "log_transformed"]
+        with pytest.raises(KeyError):
+            cdt.read_layer("batch_normalized_imputed", "PARENT_SAMPLE_NAME")
+
+    def test_lazy_layers(self):
+        dataset = MetaboTK().io.from_metabolon_cdt(self.path)
+        assert list(dataset.layers) == ["batch_normalized", "log_transformed"]
+        assert not dataset.layers.is_loaded("batch_normalized")
+        expected = pd.read_excel(self.path, sheet_name="Batch-normalized Data")
+        expected = expected.set_index("PARENT_SAMPLE_NAME")
+        expected.columns = expected.columns.astype(str)
+        layer = dataset.layers["batch_normalized"]
+        assert dataset.layers.is_loaded("batch_normalized")
+        pd.testing.assert_frame_equal(
+            layer, expected.loc[dataset.samples, dataset.metabolites]
+        )
+        assert not dataset.layers.is_loaded("log_transformed")
+
+    def test_data_layer(self):
+        dataset = MetaboTK().io.from_metabolon_cdt(
+            self.path, data_layer="log_transformed"
+        )
+        assert "peak_area" in dataset.layers
+        assert "log_transformed" not in dataset.layers
+
+    def test_missing_metadata(self, tmp_path):
+        path = tmp_path / "empty.xlsx"
+        pd.DataFrame().to_excel(path)
+        with pytest.raises(ValueError):
+            MetabolonCDT(str(path))
+
+
+class TestBundle:
+    @pytest.fixture
+    def bundle_path(self, dataset, tmp_path):
+        file_path = str(tmp_path / "dataset.mtbk")
+        dataset.io.save_bundle(file_path)
+        return file_path
+
+    def test_round_trip(self, dataset, bundle_path):
+        loaded = MetaboTK().io.from_bundle(bundle_path)
+        assert loaded.storage == "memmap"
+        assert isinstance(loaded.values, np.memmap)
+        assert loaded._sample_id_column == "PARENT_SAMPLE_NAME"
+        assert loaded._metabolite_id_column == "CHEM_ID"
+        pd.testing.assert_frame_equal(loaded.data, dataset.data)
+        pd.testing.assert_frame_equal(loaded.sample_metadata, dataset.sample_metadata)
+        pd.testing.assert_frame_equal(
+            loaded.chemical_annotation, dataset.chemical_annotation
+        )
+
+    def test_data_is_aligned(self, bundle_path):
+        header = read_bundle_header(bundle_path)
+        assert header["data_offset"] % BUNDLE_ALIGNMENT == 0
+
+    def test_open_subset(self, dataset, bundle_path):
+        samples = dataset.samples[10:20]
+        metabolites = dataset.metabolites[::4]
+        loaded = MetaboTK().io.from_bundle(
+            bundle_path, samples=samples, metabolites=metabolites
+        )
+        assert loaded.is_view
+        assert loaded.samples == samples
+        assert loaded.metabolites == metabolites
+        pd.testing.assert_frame_equal(
+            loaded.data, dataset.data.loc[samples, metabolites]
+        )
+
+    def test_not_a_bundle(self, tmp_path):
+        file_path = tmp_path / "dataset.mtbk"
+        file_path.write_bytes(b"not a bundle at all")
+        with pytest.raises(ValueError):
+            MetaboTK().io.from_bundle(str(file_path))
+
+
+class TestExcel:
+    def test_round_trip(self, dataset, tmp_path):
+        file_path = str(tmp_path / "dataset.xlsx")
+        dataset.io.save_excel(file_path, data_sheet="Batch-normalized Data")
+        loaded = MetaboTK().io.from_excel(
+            file_path,
+            data_sheet="Batch-normalized Data",
+            sample_id_column="PARENT_SAMPLE_NAME",
+        )
+        pd.testing.assert_frame_equal(loaded.data, dataset.data, check_dtype=False)
+        pd.testing.assert_frame_equal(
+            loaded.chemical_annotation, dataset.chemical_annotation, check_dtype=False
+        )
+
+    def test_missing_values_are_empty(self, tmp_path):
+        file_path = str(tmp_path / "sheet.xlsx")
+        frame = pd.DataFrame({"a": [1.0, np.nan], "b": ["x", None]})
+        frame.index.name = "id"
+        write_excel(file_path, {"Sheet": frame})
+        loaded = pd.read_excel(file_path, index_col=0)
+        pd.testing.assert_frame_equal(loaded, frame, check_dtype=False)
+
+    @pytest.mark.parametrize("max_workers", [1, 2])
+    def test_save_excel_files(self, dataset, tmp_path, max_workers):
+        halves = {
+            str(tmp_path / "first.xlsx"): dataset.ops.subset(
+                what="samples", ids=dataset.samples[:20]
+            ),
+            str(tmp_path / "second.xlsx"): dataset.ops.subset(
+                what="samples", ids=dataset.samples[20:]
+            ),
+        }
+        save_excel_files(halves, max_workers=max_workers)
+        for file_path, half in halves.items():
+            data = pd.read_excel(file_path, sheet_name="Data", index_col=0)
+            assert list(data.index) == half.samples
+
+
+class TestDatabase:
+    @pytest.fixture(autouse=True)
+    def duckdb(self):
+        pytest.importorskip("duckdb")
+
+    @pytest.mark.parametrize("layout", ["long", "wide"])
+    def test_round_trip(self, dataset, tmp_path, layout):
+        file_path = str(tmp_path / "dataset.duckdb")
+        dataset.io.save_database(file_path, layout=layout)
+        loaded = MetaboTK().io.from_database(file_path)
+        assert loaded.samples == dataset.samples
+        assert loaded.metabolites == dataset.metabolites
+        pd.testing.assert_frame_equal(
+            loaded.data, dataset.data, check_dtype=False, check_names=False
+        )
+
+    @pytest.mark.parametrize("layout", ["long", "wide"])
+    def test_sql_selection(self, dataset, tmp_path, layout):
+        file_path = str(tmp_path / "dataset.duckdb")
+        dataset.io.save_database(file_path, layout=layout)
+        loaded = MetaboTK().io.from_database(
+            file_path,
+            samples="SELECT PARENT_SAMPLE_NAME FROM samples WHERE sex = 'F'",
+            metabolites="SELECT CHEM_ID FROM metabolites WHERE SUPER_PATHWAY = 'Lipid'",
+        )
+        samples = dataset.sample_metadata.index[dataset.sample_metadata["sex"] == "F"]
+        metabolites = dataset.chemical_annotation.index[
+            dataset.chemical_annotation["SUPER_PATHWAY"] == "Lipid"
+        ]
+        assert loaded.samples == list(samples)
+        assert loaded.metabolites == list(metabolites)
+        pd.testing.assert_frame_equal(
+            loaded.data,
+            dataset.data.loc[samples, metabolites],
+            check_dtype=False,
+            check_names=False,
+        )
+
+    def test_abundance_selection(self, dataset, tmp_path):
+        file_path = str(tmp_path / "dataset.duckdb")
+        dataset.io.save_database(file_path)
+        metabolite = dataset.metabolites[0]
+        threshold = dataset.data[metabolite].median()
+        loaded = MetaboTK().io.from_database(
+            file_path,
+            samples=(
+                "SELECT PARENT_SAMPLE_NAME FROM data "
+                f"WHERE CHEM_ID = '{metabolite}' AND value > {threshold}"
+            ),
+        )
+        expected = dataset.data.index[dataset.data[metabolite] > threshold]
+        assert loaded.samples == list(expected)
+
+    @pytest.mark.parametrize("layout", ["long", "wide"])
+    def test_sample_without_data(self, dataset, tmp_path, layout):
+        import duckdb
+
+        file_path = str(tmp_path / "dataset.duckdb")
+        dataset.io.save_database(file_path, layout=layout)
+        sample = dataset.samples[-1]
+        with duckdb.connect(file_path) as connection:
+            connection.execute(
+                "DELETE FROM data WHERE PARENT_SAMPLE_NAME = ?", [sample]
+            )
+        loaded = MetaboTK().io.from_database(file_path)
+        assert loaded.samples == dataset.samples
+        assert loaded.data.loc[sample].isna().all()
+        pd.testing.assert_frame_equal(
+            loaded.data.iloc[:-1],
+            dataset.data.iloc[:-1],
+            check_dtype=False,
+            check_names=False,
+        )
+
+    def test_unknown_layout(self, dataset, tmp_path):
+        with pytest.raises(ValueError):
+            dataset.io.save_database(str(tmp_path / "dataset.duckdb"), layout="tall")
@@ -1,8 +1,11 @@
 from doctest import script_from_examples
+import tracemalloc
 import pytest
 import pandas as pd
+import numpy as np
 from metabotk.metabolomic_dataset import MetabolomicDataset
 from metabotk.dataset_operations import DatasetOperations
+from metabotk import storage
 
 
 @pytest.fixture
@@ -18,6 +21,20 @@ def ops():
     return ops
 
 
+@pytest.fixture
+def array_ops():
+    dataset = MetabolomicDataset._setup(
+        data=pd.read_csv("tests/test_data/data.csv"),
+        sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+        chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+        sample_id_column="PARENT_SAMPLE_NAME",
+        metabolite_id_column="CHEM_ID",
+        storage="array",
+    )
+    ops = DatasetOperations(dataset)
+    return ops
+
+
 class TestOperations:
     def test_subset_samples(self, ops):
         samples = ["INTR-03208 [COPY 2]", "INTR-03200 [COPY 2]"]
@@ -58,6 +75,295 @@ class TestOperations:
         assert list(renamed.sample_metadata.index) == renamed.samples
         assert list(renamed.data.index) == renamed.samples
 
+    def test_replace_sample_names_in_array_data(self, array_ops):
+        original = array_ops.dataset.samples
+        renamed = array_ops.replace_sample_names_in_data(new_index="CLIENT_IDENTIFIER")
+        assert renamed.storage == "array"
+        assert (
+            renamed.samples
+            == array_ops.dataset.sample_metadata["CLIENT_IDENTIFIER"]
+            .astype(str)
+            .tolist()
+        )
+        assert list(renamed.data.index) == renamed.samples
+        assert array_ops.dataset.samples == original
+
     def test_replace_sample_names_in_data_wrong_colname(self, ops):
         with pytest.raises(ValueError):
             ops.replace_sample_names_in_data(new_index="INVALID_NAME")
+
+
+class TestViews:
+    samples = ["INTR-03208 [COPY 2]", "INTR-03200 [COPY 2]"]
+    metabolites = ["50", "100008998"]
+
+    def test_subset_samples_view(self, ops):
+        view = ops.subset(what="samples", ids=self.samples, view=True)
+        assert view.is_view
+        pd.testing.assert_frame_equal(
+            view.data, ops.subset(what="samples", ids=self.samples).data
+        )
+        pd.testing.assert_frame_equal(
+            view.sample_metadata, ops.dataset.sample_metadata.loc[self.samples]
+        )
+        assert view.samples == self.samples
+
+    def test_subset_metabolites_view(self, ops):
+        view = ops.subset(what="metabolites", ids=self.metabolites, view=True)
+        assert view.is_view
+        pd.testing.assert_frame_equal(view.data, ops.dataset.data[self.metabolites])
+        assert view.metabolites == self.metabolites
+
+    def test_contiguous_view_shares_memory(self, array_ops):
+        view = array_ops.subset(
+            what="samples", ids=array_ops.dataset.samples[5:15], view=True
+        )
+        assert np.shares_memory(view.values, array_ops.dataset.values)
+
+    def test_array_view_is_read_only(self, array_ops):
+        view = array_ops.subset(what="samples", ids=self.samples, view=True)
+        data = view.data
+        with pytest.raises(ValueError):
+            data.iloc[0, 0] = 0
+
+    @pytest.mark.parametrize("copy_on_write", [True, False])
+    def test_frame_view_writes_stay_local(self, ops, monkeypatch, copy_on_write):
+        monkeypatch.setattr(storage, "_copy_on_write", lambda: copy_on_write)
+        original = ops.dataset.data.copy()
+        view = ops.subset(what="samples", ids=ops.dataset.samples[0:10], view=True)
+        data = view.data
+        data.iloc[0, 0] = -1.0
+        pd.testing.assert_frame_equal(ops.dataset.data, original)
+
+    @pytest.mark.parametrize("mode", ["frame", "array"])
+    @pytest.mark.parametrize("contiguous", [True, False])
+    def test_materialize_copies_once(self, mode, contiguous):
+        values = np.random.default_rng(0).random((1000, 500))
+        base = storage.make_storage(pd.DataFrame(values), mode)
+        if contiguous:
+            rows, cols = np.arange(100, 900), np.arange(500)
+        else:
+            rows, cols = np.arange(0, 1000, 3)[::-1], np.arange(0, 500, 2)[::-1]
+        view = base.take(rows, cols)
+        tracemalloc.start()
+        materialized = view.materialize()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        selection = values[np.ix_(rows, cols)]
+        assert peak < 1.5 * selection.nbytes
+        result = materialized.to_frame().to_numpy()
+        np.testing.assert_array_equal(result, selection)
+        assert not np.shares_memory(result, base.to_frame().to_numpy())
+
+    def test_view_materialized_on_write(self, ops):
+        original = ops.dataset.data.copy()
+        view = ops.subset(what="samples", ids=ops.dataset.samples[0:10], view=True)
+        view.data = view.data * 2
+        assert not view.is_view
+        pd.testing.assert_frame_equal(ops.dataset.data, original)
+        pd.testing.assert_frame_equal(view.data, original.iloc[0:10] * 2)
+
+    def test_view_of_view(self, ops):
+        view = ops.subset(what="samples", ids=ops.dataset.samples[0:10], view=True)
+        nested = DatasetOperations(view).drop(
+            what="metabolites", ids=self.metabolites, view=True
+        )
+        expected = ops.dataset.data.iloc[0:10].drop(columns=self.metabolites)
+        pd.testing.assert_frame_equal(nested.data, expected[nested.metabolites])
+
+    def test_view_missing_ids(self, ops):
+        with pytest.raises(KeyError):
+            ops.subset(what="samples", ids=["INVALID"], view=True)
+
+
+class TestCategoricalMetadata:
+    @pytest.fixture
+    def ops(self):
+        dataset = MetabolomicDataset._setup(
+            data=pd.read_csv("tests/test_data/data.csv"),
+            sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+            chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+            sample_id_column="PARENT_SAMPLE_NAME",
+            metabolite_id_column="CHEM_ID",
+            categorical=True,
+        )
+        return DatasetOperations(dataset)
+
+    def test_split_on_categorical(self, ops):
+        assert isinstance(
+            ops.dataset.chemical_annotation["SUPER_PATHWAY"].dtype,
+            pd.CategoricalDtype,
+        )
+        split = ops.split(by="metabolites", columns=["SUPER_PATHWAY"])
+        pathways = ops.dataset.chemical_annotation["SUPER_PATHWAY"]
+        assert len(split) == pathways.nunique()
+        for (name,), dataset in split.items():
+            assert dataset.metabolites == list(pathways.index[pathways == name])
+
+    def test_categorical_report(self, ops):
+        report = ops.dataset.categorical_report
+        assert "SUPER_PATHWAY" in report["chemical_annotation"]
+        assert "batch" in report["sample_metadata"]
+
+    def test_strings_by_default(self):
+        dataset = MetabolomicDataset._setup(
+            data=pd.read_csv("tests/test_data/data.csv"),
+            sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+            chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+            sample_id_column="PARENT_SAMPLE_NAME",
+            metabolite_id_column="CHEM_ID",
+        )
+        assert not isinstance(dataset.sample_metadata["sex"].dtype, pd.CategoricalDtype)
+        assert dataset.categorical_report == {
+            "sample_metadata": {},
+            "chemical_annotation": {},
+        }
+
+
+class TestDrop:
+    def test_drop_keeps_order(self, ops):
+        to_drop = [ops.dataset.samples[3], ops.dataset.samples[0], "not a sample"]
+        dropped = ops.drop(what="samples", ids=to_drop)
+        assert dropped.samples == [i for i in ops.dataset.samples if i not in to_drop]
+        to_drop = ops.dataset.metabolites[10:20]
+        dropped = ops.drop(what="metabolites", ids=to_drop)
+        assert dropped.metabolites == (
+            ops.dataset.metabolites[:10] + ops.dataset.metabolites[20:]
+        )
+        pd.testing.assert_frame_equal(
+            dropped.data, ops.dataset.data.drop(columns=to_drop)
+        )
+
+
+class TestSplit:
+    def test_split_matches_groupby(self, ops):
+        split = ops.split(by="samples", columns=["GROUP", "sex"])
+        groups = ops.dataset.sample_metadata.groupby(["GROUP", "sex"], observed=True)
+        assert list(split) == [name for name, _ in groups]
+        for name, group in groups:
+            assert split[name].samples == list(group.index)
+            pd.testing.assert_frame_equal(
+                split[name].data, ops.dataset.data.loc[group.index]
+            )
+
+    def test_split_metabolites_view(self, array_ops):
+        split = array_ops.split(by="metabolites", columns="SUPER_PATHWAY", view=True)
+        pathways = array_ops.dataset.chemical_annotation["SUPER_PATHWAY"]
+        assert sum(len(dataset.metabolites) for dataset in split.values()) == len(
+            pathways.dropna()
+        )
+        for name, dataset in split.items():
+            assert dataset.is_view
+            assert dataset.metabolites == list(pathways.index[pathways == name])
+
+    def test_drop_mask(self, ops):
+        pathways = ops.dataset.chemical_annotation["SUPER_PATHWAY"]
+        expected = [
+            i for i, p in zip(ops.dataset.metabolites, pathways) if p != "Lipid"
+        ]
+        dropped = ops.drop(what="metabolites", ids=(pathways == "Lipid").to_numpy())
+        assert dropped.metabolites == expected
+        dropped = ops.drop(what="metabolites", ids=pathways == "Lipid")
+        assert dropped.metabolites == expected
+        with pytest.raises(ValueError):
+            ops.drop(what="metabolites", ids=np.ones(3, dtype=bool))
+
+    def test_drop_bool_list(self, ops):
+        mask = [i % 2 == 0 for i in range(len(ops.dataset.samples))]
+        dropped = ops.drop(what="samples", ids=mask)
+        assert dropped.samples == ops.dataset.samples[1::2]
+        with pytest.raises(ValueError):
+            ops.drop(what="samples", ids=[True, False])
+
+    def test_drop_nullable_mask(self, ops):
+        metabolites = ops.dataset.metabolites
+        mask = pd.Series(pd.NA, index=metabolites, dtype="boolean")
+        mask.iloc[:5] = True
+        mask.iloc[5:10] = False
+        dropped = ops.drop(what="metabolites", ids=mask)
+        assert dropped.metabolites == metabolites[5:]
+
+    def test_drop_reordered_mask(self, ops):
+        samples = ops.dataset.samples
+        mask = pd.Series(False, index=samples[::-1])
+        mask[samples[0]] = True
+        dropped = ops.drop(what="samples", ids=mask)
+        assert dropped.samples == samples[1:]
+
+    def test_drop_predicate(self, ops):
+        dropped = ops.drop(what="samples", ids=lambda metadata: metadata["sex"] == "F")
+        metadata = ops.dataset.sample_metadata
+        assert dropped.samples == list(metadata.index[metadata["sex"] != "F"])
+        pd.testing.assert_frame_equal(
+            dropped.data, ops.dataset.data.loc[metadata["sex"] != "F"]
+        )
+
+
+class TestConcat:
+    def test_concat_batches(self, ops):
+        samples = ops.dataset.samples
+        batches = [
+            ops.subset(what="samples", ids=samples[start : start + 10])
+            for start in range(0, len(samples), 10)
+        ]
+        concatenated = DatasetOperations(batches[0]).concat(batches[1:])
+        assert concatenated.samples == samples
+        pd.testing.assert_frame_equal(concatenated.data, ops.dataset.data)
+        pd.testing.assert_frame_equal(
+            concatenated.chemical_annotation, ops.dataset.chemical_annotation
+        )
+
+    def test_concat_alignment(self, ops):
+        samples, metabolites = ops.dataset.samples, ops.dataset.metabolites
+        first = ops.subset(what="samples", ids=samples[:20])
+        first = DatasetOperations(first).subset(
+            what="metabolites", ids=metabolites[:50]
+        )
+        second = ops.subset(what="samples", ids=samples[20:])
+        second = DatasetOperations(second).subset(
+            what="metabolites", ids=metabolites[10:]
+        )
+        outer = DatasetOperations(first).concat(second)
+        assert outer.metabolites == metabolites
+        assert outer.data.loc[samples[:20], metabolites[50:]].isna().all().all()
+        pd.testing.assert_frame_equal(
+            outer.data.loc[samples[20:], metabolites[10:]],
+            ops.dataset.data.loc[samples[20:], metabolites[10:]],
+        )
+        inner = DatasetOperations(first).concat(second, join="inner")
+        assert inner.metabolites == metabolites[10:50]
+        pd.testing.assert_frame_equal(
+            inner.data, ops.dataset.data[metabolites[10:50]], check_names=False
+        )
+
+    def test_merge_platforms(self, ops):
+        metabolites = ops.dataset.metabolites
+        first = ops.subset(what="metabolites", ids=metabolites[:40])
+        second = ops.subset(what="metabolites", ids=metabolites[40:])
+        merged = DatasetOperations(first).merge(second)
+        assert merged.metabolites == metabolites
+        pd.testing.assert_frame_equal(merged.data, ops.dataset.data)
+        pd.testing.assert_frame_equal(
+            merged.sample_metadata, ops.dataset.sample_metadata
+        )
+
+    def test_conflicting_annotation(self, ops):
+        samples = ops.dataset.samples
+        first = ops.subset(what="samples", ids=samples[:20])
+        second = ops.subset(what="samples", ids=samples[20:])
+        annotation = second.chemical_annotation.copy()
+        annotation["SUPER_PATHWAY"] = "Other"
+        second.chemical_annotation = annotation
+        with pytest.raises(ValueError):
+            DatasetOperations(first).concat(second, conflicts="raise")
+        concatenated = DatasetOperations(first).concat(second)
+        pd.testing.assert_series_equal(
+            concatenated.chemical_annotation["SUPER_PATHWAY"],
+            first.chemical_annotation["SUPER_PATHWAY"],
+            check_dtype=False,
+            check_categorical=False,
+        )
+
+    def test_duplicate_samples(self, ops):
+        with pytest.raises(ValueError):
+            ops.concat(ops.dataset)
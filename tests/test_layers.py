@@ -0,0 +1,96 @@
+import pytest
+from metabotk.metabolomic_dataset import MetabolomicDataset
+from metabotk.dataset_operations import DatasetOperations
+import pandas as pd
+import numpy as np
+
+
+@pytest.fixture(params=["frame", "array"])
+def dataset(request):
+    dataset = MetabolomicDataset._setup(
+        data=pd.read_csv("tests/test_data/data.csv"),
+        sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+        chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+        sample_id_column="PARENT_SAMPLE_NAME",
+        metabolite_id_column="CHEM_ID",
+        storage=request.param,
+    )
+    return dataset
+
+
+class TestLayers:
+    def test_frame_layer_is_aligned(self, dataset):
+        shuffled = dataset.data.iloc[::-1, ::-1] * 2
+        dataset.layers["double"] = shuffled
+        layer = dataset.layers["double"]
+        pd.testing.assert_index_equal(layer.index, dataset.data.index)
+        pd.testing.assert_index_equal(layer.columns, dataset.data.columns)
+        pd.testing.assert_frame_equal(layer, dataset.data * 2)
+
+    def test_missing_ids_raise(self, dataset):
+        with pytest.raises(KeyError):
+            dataset.layers["partial"] = dataset.data.iloc[1:]
+
+    def test_lazy_layer(self, dataset):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return dataset.data + 1
+
+        dataset.layers["plus_one"] = load
+        assert "plus_one" in dataset.layers
+        assert not dataset.layers.is_loaded("plus_one")
+        assert calls == []
+        pd.testing.assert_frame_equal(dataset.layers["plus_one"], dataset.data + 1)
+        dataset.layers["plus_one"]
+        assert calls == [1]
+        dataset.layers.unload("plus_one")
+        assert not dataset.layers.is_loaded("plus_one")
+        dataset.layers["plus_one"]
+        assert calls == [1, 1]
+
+    def test_unload_eager_layer_raises(self, dataset):
+        dataset.layers["raw"] = dataset.data
+        with pytest.raises(ValueError):
+            dataset.layers.unload("raw")
+
+    def test_path_layer(self, dataset, tmp_path):
+        path = tmp_path / "layer.csv"
+        dataset.data.reset_index().to_csv(path, index=False)
+        dataset.layers["from_file"] = str(path)
+        pd.testing.assert_frame_equal(
+            dataset.layers["from_file"], dataset.data, check_dtype=False
+        )
+
+    def test_delete(self, dataset):
+        dataset.layers["raw"] = dataset.data
+        del dataset.layers["raw"]
+        assert "raw" not in dataset.layers
+        assert len(dataset.layers) == 0
+        with pytest.raises(KeyError):
+            dataset.layers["raw"]
+
+    def test_with_layer(self, dataset):
+        dataset.layers["log"] = np.log(dataset.data)
+        log_dataset = dataset.with_layer("log")
+        pd.testing.assert_frame_equal(log_dataset.data, np.log(dataset.data))
+        assert log_dataset.sample_metadata is dataset.sample_metadata
+        assert log_dataset.chemical_annotation is dataset.chemical_annotation
+        assert log_dataset.layers is dataset.layers
+
+    @pytest.mark.parametrize("view", [False, True])
+    def test_layers_follow_subsets(self, dataset, view):
+        dataset.layers["double"] = dataset.data * 2
+        dataset.layers["lazy"] = lambda: dataset.data * 3
+        samples = list(dataset.samples[::3])
+        metabolites = list(dataset.metabolites[:10])
+        subset = DatasetOperations(dataset).subset(
+            what="samples", ids=samples, view=view
+        )
+        subset = DatasetOperations(subset).subset(
+            what="metabolites", ids=metabolites, view=view
+        )
+        pd.testing.assert_frame_equal(subset.layers["double"], subset.data * 2)
+        assert not subset.layers.is_loaded("lazy")
+        pd.testing.assert_frame_equal(subset.layers["lazy"], subset.data * 3)
@@ -23,6 +23,11 @@ class TestMetabolomicDataset:
         pd.testing.assert_index_equal(dataset.sample_metadata.index, dataset.data.index)
         assert list(dataset.data.columns) == list(dataset.chemical_annotation.index)
 
+    def test_setup_alignment_report(self, dataset):
+        report = dataset.alignment_report
+        assert report["samples_only_in_data"] == []
+        assert len(report["metabolites_only_in_data"]) == 0
+
     def test_data_setter(self, dataset):
         new_data = pd.DataFrame(
             np.nan, index=dataset.data.index, columns=dataset.data.columns
@@ -65,3 +70,127 @@ class TestMetabolomicDataset:
         new_metabolites = [np.nan for i in dataset.metabolites[0:10]]
         with pytest.raises(ValueError):
             dataset.metabolites = new_metabolites
+
+    def test_id_indexes(self, dataset):
+        assert dataset.samples is dataset.samples
+        assert dataset.metabolites is dataset.metabolites
+        pd.testing.assert_index_equal(
+            dataset.metabolite_index, dataset.chemical_annotation.index
+        )
+        ids = [dataset.metabolites[5], dataset.metabolites[2]]
+        assert list(dataset.metabolite_positions(ids)) == [5, 2]
+        assert list(dataset.sample_positions(dataset.samples[3:5])) == [3, 4]
+        with pytest.raises(KeyError):
+            dataset.sample_positions(["not a sample"])
+
+    def test_id_indexes_follow_setters(self, dataset):
+        new_chemical_annotation = dataset.chemical_annotation.copy()
+        new_chemical_annotation.index = [
+            f"m{i}" for i in range(len(dataset.metabolites))
+        ]
+        new_chemical_annotation.index.name = dataset.chemical_annotation.index.name
+        dataset.chemical_annotation = new_chemical_annotation
+        assert dataset.metabolites[0] == "m0"
+        assert list(dataset.metabolite_positions(["m3"])) == [3]
+
+
+@pytest.fixture
+def array_dataset():
+    dataset = MetabolomicDataset._setup(
+        data=pd.read_csv("tests/test_data/data.csv"),
+        sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+        chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+        sample_id_column="PARENT_SAMPLE_NAME",
+        metabolite_id_column="CHEM_ID",
+        storage="array",
+    )
+    return dataset
+
+
+class TestArrayStorage:
+    def test_same_content_as_frame(self, dataset, array_dataset):
+        assert array_dataset.storage == "array"
+        pd.testing.assert_frame_equal(array_dataset.data, dataset.data)
+
+    def test_values_contiguous_block(self, array_dataset):
+        values = array_dataset.values
+        assert values.flags["C_CONTIGUOUS"]
+        assert values.dtype == np.float64
+        assert values.shape == (
+            len(array_dataset.samples),
+            len(array_dataset.metabolites),
+        )
+
+    def test_data_is_view(self, array_dataset):
+        assert np.shares_memory(array_dataset.data.to_numpy(), array_dataset.values)
+
+    def test_data_setter_keeps_mode(self, array_dataset):
+        new_data = array_dataset.data * 2
+        array_dataset.data = new_data
+        assert array_dataset.storage == "array"
+        np.testing.assert_array_equal(array_dataset.values, new_data.to_numpy())
+
+    def test_invalid_storage(self):
+        with pytest.raises(ValueError):
+            MetabolomicDataset(
+                data=pd.DataFrame(),
+                sample_metadata=pd.DataFrame(),
+                chemical_annotation=pd.DataFrame(),
+                sample_id_column="sample",
+                metabolite_id_column="CHEM_ID",
+                storage="invalid",
+            )
+
+
+@pytest.fixture(params=["frame", "array"])
+def float32_dataset(request):
+    dataset = MetabolomicDataset._setup(
+        data=pd.read_csv("tests/test_data/data.csv"),
+        sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+        chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+        sample_id_column="PARENT_SAMPLE_NAME",
+        metabolite_id_column="CHEM_ID",
+        storage=request.param,
+        dtype="float32",
+    )
+    return dataset
+
+
+class TestFloat32:
+    def test_dtype(self, float32_dataset):
+        assert float32_dataset.dtype == np.float32
+        assert float32_dataset.values.dtype == np.float32
+        assert (float32_dataset.data.dtypes == np.float32).all()
+
+    def test_precision_report(self, dataset, float32_dataset):
+        assert dataset.precision_report is None
+        report = float32_dataset.precision_report
+        assert report["dtype"] == "float32"
+        assert 0 < report["max_rel_error"] < 1e-6
+        assert report["n_overflow"] == 0
+        assert report["n_underflow"] == 0
+
+    @pytest.mark.filterwarnings("ignore:overflow encountered:RuntimeWarning")
+    def test_overflow_warning(self):
+        data = pd.read_csv("tests/test_data/data.csv")
+        data.iloc[0, 5] = 1e300
+        with pytest.warns(UserWarning, match="infinity"):
+            dataset = MetabolomicDataset._setup(
+                data=data,
+                sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+                chemical_annotation=pd.read_csv(
+                    "tests/test_data/chemical_annotation.csv"
+                ),
+                sample_id_column="PARENT_SAMPLE_NAME",
+                metabolite_id_column="CHEM_ID",
+                dtype="float32",
+            )
+        assert dataset.precision_report["n_overflow"] == 1
+
+    def test_dtype_is_kept(self, float32_dataset):
+        float32_dataset.data = float32_dataset.data.astype(np.float64) * 2
+        assert float32_dataset.values.dtype == np.float32
+        subset = float32_dataset._take(rows=np.arange(5))
+        assert subset.values.dtype == np.float32
+        float32_dataset.layers["raw"] = float32_dataset.data.astype(np.float64)
+        assert (float32_dataset.layers["raw"].dtypes == np.float32).all()
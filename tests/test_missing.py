@@ -127,3 +127,15 @@ class TestDropOverThreshold2:
     def test_drop_rows_with_missing_over_threshold_1(self):
         remaining = missing.drop_missing_from_dataframe(self.data, axis=1, threshold=1)
         assert self.data.equals(remaining)
+
+
+class TestCountMissingInChunks:
+    @pytest.mark.parametrize("axis", [0, 1])
+    def test_matches_whole_data(self, axis):
+        data = test_data.copy()
+        data.iloc[::3, 1] = np.nan
+        chunks = [data.iloc[start : start + 4] for start in range(0, len(data), 4)]
+        pd.testing.assert_series_equal(
+            missing.count_missing_in_chunks(chunks, axis),
+            missing.count_missing_in_dataframe(data, axis),
+        )
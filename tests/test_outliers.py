@@ -80,6 +80,18 @@ class TestGetOutliersMatrix:
             self.outliers_df
         )
 
+    @pytest.mark.parametrize("axis", [0, 1])
+    def test_array_matches_single_column_detection(self, axis):
+        values = test_data.to_numpy()
+        expected = np.array(
+            [
+                outliers.detect_outliers(i, threshold=1.5)
+                for i in np.moveaxis(values, 1 - axis, 0)
+            ]
+        )
+        result = outliers.detect_outliers_in_array(values, threshold=1.5, axis=axis)
+        assert np.array_equal(np.moveaxis(result, 1 - axis, 0), expected)
+
 
 # count_outliers
 
@@ -143,3 +155,12 @@ class TestRemoveOutliers:
         assert outliers.remove_outliers(self.data, threshold=5).equals(
             data_without_outliers
         )
+
+
+class TestIterOutliersMatrices:
+    def test_matches_whole_data(self):
+        chunks = [test_data.iloc[:4], test_data.iloc[4:]]
+        matrices = list(outliers.iter_outliers_matrices(chunks, threshold=1))
+        pd.testing.assert_frame_equal(
+            pd.concat(matrices), outliers.get_outliers_matrix(test_data, 1, axis=1)
+        )
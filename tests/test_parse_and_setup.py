@@ -8,6 +8,9 @@ from metabotk.parse_and_setup import (
     setup_data,
     setup_sample_metadata,
     setup_chemical_annotation,
+    coerce_ids,
+    align_tables,
+    encode_categoricals,
 )
 import numpy as np
 
@@ -37,6 +40,17 @@ def test_read_excel(helper):
     helper.test_parsed_dict(parsed)
 
 
+def test_read_excel_sequential(helper):
+    file_path = "tests/test_data/cdt_demo.xlsx"
+    parsed = read_excel(file_path, data_sheet="Batch-normalized Data", max_workers=1)
+    helper.test_parsed_dict(parsed)
+
+
+def test_read_excel_missing_sheet():
+    with pytest.raises(ValueError, match="not found"):
+        read_excel("tests/test_data/cdt_demo.xlsx", data_sheet="Imputed Data")
+
+
 def test_read_tables(helper):
     data_path = "tests/test_data/data.csv"
     sample_metadata_path = "tests/test_data/sample_metadata.csv"
@@ -144,3 +158,71 @@ class TestSetupChemicalAnnotation:
         data = pd.read_csv("tests/test_data/chemical_annotation.csv")
         with pytest.warns():
             setup_chemical_annotation(data, "SUPER_PATHWAY")
+
+
+class TestAlignTables:
+    def test_coerce_ids(self):
+        ids = coerce_ids(pd.Index([50, 100008998], name="CHEM_ID"))
+        assert list(ids) == ["50", "100008998"]
+        assert ids.name == "CHEM_ID"
+        string_ids = pd.Index(["a", "b"])
+        assert coerce_ids(string_ids) is string_ids
+
+    def test_align_tables_report(self):
+        data = pd.DataFrame(
+            np.ones((3, 3)), index=["s1", "s2", "s3"], columns=["1", "2", "3"]
+        )
+        sample_metadata = pd.DataFrame({"x": [1, 2, 3]}, index=["s4", "s2", "s1"])
+        chemical_annotation = pd.DataFrame({"y": [1, 2]}, index=[3, 1])
+        with pytest.warns(UserWarning):
+            aligned = align_tables(data, sample_metadata, chemical_annotation)
+        assert list(aligned["data"].index) == ["s1", "s2"]
+        assert list(aligned["data"].columns) == ["1", "3"]
+        assert list(aligned["sample_metadata"].index) == ["s1", "s2"]
+        assert list(aligned["chemical_annotation"].index) == ["1", "3"]
+        assert aligned["alignment_report"] == {
+            "samples_only_in_data": ["s3"],
+            "samples_only_in_sample_metadata": ["s4"],
+            "metabolites_only_in_data": ["2"],
+            "metabolites_only_in_chemical_annotation": [],
+        }
+
+
+class TestCategoricals:
+    def test_encode_categoricals(self):
+        chemical_annotation = pd.read_csv("tests/test_data/chemical_annotation.csv")
+        memory_saved = encode_categoricals(chemical_annotation)
+        assert set(memory_saved) == {"SUPER_PATHWAY", "SUB_PATHWAY", "PLATFORM"}
+        assert all(saved > 0 for saved in memory_saved.values())
+        assert isinstance(
+            chemical_annotation["SUPER_PATHWAY"].dtype, pd.CategoricalDtype
+        )
+        assert chemical_annotation["ANN0"].dtype == np.float64
+
+    def test_high_cardinality_is_kept(self):
+        sample_metadata = pd.read_csv("tests/test_data/sample_metadata.csv")
+        encode_categoricals(sample_metadata)
+        assert not isinstance(
+            sample_metadata["CLIENT_IDENTIFIER"].dtype, pd.CategoricalDtype
+        )
+        assert isinstance(sample_metadata["batch"].dtype, pd.CategoricalDtype)
+
+    def test_setup_report(self):
+        reports = []
+        sample_metadata = setup_sample_metadata(
+            pd.read_csv("tests/test_data/sample_metadata.csv"),
+            "PARENT_SAMPLE_NAME",
+            categorical=True,
+            report=reports.append,
+        )
+        assert sample_metadata.index.name == "PARENT_SAMPLE_NAME"
+        assert "batch" in reports[0]
+
+    def test_setup_without_categoricals(self):
+        chemical_annotation = setup_chemical_annotation(
+            pd.read_csv("tests/test_data/chemical_annotation.csv"),
+            "CHEM_ID",
+        )
+        assert not isinstance(
+            chemical_annotation["SUPER_PATHWAY"].dtype, pd.CategoricalDtype
+        )
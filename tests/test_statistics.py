@@ -6,6 +6,8 @@ from src.metabotk.statistics_handler import (
     coefficient_of_variation,
     compute_statistics,
     compute_dataframe_statistics,
+    StatisticsAccumulator,
+    accumulate_statistics,
 )
 from metabotk.metabolomic_dataset import MetabolomicDataset
 from tests.testing_functions import (
@@ -356,3 +358,53 @@ class TestTopCorrelations:
             "273",
             "254",
         ]
+
+
+class TestFloat32Statistics:
+    def load(self, dtype):
+        return MetabolomicDataset._setup(
+            data=pd.read_csv("tests/test_data/data.csv"),
+            sample_metadata=pd.read_csv("tests/test_data/sample_metadata.csv"),
+            chemical_annotation=pd.read_csv("tests/test_data/chemical_annotation.csv"),
+            sample_id_column="PARENT_SAMPLE_NAME",
+            metabolite_id_column="CHEM_ID",
+            dtype=dtype,
+        )
+
+    def test_statistics_match_float64(self):
+        stats64 = Statistics(self.load("float64"))
+        stats32 = Statistics(self.load("float32"))
+        pd.testing.assert_frame_equal(
+            stats32.metabolite_stats(), stats64.metabolite_stats(), rtol=1e-5
+        )
+        pd.testing.assert_frame_equal(
+            stats32.sample_stats(), stats64.sample_stats(), rtol=1e-5
+        )
+
+    def test_remove_outliers_keeps_dtype(self):
+        stats32 = Statistics(self.load("float32"))
+        removed = stats32.remove_outliers(threshold=1.5)
+        assert (removed.dtypes == np.float32).all()
+        assert removed.isna().sum().sum() > stats32.dataset.data.isna().sum().sum()
+
+
+class TestStatisticsAccumulator:
+    def test_matches_whole_data(self):
+        data = pd.read_csv("tests/test_data/data.csv").set_index("PARENT_SAMPLE_NAME")
+        data.iloc[:10, 0] = np.nan
+        data.iloc[:, 1] = np.nan
+        chunks = [data.iloc[start : start + 7] for start in range(0, len(data), 7)]
+        stats = accumulate_statistics(chunks)
+        expected = compute_dataframe_statistics(data, outlier_threshold=5, axis=0)
+        pd.testing.assert_frame_equal(stats, expected[stats.columns])
+
+    def test_different_metabolites(self):
+        data = pd.DataFrame({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+        accumulator = StatisticsAccumulator()
+        accumulator.update(data)
+        with pytest.raises(ValueError):
+            accumulator.update(data[["b", "a"]])
+
+    def test_no_chunks(self):
+        with pytest.raises(ValueError):
+            accumulate_statistics([])
@@ -1,3 +1,4 @@
+import sys
 import pandas as pd
 import pytest
 import numpy as np
@@ -129,3 +130,55 @@ class TestParseInput:
         metabolites = "tests/test_data/test.metabolites"
         for i in [data, samples, metabolites]:
             assert isinstance(parse_input(i), pd.DataFrame)
+
+    def test_parse_input_float_columns(self):
+        data = parse_input("tests/test_data/data.csv", id_column="PARENT_SAMPLE_NAME")
+        expected = pd.read_csv("tests/test_data/data.csv")
+        assert (data.drop(columns="PARENT_SAMPLE_NAME").dtypes == np.float64).all()
+        pd.testing.assert_frame_equal(data, expected, check_dtype=False)
+
+    def test_parse_input_compressed(self, tmp_path):
+        expected = pd.read_csv("tests/test_data/data.csv")
+        path = str(tmp_path / "test.data.gz")
+        expected.to_csv(path, sep="\t", index=False)
+        data = parse_input(path, id_column="PARENT_SAMPLE_NAME")
+        pd.testing.assert_frame_equal(data, expected, check_dtype=False)
+
+    def test_parse_input_usecols(self):
+        expected = pd.read_csv("tests/test_data/data.csv")
+        usecols = list(expected.columns[[5, 2]])
+        data = parse_input(
+            "tests/test_data/data.csv", id_column="PARENT_SAMPLE_NAME", usecols=usecols
+        )
+        assert list(data.columns) == [
+            "PARENT_SAMPLE_NAME",
+            *expected.columns[[2, 5]],
+        ]
+
+    def test_parse_input_missing_id_column(self):
+        with pytest.raises(ValueError):
+            parse_input("tests/test_data/data.csv", id_column="missing")
+
+    def test_parse_input_non_numeric_falls_back(self, tmp_path):
+        path = str(tmp_path / "test.tsv")
+        pd.DataFrame({"sample": ["a", "b"], "x": ["1", "n.d."]}).to_csv(
+            path, sep="\t", index=False
+        )
+        with pytest.warns(UserWarning):
+            data = parse_input(path, id_column="sample")
+        assert list(data["x"]) == ["1", "n.d."]
+
+    def test_parse_input_zstd_requires_zstandard(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(sys.modules, "zstandard", None)
+        path = tmp_path / "test.data.zst"
+        path.write_bytes(b"")
+        with pytest.raises(ImportError, match="zstandard"):
+            parse_input(str(path), id_column="PARENT_SAMPLE_NAME")
+
+    def test_parse_input_str_columns(self, tmp_path):
+        path = str(tmp_path / "test.tsv")
+        with open(path, "w") as handle:
+            handle.write("sample\tage\n007\t40\n010\t35\n")
+        metadata = parse_input(path, str_columns=["sample", "missing"])
+        assert list(metadata["sample"]) == ["007", "010"]
+        assert metadata["age"].dtype == np.int64